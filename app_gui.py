@@ -1,21 +1,24 @@
 #------------------------------------------------------------
-# Libraries importation
+# Libraries importation. TensorFlow, keras and
+# segmentation_models are not imported here: they are imported by
+# honeyseg.backends in the background thread that loads the model,
+# once the window is shown.
 #------------------------------------------------------------
+import time # to measure the startup time and estimate the remaining time of the segmentation process
+launch_time = time.perf_counter() # start of the application, to measure the startup time
 import tkinter as tk # GUI library imported
 import tkinter.filedialog # to create open files windows and folders
 import tkinter.ttk # for the processing progress bar
 import os # to manage actions of the operating system
-import keras # to use keras api
-import tensorflow as tf # to use tensorflow image functions
-from keras.models import Model, load_model # to load pre-trained models
-import segmentation_models as sm # Segmentation Models: using `keras` framework.
-from keras import backend as K
 import cv2 # opencv library to process images
 import PIL.Image, PIL.ImageTk # to manage images inside the interface
 import numpy as np # to make calculations
 import math # to make calculations
 from pathlib import Path # to manage system paths (windows, linux, etc)
-import shutil # to delete no empty folders
+import queue # to send the progress of the segmentation to the interface
+import threading # to run the segmentation process in background
+from honeyseg import backends, default_backend, default_threshold, default_prefilter, default_coarse_scale, artifact_path, is_remote, ImageBuffer, Instrumentation, MaskCache, ModelManager, SegmentationCancelled, convert_channel_order, segment_tiles, segment_coarse_to_fine, count_honey_pixels, highlight_honey, preview_overlay, honey_area, WorkerPool, autotune_workers, ModelRegistry # segmentation core
+from honeyseg.server import server_env, default_server_url # address of the HoneySeg server of the remote backend
 
 #------------------------------------------------------------
 # App information
@@ -34,6 +37,9 @@ authors_text = "Francisco J. Rodriguez-Lozano - Dpto. Ingeniería Electrónica y
                 José M. Flores - Dpto. de Zoología, Universidad de Córdoba (Spain)\n \
                 Manuel Ortiz-Lopez - Dpto. Ingeniería Electrónica y de Computadores, Universidad de Córdoba (Spain)\n"
 
+# name of the default segmentation model in the registry of models
+default_model_name = "EfficientNetB2-FPN"
+
 # app license 
 license_text = "MIT License\n\n \
                 Copyright (c) 2025 PhD. Francisco J. Rodriguez Lozano\n\n \
@@ -53,74 +59,6 @@ license_text = "MIT License\n\n \
                 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE\n \
                 SOFTWARE."
 
-#------------------------------------------------------------
-# Auxiliary function to split/merge the images. This function 
-# find the pints where is necesary to split or merge the img
-#
-# Params:
-#        size: original size
-#        split_size: desired size
-#        overlap: pertentage of overlaping between tiles points. 
-#                 Specified in range 0-1.
-# Return:
-#        List of points where each tile begins
-#------------------------------------------------------------
-def start_points(size, split_size, overlap=0):
-  points = [0]
-  stride = int(split_size * (1-overlap))
-  counter = 1
-
-  while True:
-    pt = stride * counter
-
-    if pt + split_size >= size:
-      if split_size == size:
-        break
-      points.append(size - split_size)
-      break
-
-    else:
-      points.append(pt)
-    counter += 1
-  return points
-
-#------------------------------------------------------------
-# Auxiliary function to obtain the names of the files of a directory
-# without extension that shares a name.
-#
-# Params:
-#        imagesPath: path to the files in the directory
-#        str_value: shared name between files
-# Return:
-#        list of image names without extension
-#------------------------------------------------------------
-def get_file_names_with_strings(imagesPath, str_value):
-  # let's get the entire list of files
-  full_list = sorted((f for f in os.listdir(imagesPath) if not f.startswith(".")), key=str.lower)
-
-  # filter the files and store only those with the value of str_value in their names
-  final_list = [nm for nm in full_list if str_value in nm]
-
-  return final_list
-
-#------------------------------------------------------------
-# Auxiliary function to read images in tensorflow format
-#
-# Params:
-#        img_path: path of the image
-#        IMG_HEIGHT: height size of the image
-#        IMG_WIDTH: width size of the image
-#        IMG_CHANNELS: channels of the image 
-# Return:
-#        image in tensorflow format
-#------------------------------------------------------------
-def read_image(img_path, IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS):
-  image = tf.io.read_file(img_path)
-  image = tf.image.decode_image(image, channels=IMG_CHANNELS, expand_animations = False)
-  image = tf.image.convert_image_dtype(image, tf.float32)
-  image.set_shape((IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS))
-  return image
-
 #------------------------------------------------------------
 # Auxiliary class to manage opencv mouse events functions
 #------------------------------------------------------------
@@ -131,6 +69,7 @@ class openCVmouseEventStore:
     self.s_y = None # start y coordinate
     self.e_x = None # end x coordinate
     self.e_y = None # end y coordinate
+    self.changed = False # true if the line has changed since it was last drawn
 
   #------------------------------------------------------------
   # Internal class function to draw lines on an image according to
@@ -151,16 +90,19 @@ class openCVmouseEventStore:
       self.drawing=True
       self.s_x, self.s_y = x, y
       self.e_x, self.e_y = x, y
+      self.changed = True
       
     #if the mouse is moving and drawing is true
     elif event==cv2.EVENT_MOUSEMOVE:
       if self.drawing==True:
         self.e_x, self.e_y = x, y
+        self.changed = True
         
     #if the finger has been lifted from the left mouse button
     elif event==cv2.EVENT_LBUTTONUP:
       self.drawing=False
       self.e_x, self.e_y = x, y
+      self.changed = True
 
 
 #------------------------------------------------------------
@@ -172,12 +114,30 @@ class HoneySegmentationToolGUI(tk.Tk):
     super().__init__()
 
     self.honeySegmentationModelPath = Path("defaults/honeyModels/efficientnetb2-FPN.keras") # path to keras segmentation model
+    self.batchSize = None # number of tiles predicted at once. None to choose it from the available memory
+    self.prefilterTiles = tk.BooleanVar(value=False) # skip the tiles with almost no honey coloured pixels (see honeyseg.core.prefilter_tiles)
+    self.coarseToFine = tk.BooleanVar(value=False) # segment the image downscaled first and refine only the tiles with boundaries
+    self.modelRegistry = self.openModelRegistry() # named models with their tile size and threshold, several kept loaded
+    self.selectedModel = tk.StringVar(value=next(iter(self.modelRegistry.entries))) # name of the model used to segment
+    self.remoteModelManager = ModelManager() # keeps the connection to the server of the remote backend
+    self.modelManager = self.remoteModelManager # manager of the selected model, see loadModel
+    self.inferenceBackend = tk.StringVar(value=default_backend) # backend used to run the segmentation model
+    self.areaOnly = tk.BooleanVar(value=False) # only measure the area of honey, without building the mask
+    self.workerProcesses = tk.StringVar(value="1") # processes running the model: "1" in this process, "auto" for a tuned pool
+    self.workerPool = None # pool of processes running the model, see honeyseg.workers
+    self.serverUrl = os.environ.get(server_env, default_server_url) # HoneySeg server used by the remote backend
+    self.instrumentation = Instrumentation.from_environment() # timings of the stages, enabled with HONEYSEG_METRICS/HONEYSEG_PROFILE
+    self.segmentationRecorder = None # timings of the stages of the last segmented image
+    self.maskCache = self.openMaskCache() # masks of the images already segmented, None if the cache can not be used
+    self.startupTime = None # seconds from the launch until the window is shown
 
     self.imgPath = None # path to load image to process
-    self.splittedPath = None # temporal path to split image into tiles and process
 
-    self.opencvImg = None # opencv image to calculate reference in image
-    self.opencvMask = None # opencv image to store the processed mask
+    self.imageBuffer = None # decoded image shared by the reference, segmentation, preview and save
+    self.referenceImage = None # display resolution copy (BGR) of the image used to draw the reference
+    self.referenceDisplaySize = 1600 # maximum width and height of the image shown to draw the reference
+    self.opencvMask = None # single channel opencv image to store the processed mask
+    self.honeyPixelCount = None # pixels with honey of the image segmented in area-only mode, which has no mask
     self.opencvMaskApply = None # opencv image to blend the image and the mask
     
     self.tkimage = None # Image used to display in tkinter label
@@ -197,12 +157,20 @@ class HoneySegmentationToolGUI(tk.Tk):
     self.labelImgagePreview = None # preview default/loaded image
     self.lavelSegmentedImage = None # preview calculated segmentation image   
     self.varLabelInformationText = tk.StringVar() # to show information of the image
+    self.varLabelModelText = tk.StringVar() # to show information of the segmentation model
  
     self.processButtom = None # Buttom to start the segmentation process
     self.referenceButtom = None # Buttom to find the relationship between centimeters and pixels 
     self.saveButtom = None # Buttom to save the segmentation result
 
     self.progressBar = None # Progress var to see the percentage of completition of the process
+    self.varLabelProgressText = tk.StringVar() # to show the processed tiles and the remaining time
+    self.cancelButtom = None # Buttom to cancel the segmentation process
+
+    self.segmentationThread = None # background thread running the segmentation process
+    self.segmentationEvents = queue.Queue() # progress and results sent by the background thread
+    self.segmentationGeneration = 0 # incremented for every image, the events of the previous images are dropped
+    self.cancelSegmentation = threading.Event() # set to stop the segmentation process after the current batch, one per process
 
     self.title('HoneySeg - A Honey Bee Segmetation Tool GUI') # main window title
 
@@ -228,6 +196,30 @@ class HoneySegmentationToolGUI(tk.Tk):
     fileMenu.add_separator()
     fileMenu.add_command(label='Exit', command=self.quit)
 
+    # the models of the registry, the recently used ones are kept loaded
+    self.modelMenu = tk.Menu(menuTabs)
+    menuTabs.add_cascade(label='Model', menu=self.modelMenu)
+    for name in self.modelRegistry.entries:
+      self.addModelMenuEntry(name)
+
+    # the exported models (python -m honeyseg.convert) are looked for next to the keras model
+    backendMenu = tk.Menu(menuTabs)
+    menuTabs.add_cascade(label='Backend', menu=backendMenu)
+    for backend in backends:
+      backendMenu.add_radiobutton(label=backend, variable=self.inferenceBackend, value=backend, command=lambda: self.loadModel(self.modelPath()))
+    # the model of a server started with python -m honeyseg.server
+    backendMenu.add_separator()
+    backendMenu.add_radiobutton(label='remote server (' + self.serverUrl + ')', variable=self.inferenceBackend, value="remote", command=lambda: self.loadModel(self.modelPath()))
+
+    optionsMenu = tk.Menu(menuTabs)
+    menuTabs.add_cascade(label='Options', menu=optionsMenu)
+    optionsMenu.add_checkbutton(label='Area only (faster, no mask to show or save)', variable=self.areaOnly)
+    optionsMenu.add_checkbutton(label='Skip tiles without honey colours (sky, vegetation, background)', variable=self.prefilterTiles)
+    optionsMenu.add_checkbutton(label='Coarse-to-fine (refine only the boundaries of honey, not with area only)', variable=self.coarseToFine)
+    optionsMenu.add_separator()
+    optionsMenu.add_radiobutton(label='Run the model in this process', variable=self.workerProcesses, value="1")
+    optionsMenu.add_radiobutton(label='Run the model in several processes (tuned for this machine)', variable=self.workerProcesses, value="auto")
+
     helpMenu = tk.Menu(menuTabs)
     menuTabs.add_cascade(label='Help', menu=helpMenu)
     helpMenu.add_command(label='About', command= self.aboutWindow) 
@@ -286,10 +278,14 @@ class HoneySegmentationToolGUI(tk.Tk):
     processFrame = tk.Frame(left_frame)
     processFrame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
 
-    self.processButtom = tk.Button(processFrame, text='Process Image     >>>', command=lambda: self.segmentationProcess(640, 640, 3))
+    self.processButtom = tk.Button(processFrame, text='Process Image     >>>', command=lambda: self.segmentationProcess(*self.modelRegistry.entries[self.selectedModel.get()].tile))
     self.processButtom.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5,  pady=5) # add a button to go back to main window and close about window     
     self.processButtom["state"] = "disabled" # disabled  until the relationship between centimeters and pixels is specified.
 
+    self.cancelButtom = tk.Button(processFrame, text='Cancel', command=lambda: self.cancelSegmentation.set())
+    self.cancelButtom.pack(side=tk.LEFT, fill=tk.X, padx=5,  pady=5)
+    self.cancelButtom["state"] = "disabled" # enabled while an image is processed
+
     # frame region to show the information retrieved by the loaded image
     informationImageFrame = tk.Frame(left_frame)
     informationImageFrame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
@@ -299,6 +295,7 @@ class HoneySegmentationToolGUI(tk.Tk):
 
     self.varLabelInformationText.set("Image Name: -\nImage Size: -x-\n Area of honey: - cm²")
     tk.Label(informationImageFrame, textvariable=self.varLabelInformationText,wraplength=450 - 20).pack(side=tk.BOTTOM, expand=True, fill=tk.X)
+    tk.Label(informationImageFrame, textvariable=self.varLabelModelText,wraplength=450 - 20).pack(side=tk.BOTTOM, expand=True, fill=tk.X)
 
     # frame region of the save buttom
     saveFrame = tk.Frame(left_frame)
@@ -315,6 +312,10 @@ class HoneySegmentationToolGUI(tk.Tk):
     # Create a progressbar widget
     self.progressBar = tk.ttk.Progressbar(progressBarFrame, orient="horizontal", length=300, mode="determinate")
     self.progressBar.pack(fill=tk.X, padx=5,  pady=5)
+    tk.Label(progressBarFrame, textvariable=self.varLabelProgressText).pack(fill=tk.X)
+
+    # the default segmentation model is loaded once the window is shown
+    self.after_idle(lambda: self.after(0, self.windowShown))
     
 
   #------------------------------------------------------------
@@ -357,6 +358,12 @@ class HoneySegmentationToolGUI(tk.Tk):
   #------------------------------------------------------------
   def get_entry(self, entry, saveEntryVar): 
     saveEntryVar = entry.get() 
+
+    # the area of an image already segmented is updated with the new reference, without running the model
+    if self.opencvMask is not None:
+      self.calculateAreaofHoney(self.opencvMask)
+    elif self.honeyPixelCount is not None:
+      self.calculateAreaofHoney(self.honeyPixelCount)
     
 
   #------------------------------------------------------------
@@ -373,6 +380,8 @@ class HoneySegmentationToolGUI(tk.Tk):
     # supprted keras models formtas
     modelTypes = (
                  ('model files', '*.keras'),
+                 ('TFLite models', '*.tflite'),
+                 ('ONNX models', '*.onnx'),
                  ('All files', '*.*')
                  )
     # supported images formats             
@@ -384,13 +393,108 @@ class HoneySegmentationToolGUI(tk.Tk):
                  )    
     # type 1 to open a ask dialog for load a keras model    
     if typeOfFile == 1:
-      self.honeySegmentationModelPath = tk.filedialog.askopenfilename(title='Select a model', filetypes=modelTypes)    
+      modelPath = tk.filedialog.askopenfilename(title='Select a model', filetypes=modelTypes)    
+
+      # the model is added to the registry with the default tile size and threshold
+      if modelPath:
+        name = Path(modelPath).stem
+        if name not in self.modelRegistry.entries:
+          self.addModelMenuEntry(name)
+        self.modelRegistry.register(name, modelPath)
+        try:
+          self.modelRegistry.save()
+        except OSError:
+          pass # the model is only registered until the application is closed
+
+        self.selectedModel.set(name)
+        self.loadModel(self.modelPath())
 
     # type 2 to open a ask dialog for load images    
     elif typeOfFile == 2:
       self.imgPath = tk.filedialog.askopenfilename(title='Select an image', filetypes=imageTypes)
     
 
+  #------------------------------------------------------------
+  # Function to obtain the path of the segmentation model for the
+  # selected inference backend
+  #
+  # Params:
+  #        None
+  # Return:
+  #        path of the model
+  #------------------------------------------------------------
+  def modelPath(self):
+    if self.inferenceBackend.get() == "remote":
+      return self.serverUrl
+
+    return artifact_path(self.modelRegistry.entries[self.selectedModel.get()].path, self.inferenceBackend.get())
+
+
+  #------------------------------------------------------------
+  # Function called once the window is shown and interactive. The
+  # startup time is measured and the default segmentation model
+  # (and with it TensorFlow) is loaded in background while the user
+  # selects an image and draws the reference.
+  #
+  # Params:
+  #        None
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def windowShown(self):
+    self.startupTime = time.perf_counter() - launch_time
+    self.instrumentation.emit({"timings": {"startup": self.startupTime}}, event="startup")
+
+    self.loadModel(self.modelPath())
+
+
+  #------------------------------------------------------------
+  # Function to load the segmentation model in background. The
+  # information of the model is updated in the interface when the
+  # model is ready.
+  #
+  # Params:
+  #        path: path of the keras model
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def loadModel(self, path):
+    if not is_remote(path) and not Path(path).is_file():
+      self.varLabelModelText.set("Model: " + str(path) + " not found")
+      return
+
+    self.varLabelModelText.set("Model: " + (str(path) if is_remote(path) else Path(path).name) + " (loading...)")
+    if is_remote(path):
+      self.modelManager = self.remoteModelManager
+      self.modelManager.load(path, background=True)
+    else:
+      self.modelManager = self.modelRegistry.manager(self.selectedModel.get(), self.inferenceBackend.get(), background=True)
+    self.after(200, self.updateModelInformation)
+
+
+  #------------------------------------------------------------
+  # Function to show the load and warm-up time of the model once
+  # it is ready, or the error if it could not be loaded. It is
+  # called periodically until then.
+  #
+  # Params:
+  #        None
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def updateModelInformation(self):
+    if not self.modelManager.is_ready() and not self.modelManager.has_failed():
+      self.after(200, self.updateModelInformation)
+      return
+
+    modelName = self.modelManager.key[0] if is_remote(self.modelManager.key[0]) else Path(self.modelManager.key[0]).name
+    if self.modelManager.has_failed():
+      self.varLabelModelText.set("Model: " + modelName + " could not be loaded (" + str(self.modelManager.error) + ")")
+    else:
+      self.instrumentation.model_loaded(self.modelManager)
+      self.varLabelModelText.set("Model: " + modelName + "\nStartup time: " + str(round(self.startupTime, 2)) + " s - Load time: " + str(round(self.modelManager.load_time, 2)) + " s - Warm-up time: " + str(round(self.modelManager.warmup_time, 2)) + " s")
+
+
   #------------------------------------------------------------
   # Function to load an image to process and previsualizate
   #
@@ -404,27 +508,40 @@ class HoneySegmentationToolGUI(tk.Tk):
     self.load_file_path(2)
     
     if self.imgPath:
-      # Read image and convert to RGB
-      self.opencvImg = cv2.imread(self.imgPath)
-      self.opencvImg = cv2.cvtColor(self.opencvImg, cv2.COLOR_BGR2RGB)
+      # stop the segmentation of the previous image, if any, and forget its results
+      self.cancelSegmentation.set()
+      self.segmentationGeneration += 1
+      self.opencvMask = None
+      self.opencvMaskApply = None
+      self.honeyPixelCount = None
+      self.saveButtom["state"] = "disabled"
+
+      # Open the image without decoding it, it is kept in the channel order of opencv (BGR). The
+      # previews are decoded at reduced resolution, the full image only when it is processed
+      self.imageBuffer = ImageBuffer.open(self.imgPath)
+      self.referenceImage = None
  
-      # Convert image to tkinter image format and display
-      self.tkimage = PIL.ImageTk.PhotoImage(PIL.Image.fromarray(cv2.resize(self.opencvImg, (640, 480))))
+      # Convert image to tkinter image format and display. Only the small copies are converted to RGB
+      self.tkimage = PIL.ImageTk.PhotoImage(PIL.Image.fromarray(self.imageBuffer.preview(640, 480, "RGB")))
       
       # resieze the previsualization of the image
-      resized_imgPreview = cv2.resize(self.opencvImg, (256, 256))
+      resized_imgPreview = self.imageBuffer.preview(256, 256, "RGB")
       self.tkimagePreview = PIL.ImageTk.PhotoImage(PIL.Image.fromarray(resized_imgPreview))
       
       self.labelImgagePreview.config(image=self.tkimagePreview)
       
       # get information of the loaded image and update this information in the interface
-      rows, cols, _ = self.opencvImg.shape
+      rows, cols = self.imageBuffer.height, self.imageBuffer.width
       self.varLabelInformationText.set("Image Name:" + self.imgPath + "\nImage Size: " + str(cols) + "x" + str(rows) + "\nArea of honey: - cm²")
 
-      # enable the process and find reference buttons
+      # enable the find reference button. Process is enabled once the segmentation of the previous
+      # image has stopped and the cache has been looked up (see checkSegmentationEvents)
       self.referenceButtom["state"] = "normal"
-      self.processButtom["state"] = "normal"
       self.update()
+
+      # show the segmentation at once if the image was already segmented
+      entry = self.modelRegistry.entries[self.selectedModel.get()]
+      self.segmentationProcess(*entry.tile, lookupOnly=True)
     
 
   #------------------------------------------------------------
@@ -485,9 +602,31 @@ class HoneySegmentationToolGUI(tk.Tk):
     self.cmToPixelRelation.insert(0,str(self.referenceValue))
     
 
+  #------------------------------------------------------------
+  # Function to obtain the display resolution copy of the image
+  # used to draw the reference. It is computed once per image.
+  #
+  # Params:
+  #        None
+  # Return:
+  #        BGR image whose largest side is at most
+  #        referenceDisplaySize
+  #------------------------------------------------------------
+  def referenceDisplayImage(self):
+    if self.referenceImage is None:
+      scale = min(1.0, self.referenceDisplaySize / max(self.imageBuffer.width, self.imageBuffer.height))
+      displayWidth = max(1, round(self.imageBuffer.width * scale))
+      displayHeight = max(1, round(self.imageBuffer.height * scale))
+      self.referenceImage = self.imageBuffer.preview(displayWidth, displayHeight, "BGR")
+
+    return self.referenceImage
+
+
   #------------------------------------------------------------
   # Function to mark the reference in an image. This function opens
-  # a windows to select the reference element in the image
+  # a windows to select the reference element in the image. The
+  # line is drawn on a display resolution copy of the image, only
+  # when the mouse changes it.
   #
   # Params:
   #        None
@@ -495,30 +634,40 @@ class HoneySegmentationToolGUI(tk.Tk):
   #        None
   #------------------------------------------------------------
   def find_reference(self):
+    referenceImage = self.referenceDisplayImage()
+    displayHeight, displayWidth = referenceImage.shape[:2]
+    # the 12 px line of the original image, scaled to the displayed image
+    thickness = max(2, round(12 * displayWidth / self.imageBuffer.width))
+
     # title and instructions of the new opened window
     cv2.namedWindow("Select a line defining the reference in the image", cv2.WINDOW_NORMAL) 
     
     # callback to manage mouse clicks
     mouseLineCoordinates = openCVmouseEventStore()
     cv2.setMouseCallback('Select a line defining the reference in the image', mouseLineCoordinates.line_drawing)  
+    cv2.imshow("Select a line defining the reference in the image", referenceImage)
 
-    # keep showing images on the windows until the windows is closed
+    # keep the window open until it is closed, redrawing the line when it changes
     while True:
-      clearImage = cv2.cvtColor(self.opencvImg, cv2.COLOR_RGB2BGR) # make a new copy of the image to draw the new position of the line
-      cv2.line(clearImage, (mouseLineCoordinates.s_x, mouseLineCoordinates.s_y), (mouseLineCoordinates.e_x, mouseLineCoordinates.e_y), color=(0,0,255), thickness=12)
-      cv2.imshow("Select a line defining the reference in the image", clearImage)
-      cv2.waitKey(10)
+      if mouseLineCoordinates.changed:
+        mouseLineCoordinates.changed = False
+        clearImage = referenceImage.copy() # make a new copy of the image to draw the new position of the line
+        cv2.line(clearImage, (mouseLineCoordinates.s_x, mouseLineCoordinates.s_y), (mouseLineCoordinates.e_x, mouseLineCoordinates.e_y), color=(0,0,255), thickness=thickness)
+        cv2.imshow("Select a line defining the reference in the image", clearImage)
+      cv2.waitKey(20) # process the events of the window
       
       # if the window is not visible so it is closed, then exit the loop section
       if cv2.getWindowProperty("Select a line defining the reference in the image", cv2.WND_PROP_VISIBLE) <1:
         break
-      (x, y, windowWidth, windowHeight) = cv2.getWindowImageRect("Select a line defining the reference in the image") 
-          
-    # call calculateDistanceResized fuction to calculate the distance between the start and end point of the line considering that the displayed image may be larger or smaller than the original one.
-    distance = self.calculateDistanceResized(mouseLineCoordinates.s_x, mouseLineCoordinates.s_y, mouseLineCoordinates.e_x, mouseLineCoordinates.e_y, self.opencvImg.shape[1], self.opencvImg.shape[0], windowWidth, windowHeight)
-    
+
     cv2.destroyWindow("Select a line defining the reference in the image") # destroy the image to select the reference
 
+    if mouseLineCoordinates.s_x is None:
+      return # no line was drawn
+
+    # the coordinates of the mouse are given in the displayed copy, so the distance is scaled to the original image
+    distance = self.calculateDistanceResized(mouseLineCoordinates.s_x, mouseLineCoordinates.s_y, mouseLineCoordinates.e_x, mouseLineCoordinates.e_y, self.imageBuffer.width, self.imageBuffer.height, displayWidth, displayHeight)
+
     
     insertCentimetersInRealLifeWindow = tk.Toplevel() # generate a new child window
     insertCentimetersInRealLifeWindow.grab_set() # keep focus in this new window and prevent to interact with the main window
@@ -538,150 +687,45 @@ class HoneySegmentationToolGUI(tk.Tk):
     tk.Button(insertCentimetersInRealLifeWindow, text='Exit', command=insertCentimetersInRealLifeWindow.destroy).pack() # add a button to go back to main window and close window 
     
 
-  #------------------------------------------------------------
-  # Function to split the images. This function make a temp folder
-  # to store each image tile.
-  #
-  # Params:
-  #        path: path of the image to make a temp floder
-  #        split_width: desired width of the tile
-  #        split_height: desired height of the tile  
-  # Return:
-  #        None
-  #------------------------------------------------------------
-  def splitImages(self, path, split_width, split_height):
-    # parse the path to find the right format depending of OS
-    pathParser = Path(path)
-
-    pathFolder = pathParser.parents[0]
-    imageName = pathParser.name
-
-    valid_images_format = [".jpg",".jpeg",".png"] # supported image format
-    self.splittedPath = pathFolder / "splittedImages" # temp folder to store the tiles
-    
-    nameadd = 'splitted' # partly name of the tiles
-    frmt = 'JPG' # format of the tiles
-    
-    # code to create a directory. If the directory exists it throws an exception, so it is put in a try-except.
-    try:
-      os.makedirs(self.splittedPath)
-    except FileExistsError:
-      # directory already exists
-      pass
-
-    # obtaining the neame of the image to be used partially for the name of the tiles
-    name = os.path.splitext(imageName)[0]
-    img = cv2.imread(pathFolder/imageName)
-    img_h, img_w, _ = img.shape
-
-    # make the tiles using the auxiliary function start_points and save the result in the temp folder
-    X_points = start_points(img_w, split_width, 0.5)
-    Y_points = start_points(img_h, split_height, 0.5)
-
-    count = 0
-
-    for i in Y_points:
-      for j in X_points:
-        split = img[i:i+split_height, j:j+split_width]
-        saveTileName = str(self.splittedPath / name) + '_{}_{:0=5}.{}'.format(nameadd, count, frmt)
-        cv2.imwrite(saveTileName, split) 
-        count += 1
-    
-
-  #------------------------------------------------------------
-  # Function to merge the images
-  #
-  # Params:
-  #        path: path of the image to load temp folder created 
-  #              in the split function
-  #        split_width: width of the tile
-  #        split_height: height of the tile  
-  # Return:
-  #        None
-  #------------------------------------------------------------
-  def mergeImages(self, path, split_width, split_height):
-    # parse the path to find the right format depending of OS  
-    pathParser = Path(path)
-
-    pathFolder = pathParser.parents[0]
-    imageName = pathParser.name
-    
-    valid_images_format = [".jpg",".jpeg",".png"] # supported image format
-
-    img = cv2.imread(pathFolder/imageName) # load the original image
-    img_h, img_w, _ = img.shape # find the shape of the imahe
-    final_image = np.zeros_like(img) # create a image filled with zeros
-
-    # find the points where the marge is necesary
-    X_points = start_points(img_w, split_width, 0.5)
-    Y_points = start_points(img_h, split_height, 0.5)
-
-    # obtaining the name of the image without extension and find all files that share the name
-    image_name = os.path.splitext(imageName)[0] 
-    image_ext = (os.path.splitext(imageName)[1])[1:]
-    splitted_images_list = get_file_names_with_strings(str(pathFolder/"splittedImages"/"predictions"), image_name) 
-    
-    splitted_images_loaded_in_memory = [] # list of tiles to load in memory
-  
-    # fill the splitted_images_loaded_in_memory with all the tiles of the image
-    for splitted_image in splitted_images_list:
-      splitted_images_loaded_in_memory.append(cv2.imread(str(pathFolder/"splittedImages"/"predictions"/splitted_image)))
-
-    # marge all the tiles
-    index = 0
-    for i in Y_points:
-      for j in X_points:
-        final_image[i:i+split_height, j:j+split_width] = cv2.bitwise_or(final_image[i:i+split_height, j:j+split_width],splitted_images_loaded_in_memory[index])
-        index += 1        
-
-    # save the mereg image in a new variable. This merge image is the mask that represent the pixles with honey
-    self.opencvMask = final_image.copy()
-    
-
   #------------------------------------------------------------
   # Function to calculate the surface of honey in an image. This
   # function update the interface information
   #
   # Params:
   #        mask: merged mask here positive values are pixels
-  #              with honey
+  #              with honey, or number of pixels with honey
   # Return:
   #        None
   #------------------------------------------------------------
   def calculateAreaofHoney(self, mask):
-    # count the number of piels that contains honey
-    numberofWhitePixels = cv2.countNonZero(cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY))
-    
     # find the surface in cm2 of honey with 4 decimals
-    self.areaOfHoney = round(float(self.cmToPixelRelation.get()) * numberofWhitePixels, 4)
+    with self.segmentationRecorder.span("area"):
+      self.areaOfHoney = honey_area(mask, self.cmToPixelRelation.get())
     
     # update the information in the interface
-    self.varLabelInformationText.set("Image Name:" + self.imgPath + "\nImage Size: " + str(self.opencvImg.shape[0]) + "x" + str(self.opencvImg.shape[1]) + "\nArea of honey: " + str(self.areaOfHoney) + "cm²")
+    self.varLabelInformationText.set("Image Name:" + self.imgPath + "\nImage Size: " + str(self.imageBuffer.width) + "x" + str(self.imageBuffer.height) + "\nArea of honey: " + str(self.areaOfHoney) + "cm²")
     self.update()
     
 
   #------------------------------------------------------------
   # Function to blend the mask and the loaded image. This function
-  # update the interface to show the result of the segmentation process
+  # update the interface to show the result of the segmentation process.
+  # Only the preview is blended here, at display resolution. The full
+  # resolution image is blended when the results are saved.
   #
   # Params:
-  #        img: original image
+  #        img: ImageBuffer of the original image
   #        mask: mask of pixels representing the honey
   # Return:
   #        None
   #------------------------------------------------------------
   def applySegmentation(self, img, mask):
-    # make an array with a value of red pixel
-    color = np.array([255,0,0], dtype='uint8')
-    
-    # replace all white pixel in mask with a red pixel
-    masked_img = np.where(mask, color, img)
-
-    # blend image and mask woth red pixels with 60% of the original image and 40% of the mask
-    self.opencvMaskApply  = cv2.addWeighted(img, 0.6, masked_img, 0.4,0)
+    # the full resolution blended image is computed again when the results are saved
+    self.opencvMaskApply = None
 
     # update the content of the image showed in the interface as the result of the segmentation
-    self.imgDefaultProcess = cv2.resize(self.opencvMaskApply, (830, 680))
+    with self.segmentationRecorder.span("blend"):
+      self.imgDefaultProcess = preview_overlay(img, mask, 830, 680, "RGB")
  
     # Convert image to tkinter image format and display
     self.tkimageSegmented = PIL.ImageTk.PhotoImage(PIL.Image.fromarray(self.imgDefaultProcess))
@@ -700,7 +744,17 @@ class HoneySegmentationToolGUI(tk.Tk):
   #------------------------------------------------------------
   def saveResults(self):
     # ask for a folder to save the results
-    saveFolder = Path(tk.filedialog.askdirectory())
+    saveFolder = tk.filedialog.askdirectory()
+    if not saveFolder:
+      return
+    saveFolder = Path(saveFolder)
+
+    recorder = self.instrumentation.recorder(image=self.imgPath)
+
+    # blend the mask and the image at full resolution, only the first time the results are saved
+    if self.opencvMaskApply is None:
+      with recorder.span("blend"):
+        self.opencvMaskApply = highlight_honey(self.imageBuffer.array, self.opencvMask, self.imageBuffer.channel_order)
        
     pathParser = Path(self.imgPath)
     imageName = pathParser.name
@@ -712,110 +766,364 @@ class HoneySegmentationToolGUI(tk.Tk):
     image_ext = (os.path.splitext(imageName)[1])[1:]
 
     # save the mask and the image with the blended mask represented with red pixels with honey
-    cv2.imwrite('{}_{}.{}'.format(str(saveFolder / image_name), "honey-Mask", image_ext), self.opencvMask)
-    cv2.imwrite('{}_{}.{}'.format(str(saveFolder / image_name), "honey-Highlighted", image_ext), cv2.cvtColor(self.opencvMaskApply, cv2.COLOR_BGR2RGB))
+    with recorder.span("save"):
+      cv2.imwrite('{}_{}.{}'.format(str(saveFolder / image_name), "honey-Mask", image_ext), self.opencvMask)
+      cv2.imwrite('{}_{}.{}'.format(str(saveFolder / image_name), "honey-Highlighted", image_ext), convert_channel_order(self.opencvMaskApply, self.imageBuffer.channel_order, "BGR"))
+    self.instrumentation.emit(recorder, event="save")
     
 
+  #------------------------------------------------------------
+  # Function to open the cache of masks. The application works
+  # without it if the cache folder can not be created.
+  #
+  # Params:
+  #        None
+  # Return:
+  #        MaskCache or None
+  #------------------------------------------------------------
+  def openMaskCache(self):
+    try:
+      return MaskCache()
+    except OSError:
+      return None
+
+
+  #------------------------------------------------------------
+  # Function to open the registry of models of the user. The
+  # default model is registered if it is not in the registry.
+  #
+  # Params:
+  #        None
+  # Return:
+  #        ModelRegistry
+  #------------------------------------------------------------
+  def openModelRegistry(self):
+    try:
+      registry = ModelRegistry.from_file()
+    except (OSError, ValueError, KeyError):
+      registry = ModelRegistry() # the file can not be read, only the default model is offered
+
+    if default_model_name not in registry.entries:
+      registry.register(default_model_name, self.honeySegmentationModelPath.resolve(), description="default HoneySeg model")
+      registry.entries.move_to_end(default_model_name, last=False)
+
+    return registry
+
+
+  #------------------------------------------------------------
+  # Function to add a model of the registry to the Model menu
+  #
+  # Params:
+  #        name: name of the model
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def addModelMenuEntry(self, name):
+    self.modelMenu.add_radiobutton(label=name, variable=self.selectedModel, value=name, command=lambda: self.loadModel(self.modelPath()))
+
+
+  #------------------------------------------------------------
+  # Function run in the segmentation thread to look for the mask of
+  # an image in the cache. The mask is found if the same image was
+  # segmented with the same model and settings. The image and the
+  # model are hashed the first time, so it is never run in the
+  # thread of the interface.
+  #
+  # Params:
+  #        img: ImageBuffer of the image
+  #        modelPath: path of the segmentation model
+  #        threshold: probability over which a pixel is honey
+  #        tile: (height, width) of the tiles of the model
+  #        prefilter: minimum score of a tile to be predicted, None
+  #                   to predict all the tiles
+  #        coarseScale: scale of the coarse pass of the coarse-to-fine
+  #                     mode, None to predict all the tiles
+  # Return:
+  #        (key of the mask, cached mask or None). The key is None
+  #        if the cache can not be used
+  #------------------------------------------------------------
+  def cachedSegmentation(self, img, modelPath, threshold, tile, prefilter, coarseScale):
+    if self.maskCache is None:
+      return None, None
+
+    try:
+      cacheKey = self.maskCache.key(img.path, modelPath, threshold=threshold, prefilter=prefilter, coarse_scale=coarseScale,
+                                    tile=tile)
+    except OSError:
+      return None, None # the model file does not exist (or is a server)
+
+    return cacheKey, self.maskCache.get(cacheKey)
+
+
   #------------------------------------------------------------
   # Function to perform the segmentation process. This function 
   # split an image into tiles, process each tile and merge the 
   # result of each tile into a new image with the same size of
-  # the original loaded image
+  # the original loaded image. The process runs in a background
+  # thread so the interface keeps responding and can cancel it.
   #
   # Params:
   #        IMG_HEIGHT: Height of a tile.
   #        IMG_WIDTH: Width of a tile.
   #        IMG_CHANNELS: Number of channels of a tile
+  #        lookupOnly: only show the mask if it is in the cache, used
+  #                    when an image is opened
   # Return:
   #        None
   #------------------------------------------------------------
-  def segmentationProcess(self, IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS):
-
-    # init the progressbar
-    self.progressBar.start()
+  def segmentationProcess(self, IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS, lookupOnly=False):
+    # only one image is processed at a time. The lookup of a new image waits for the previous one to stop
+    previous = self.segmentationThread
+    if not lookupOnly and previous is not None and previous.is_alive():
+      return
+
+    # reset the progressbar
+    if not lookupOnly:
+      self.progressBar['value'] = 0
+      self.varLabelProgressText.set("Loading model...")
+      self.cancelButtom["state"] = "normal"
+
+    self.processButtom["state"] = "disabled"
+    self.saveButtom["state"] = "disabled"
+
+    # a new event, the cancelled process of the previous image must not be resumed
+    self.cancelSegmentation = threading.Event()
+    options = dict(areaOnly=self.areaOnly.get(), processes=self.workerProcesses.get(), threshold=self.modelRegistry.entries[self.selectedModel.get()].threshold,
+                   generation=self.segmentationGeneration, cancel=self.cancelSegmentation, previous=previous, lookupOnly=lookupOnly,
+                   prefilter=default_prefilter if self.prefilterTiles.get() else None,
+                   coarseScale=default_coarse_scale if self.coarseToFine.get() else None)
+    self.segmentationThread = threading.Thread(target=self.instrumentation.profiled(self.segmentationWorker), args=(self.imageBuffer, self.modelPath(), IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS), kwargs=options, daemon=True)
+    self.segmentationThread.start()
+    self.after(100, self.checkSegmentationEvents)
 
-    # split images in tiles
-    self.splitImages(self.imgPath, IMG_HEIGHT, IMG_WIDTH)
 
-    # fill the progressbar with 10%    
-    self.progressBar['value'] = 10
-    self.update_idletasks()  
-    
-    # path to store the tile predictions
-    resultPath = self.splittedPath / "predictions"
-    
-    reconstructed_model = keras.models.load_model(self.honeySegmentationModelPath) # load the keras model to perform the segmentation
-    valid_images_format = [".jpg",".jpeg",".png"] # supported image formats
-
-    frmt = 'png' # format for saving processed tiles
+  #------------------------------------------------------------
+  # Function run in the background thread to segment an image. It
+  # must not use tkinter: the progress, partial results and the
+  # final mask are sent to the interface through a queue, tagged
+  # with the generation of the image they belong to.
+  #
+  # Params:
+  #        img: ImageBuffer to process
+  #        modelPath: path of the segmentation model
+  #        IMG_HEIGHT: Height of a tile.
+  #        IMG_WIDTH: Width of a tile.
+  #        IMG_CHANNELS: Channels of a tile.
+  #        areaOnly: only count the pixels with honey of the tiles,
+  #                  without building the mask
+  #        processes: "1" to run the model in this process, "auto"
+  #                   to run it in a pool of processes
+  #        threshold: probability over which a pixel is honey
+  #        generation: generation of the image, see load_image
+  #        cancel: threading.Event to stop the process
+  #        previous: thread of the previous process, waited for
+  #        lookupOnly: only look for the mask in the cache
+  #        prefilter: minimum score of a tile to be predicted, None
+  #                   to predict all the tiles
+  #        coarseScale: scale of the coarse pass of the coarse-to-fine
+  #                     mode, None to predict all the tiles
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def segmentationWorker(self, img, modelPath, IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS, areaOnly=False, processes="1", threshold=default_threshold, generation=0,
+                         cancel=None, previous=None, lookupOnly=False, prefilter=None, coarseScale=None):
+    recorder = self.instrumentation.recorder(image=str(img.path), width=img.width, height=img.height)
+    post = lambda *event: self.segmentationEvents.put((generation,) + event) # send an event of this image to the interface
 
-    # code to create a directory. If the directory exists it throws an exception, so it is put in a try-except.
     try:
-      os.makedirs(resultPath)
-    except FileExistsError:
-      # directory already exists
-      pass
-
-    image_list = [] # variable to save the list of images to process
+      # the process of the previous image stops after its current batch
+      if previous is not None:
+        previous.join()
+
+      # the model is not needed if the image was already segmented with the same model and settings
+      cacheKey, mask = None, None
+      if lookupOnly or not areaOnly:
+        cacheKey, mask = self.cachedSegmentation(img, modelPath, threshold, (IMG_HEIGHT, IMG_WIDTH), prefilter, coarseScale)
+      if mask is not None:
+        recorder.count("cache_hits")
+        post("cached", img, mask, recorder)
+        return
+      if lookupOnly:
+        return
+
+      reconstructed_model = self.segmentationModel(modelPath, (IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS), processes, post) # model to perform the segmentation, only loaded the first time
+      batchSize = self.batchSize
+      if batchSize is None and isinstance(reconstructed_model, WorkerPool):
+        batchSize = reconstructed_model.batch_size # enough tiles to keep all the processes busy
+
+      startTime = time.perf_counter()
+
+      # count the pixels with honey of every tile, no mask nor previews are built
+      if areaOnly:
+        def updateCount(cont, total):
+          post("progress", cont, total, time.perf_counter() - startTime, None)
+
+        pixels = count_honey_pixels(img.array, reconstructed_model, IMG_HEIGHT, IMG_WIDTH, threshold=threshold, batch_size=batchSize, callback=updateCount,
+                                    channel_order=img.channel_order, cancel=cancel, recorder=recorder,
+                                    prefilter=prefilter)
+        post("area", pixels, recorder)
+        return
+
+      mask = np.zeros((img.height, img.width), dtype=np.uint8) # single channel mask filled while the tiles are processed
+      lastPreviewTime = [startTime]
+
+      # send the processed tiles, the elapsed time and, from time to time, a preview of the partial mask
+      def updateProgress(cont, total):
+        now = time.perf_counter()
+        preview = None
+        if now - lastPreviewTime[0] > 1.0:
+          preview = preview_overlay(img, mask, 830, 680, "RGB")
+          lastPreviewTime[0] = now
+        post("progress", cont, total, now - startTime, preview)
+
+      # split the image in tiles, process each tile and merge the result of the tiles in the mask
+      if coarseScale is None:
+        segment_tiles(img.array, reconstructed_model, IMG_HEIGHT, IMG_WIDTH, threshold=threshold, batch_size=batchSize, callback=updateProgress,
+                      channel_order=img.channel_order, cancel=cancel, out=mask, recorder=recorder,
+                      prefilter=prefilter)
+      else:
+        segment_coarse_to_fine(img.array, reconstructed_model, IMG_HEIGHT, IMG_WIDTH, scale=coarseScale, threshold=threshold, batch_size=batchSize,
+                               callback=updateProgress, channel_order=img.channel_order, cancel=cancel, out=mask,
+                               recorder=recorder, prefilter=prefilter)
+
+      # keep the mask to show it at once the next time the image is opened
+      if cacheKey is not None and self.maskCache is not None:
+        try:
+          self.maskCache.put(cacheKey, mask)
+        except OSError:
+          pass
+
+      post("finished", img, mask, recorder)
+    except SegmentationCancelled:
+      post("cancelled")
+    except Exception as e:
+      post("error", e)
 
-    # we read the list of files in a directory
-    for filename in os.listdir(self.splittedPath):
-      ext = os.path.splitext(filename)[1] # we keep the extension of each of the files
-  
-      if ext.lower() not in valid_images_format: # we pass the extension to lowercase and check if the extension is in the list
-        continue # if not on the list we continue
-      image_list.append(filename) # if it is in the list of supported formats, we save the image name in the list
 
-    cont = 1 # counter for the progressbar 
-    
-    # loop to iterate over all the tiles of the image
-    for imageName in image_list:
-      # load a tile
-      test_image = read_image(str(self.splittedPath / imageName), IMG_HEIGHT, IMG_WIDTH, IMG_CHANNELS) 
+  #------------------------------------------------------------
+  # Function run in the segmentation thread to obtain the model.
+  # The pool of processes is created (and the split of the cores
+  # between processes and threads tuned) the first time it is
+  # used with a model.
+  #
+  # Params:
+  #        modelPath: path of the segmentation model
+  #        tile: (height, width, channels) of the input tiles
+  #        processes: "1" to run the model in this process, "auto"
+  #                   to run it in a pool of processes
+  #        post: function to send an event to the interface
+  # Return:
+  #        segmentation model or WorkerPool
+  #------------------------------------------------------------
+  def segmentationModel(self, modelPath, tile, processes, post):
+    # the model of a server already runs apart
+    if processes == "1" or is_remote(modelPath):
+      return self.modelManager.get(modelPath)
 
-      test_image = np.expand_dims(test_image, axis = 0)
+    if self.workerPool is None or self.workerPool.model_path != modelPath or self.workerPool.tile != tuple(tile):
+      if self.workerPool is not None:
+        self.workerPool.close()
+        self.workerPool = None
 
-      #predict the result
-      prediction = reconstructed_model.predict(test_image)
-      prediction = (prediction > 0.5).astype(np.uint8) 
+      post("status", "Tuning the processes for this machine...")
+      best, results = autotune_workers(modelPath, tile=tile, keep_pool=True)
+      self.instrumentation.emit({"autotune": results}, event="autotune")
+      self.workerPool = best["pool"]
 
-      i3 = prediction[0, :, :, 0] 
-      i3 = (i3*255).astype(np.uint8) # scale to 0-255  range and convert to int
-      nameImageToSave = os.path.splitext(imageName)[0]
-      cv2.imwrite('{}.{}'.format(str(resultPath / nameImageToSave), frmt), i3) #save the result of the segmentation process
+    return self.workerPool
 
-      # fill the progressbar with values between 10% to 70% that is the computational core of the segmentation process
-      self.progressBar['value'] = round(70.0 * cont / float(len(image_list)), 1) + 10
-      self.update_idletasks()  
 
-      cont = cont + 1
+  #------------------------------------------------------------
+  # Function to update the interface with the events sent by the
+  # segmentation thread. It is called periodically while the
+  # segmentation thread is running. The events of images that are
+  # no longer loaded are dropped.
+  #
+  # Params:
+  #        None
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def checkSegmentationEvents(self):
+    while True:
+      try:
+        event = self.segmentationEvents.get_nowait()
+      except queue.Empty:
+        break
 
-    # merge the result of the tiles
-    self.mergeImages(self.imgPath, IMG_HEIGHT, IMG_WIDTH)
-    
-    # fill the progressbar with 80%    
-    self.progressBar['value'] = 80
-    self.update_idletasks()  
-    self.applySegmentation(self.opencvImg, self.opencvMask)
-
-    # fill the progressbar with 90%    
-    self.progressBar['value'] = 90
-    self.update_idletasks()  
-    self.calculateAreaofHoney(self.opencvMask)
-    
-    # remove the temp directory of the tiles 
-    shutil.rmtree(str(self.splittedPath), ignore_errors = True) 
-    
-    # fill the progressbar with 100%
-    self.progressBar['value'] = 100
-    self.update_idletasks()   
-    
-    # stop the progressbar animation
-    self.progressBar.stop()
-    
-    # enable the save button
-    self.saveButtom["state"] = "normal"
+      if event[0] != self.segmentationGeneration:
+        continue
+      event = event[1:]
+
+      if event[0] == "progress":
+        _, cont, total, elapsed, preview = event
+
+        # estimate the remaining time from the measured tiles per second
+        tilesPerSecond = cont / elapsed if elapsed > 0 else 0
+        remaining = (total - cont) / tilesPerSecond if tilesPerSecond > 0 else 0
+        self.progressBar['value'] = round(100.0 * cont / float(total), 1)
+        self.varLabelProgressText.set("Tiles: " + str(cont) + "/" + str(total) + " - " + str(round(tilesPerSecond, 2)) + " tiles/s - ETA: " + str(round(remaining)) + " s")
+
+        if preview is not None:
+          self.tkimageSegmented = PIL.ImageTk.PhotoImage(PIL.Image.fromarray(preview))
+          self.lavelSegmentedImage.config(image=self.tkimageSegmented)
+
+      elif event[0] == "finished":
+        _, img, mask, self.segmentationRecorder = event
+        self.opencvMask = mask
+        self.honeyPixelCount = None
+        self.applySegmentation(img, self.opencvMask)
+        self.calculateAreaofHoney(self.opencvMask)
+        self.instrumentation.emit(self.segmentationRecorder)
+
+        self.progressBar['value'] = 100
+        self.varLabelProgressText.set("Finished")
+
+        # enable the save button
+        self.saveButtom["state"] = "normal"
+
+      elif event[0] == "cached":
+        _, img, mask, self.segmentationRecorder = event
+        self.opencvMask = mask
+        self.honeyPixelCount = None
+        self.applySegmentation(img, self.opencvMask)
+        self.calculateAreaofHoney(self.opencvMask)
+        self.instrumentation.emit(self.segmentationRecorder)
+
+        self.progressBar['value'] = 100
+        self.varLabelProgressText.set("Loaded from cache")
+        self.saveButtom["state"] = "normal"
+
+      elif event[0] == "area":
+        _, self.honeyPixelCount, self.segmentationRecorder = event
+        self.opencvMask = None
+        self.opencvMaskApply = None
+        self.calculateAreaofHoney(self.honeyPixelCount)
+        self.instrumentation.emit(self.segmentationRecorder)
+
+        self.progressBar['value'] = 100
+        self.varLabelProgressText.set("Finished (area only)")
+
+      elif event[0] == "status":
+        self.varLabelProgressText.set(event[1])
+
+      elif event[0] == "cancelled":
+        self.varLabelProgressText.set("Cancelled")
+
+      elif event[0] == "error":
+        self.varLabelProgressText.set("Error: " + str(event[1]))
+
+    if self.segmentationThread.is_alive() or not self.segmentationEvents.empty():
+      self.after(100, self.checkSegmentationEvents)
+    else:
+      self.processButtom["state"] = "normal"
+      self.cancelButtom["state"] = "disabled"
 
 
 #main call to the class of the graphical interface
-HoneySegmentationToolGUI().mainloop()
+if __name__ == "__main__":
+  app = HoneySegmentationToolGUI()
+  app.mainloop()
+  if app.workerPool is not None:
+    app.workerPool.close()
+  app.instrumentation.close()
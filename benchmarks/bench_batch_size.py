@@ -0,0 +1,61 @@
+#------------------------------------------------------------
+# Benchmark of the batched tile inference. Measures the number of
+# 640x640 tiles per second predicted by the segmentation model for
+# several batch sizes.
+#
+# Usage:
+#        python benchmarks/bench_batch_size.py [--model PATH]
+#               [--batch-sizes 1 4 8 16] [--tiles 32]
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import time # to measure the elapsed time
+import keras # to use keras api
+import segmentation_models as sm # Segmentation Models: using `keras` framework.
+import numpy as np # to make calculations
+
+
+#------------------------------------------------------------
+# Function to measure the throughput of the model for a batch size
+#
+# Params:
+#        model: keras segmentation model
+#        tiles: float32 tiles in model input format
+#        batch_size: tiles predicted at once
+# Return:
+#        tiles per second
+#------------------------------------------------------------
+def measure_tiles_per_second(model, tiles, batch_size):
+  # warm-up inference, the first call builds the predict function
+  model.predict(tiles[:batch_size], batch_size=batch_size, verbose=0)
+
+  start = time.perf_counter()
+  for first in range(0, len(tiles), batch_size):
+    batch = tiles[first:first+batch_size]
+    model.predict(batch, batch_size=len(batch), verbose=0)
+  elapsed = time.perf_counter() - start
+
+  return len(tiles) / elapsed
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Tiles/sec of the segmentation model for several batch sizes")
+  parser.add_argument("--model", default="defaults/honeyModels/efficientnetb2-FPN.keras", help="path to the keras model")
+  parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16], help="batch sizes to measure")
+  parser.add_argument("--tiles", type=int, default=32, help="number of tiles predicted for each batch size")
+  parser.add_argument("--tile-size", type=int, default=640, help="height and width of a tile")
+  args = parser.parse_args()
+
+  model = keras.models.load_model(args.model)
+
+  # random tiles with the same format as the tiles of segment_tiles
+  rng = np.random.default_rng(0)
+  tiles = rng.random((args.tiles, args.tile_size, args.tile_size, 3), dtype=np.float32)
+
+  print("batch size | tiles/sec")
+  for batch_size in args.batch_sizes:
+    tilesPerSecond = measure_tiles_per_second(model, tiles, batch_size)
+    print("{:>10} | {:>9.2f}".format(batch_size, tilesPerSecond))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,59 @@
+#------------------------------------------------------------
+# Inferences, time and accuracy of the coarse-to-fine mode. Every
+# coarse scale is compared against the segmentation of all the
+# tiles at full resolution, reporting the tiles of the coarse pass,
+# the refined tiles, the time, the IoU of the masks and the
+# deviation in the area of honey.
+#
+# Usage:
+#        python benchmarks/bench_coarse_to_fine.py IMAGE [IMAGE ...]
+#               [--model PATH] [--scales 0.5 0.33 0.25]
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import os # to manage actions of the operating system
+import sys # to import honeyseg from the repository
+import time # to measure the elapsed time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from honeyseg import ModelManager, ImageBuffer, Recorder, segment_image, honey_pixels, mask_iou
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Inferences, speedup and area deviation of the coarse-to-fine mode")
+  parser.add_argument("images", nargs="+", help="images to segment")
+  parser.add_argument("--model", default="defaults/honeyModels/efficientnetb2-FPN.keras", help="path to the keras model")
+  parser.add_argument("--scales", type=float, nargs="+", default=[0.5, 0.33, 0.25], help="scales of the coarse pass to compare")
+  parser.add_argument("--batch-size", type=int, default=None, help="tiles predicted at once")
+  args = parser.parse_args()
+
+  model = ModelManager().get(args.model)
+
+  print("image | scale | coarse tiles | refined tiles | inferences | time (s) | speedup | IoU | area deviation (%)")
+  for imagePath in args.images:
+    img = ImageBuffer.read(imagePath)
+    reference = None
+    referenceTime = None
+
+    for scale in [None] + args.scales:
+      recorder = Recorder()
+      start = time.perf_counter()
+      mask = segment_image(img, model, batch_size=args.batch_size, recorder=recorder, coarse_scale=scale)
+      elapsed = time.perf_counter() - start
+
+      if reference is None:
+        reference, referenceTime = mask, elapsed
+
+      referencePixels = honey_pixels(reference)
+      deviation = 100.0 * (honey_pixels(mask) - referencePixels) / referencePixels if referencePixels else 0.0
+
+      print("{} | {} | {} | {} | {} | {:.2f} | {:.2f}x | {:.4f} | {:+.2f}".format(os.path.basename(imagePath), scale,
+                                                                                  recorder.counters.get("coarse_tiles", 0),
+                                                                                  recorder.counters.get("refined_tiles", 0),
+                                                                                  recorder.counters.get("tiles", 0), elapsed,
+                                                                                  referenceTime / elapsed, mask_iou(mask, reference),
+                                                                                  deviation))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,99 @@
+#------------------------------------------------------------
+# Peak memory of the mask representations on a large synthetic
+# image. Each representation is measured in a new process, so
+# the peak resident set size (RSS) of one does not hide the other.
+#
+#   image:   only the synthetic RGB image (baseline)
+#   legacy:  3 channels mask + BGR2GRAY conversion to count pixels
+#   single:  single channel uint8 mask counted directly
+#   packed:  single channel mask packed to 1 bit per pixel
+#
+# Usage:
+#        python benchmarks/bench_mask_memory.py [--megapixels 45]
+#
+# Peak RSS is read with the resource module (Linux/macOS).
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import json # to send the measures from the child processes
+import os # to manage actions of the operating system
+import resource # to obtain the peak resident set size
+import subprocess # to measure each representation in a new process
+import sys # to import honeyseg from the repository
+import numpy as np # to make calculations
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+variants = ["image", "legacy", "single", "packed"]
+
+
+#------------------------------------------------------------
+# Function to obtain the peak RSS of the current process in MB
+#------------------------------------------------------------
+def peak_rss_mb():
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is given in bytes on macOS and in KB on Linux
+  return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+#------------------------------------------------------------
+# Function run in the child process to build and count a mask
+#
+# Params:
+#        variant: representation of the mask
+#        megapixels: size of the synthetic image
+# Return:
+#        (honey pixels, peak RSS in MB)
+#------------------------------------------------------------
+def measure(variant, megapixels):
+  import cv2 # opencv library to process images
+  from honeyseg import honey_pixels, pack_mask, packed_honey_pixels
+
+  width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+  height = int(megapixels * 1e6 / width)
+  img = np.full((height, width, 3), 128, dtype=np.uint8)
+
+  # synthetic honey: every other row, so that all the memory pages of the mask are used
+  pixels = 0
+  if variant == "legacy":
+    mask = np.zeros_like(img)
+    mask[::2] = 255
+    pixels = cv2.countNonZero(cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY))
+  elif variant in ("single", "packed"):
+    mask = np.zeros(img.shape[:2], dtype=np.uint8)
+    mask[::2] = 255
+    if variant == "packed":
+      mask = pack_mask(mask)
+      pixels = packed_honey_pixels(mask)
+    else:
+      pixels = honey_pixels(mask)
+
+  return pixels, peak_rss_mb()
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Peak RSS of the mask representations")
+  parser.add_argument("--megapixels", type=float, default=45, help="size of the synthetic image in megapixels")
+  parser.add_argument("--variant", choices=variants, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.variant is not None:
+    pixels, peak = measure(args.variant, args.megapixels)
+    print(json.dumps({"pixels": pixels, "peak_rss_mb": peak}))
+    return
+
+  results = {}
+  for variant in variants:
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--variant", variant, "--megapixels", str(args.megapixels)],
+                            check=True, capture_output=True, text=True).stdout
+    results[variant] = json.loads(output)
+
+  baseline = results["image"]["peak_rss_mb"]
+  print("{} MP image, baseline peak RSS {:.1f} MB".format(args.megapixels, baseline))
+  print("variant | peak RSS (MB) | over baseline (MB) | honey pixels")
+  for variant in variants[1:]:
+    peak = results[variant]["peak_rss_mb"]
+    print("{} | {:.1f} | {:.1f} | {}".format(variant, peak, peak - baseline, results[variant]["pixels"]))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,55 @@
+#------------------------------------------------------------
+# Comparison of the tile overlap and merge modes. Every setting is
+# compared against the original behaviour (50% overlap, tiles
+# joined with OR) reporting the number of tiles, the time, the
+# IoU of the masks and the difference in honey pixels.
+#
+# Usage:
+#        python benchmarks/bench_overlap.py IMAGE [IMAGE ...]
+#               [--model PATH] [--overlaps 0.5 0.25 0.125]
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import os # to manage actions of the operating system
+import sys # to import honeyseg from the repository
+import time # to measure the elapsed time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from honeyseg import ModelManager, ImageBuffer, segment_image, tile_points, tile_height, tile_width, honey_pixels, mask_iou
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Timing and IoU of the overlap/merge settings against 50% overlap with OR")
+  parser.add_argument("images", nargs="+", help="images to segment")
+  parser.add_argument("--model", default="defaults/honeyModels/efficientnetb2-FPN.keras", help="path to the keras model")
+  parser.add_argument("--overlaps", type=float, nargs="+", default=[0.5, 0.25, 0.125], help="overlaps to compare")
+  parser.add_argument("--batch-size", type=int, default=None, help="tiles predicted at once")
+  args = parser.parse_args()
+
+  model = ModelManager().get(args.model)
+
+  settings = [(0.5, "or")] + [(overlap, merge) for overlap in args.overlaps for merge in ("or", "blend") if (overlap, merge) != (0.5, "or")]
+
+  print("image | overlap | merge | tiles | time (s) | IoU | honey pixels diff (%)")
+  for imagePath in args.images:
+    img = ImageBuffer.read(imagePath)
+    reference = None
+
+    for overlap, merge in settings:
+      start = time.perf_counter()
+      mask = segment_image(img, model, overlap=overlap, merge=merge, batch_size=args.batch_size)
+      elapsed = time.perf_counter() - start
+
+      if reference is None:
+        reference = mask
+
+      referencePixels = honey_pixels(reference)
+      difference = 100.0 * (honey_pixels(mask) - referencePixels) / referencePixels if referencePixels else 0.0
+      tiles = len(tile_points(img.shape[0], img.shape[1], tile_height, tile_width, overlap))
+
+      print("{} | {} | {} | {} | {:.2f} | {:.4f} | {:+.2f}".format(os.path.basename(imagePath), overlap, merge, tiles, elapsed,
+                                                                  mask_iou(mask, reference), difference))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,73 @@
+#------------------------------------------------------------
+# Per-tile latency of the keras model with Model.predict against
+# the traced tf.function of honeyseg.backends, with and without XLA
+# and mixed precision, for several batch sizes.
+#
+# Usage:
+#        python benchmarks/bench_predict_latency.py [--model PATH]
+#               [--batch-sizes 1 2 4 8] [--repeats 10]
+#               [--modes predict function jit mixed]
+#
+# Without --model the randomly initialised stand-in model of
+# honeyseg.standin is used, so it runs offline.
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import os # to manage actions of the operating system
+import sys # to import honeyseg from the repository
+import time # to measure the elapsed time
+import numpy as np # to make calculations
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from honeyseg import KerasFunctionModel, load_model, tile_height, tile_width, tile_channels
+from honeyseg.standin import build_standin_keras_model
+
+# inference modes: (compiled, jit_compile, mixed_precision)
+modes = {"predict": (False, False, False), "function": (True, False, False), "jit": (True, True, False),
+         "mixed": (True, False, True)}
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Per-tile latency of Model.predict against the compiled inference function")
+  parser.add_argument("--model", default=None, help="path to the keras model (default: stand-in model)")
+  parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8], help="tiles predicted at once")
+  parser.add_argument("--repeats", type=int, default=10, help="timed predictions of each batch size")
+  parser.add_argument("--modes", nargs="+", choices=list(modes), default=list(modes), help="inference modes to compare")
+  args = parser.parse_args()
+
+  keras_model = load_model(args.model, compiled=False) if args.model else build_standin_keras_model()
+  rng = np.random.default_rng(0)
+
+  print("mode | batch size | load/trace (s) | first call (s) | ms per tile | speedup")
+  reference = {}
+  for mode in args.modes:
+    compiled, jit_compile, mixed_precision = modes[mode]
+
+    start = time.perf_counter()
+    try:
+      model = KerasFunctionModel(keras_model, jit_compile, mixed_precision) if compiled else keras_model
+    except Exception as e:
+      print("{}: {}".format(mode, e), file=sys.stderr)
+      continue
+    traceTime = time.perf_counter() - start
+
+    for batchSize in args.batch_sizes:
+      inputs = rng.random((batchSize, tile_height, tile_width, tile_channels), dtype=np.float32)
+
+      # the first call builds the predict function (or the XLA program of this batch size)
+      start = time.perf_counter()
+      model.predict(inputs, batch_size=batchSize, verbose=0)
+      firstCall = time.perf_counter() - start
+
+      start = time.perf_counter()
+      for _ in range(args.repeats):
+        model.predict(inputs, batch_size=batchSize, verbose=0)
+      perTile = 1000.0 * (time.perf_counter() - start) / (args.repeats * batchSize)
+
+      reference.setdefault(batchSize, perTile)
+      print("{} | {} | {:.2f} | {:.2f} | {:.1f} | {:.2f}x".format(mode, batchSize, traceTime, firstCall, perTile,
+                                                                 reference[batchSize] / perTile))
+
+
+if __name__ == "__main__":
+  main()
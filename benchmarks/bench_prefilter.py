@@ -0,0 +1,57 @@
+#------------------------------------------------------------
+# Speedup and accuracy of the tile prefilter. Every prefilter
+# threshold is compared against the segmentation of all the tiles,
+# reporting the skipped tiles, the time, the IoU of the masks and
+# the error in the area of honey.
+#
+# Usage:
+#        python benchmarks/bench_prefilter.py IMAGE [IMAGE ...]
+#               [--model PATH] [--thresholds 0.01 0.02 0.05 0.1]
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import os # to manage actions of the operating system
+import sys # to import honeyseg from the repository
+import time # to measure the elapsed time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from honeyseg import ModelManager, ImageBuffer, Recorder, segment_image, honey_pixels, mask_iou
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Skipped tiles, speedup and area error of the tile prefilter")
+  parser.add_argument("images", nargs="+", help="images to segment")
+  parser.add_argument("--model", default="defaults/honeyModels/efficientnetb2-FPN.keras", help="path to the keras model")
+  parser.add_argument("--thresholds", type=float, nargs="+", default=[0.01, 0.02, 0.05, 0.1], help="prefilter thresholds to compare")
+  parser.add_argument("--batch-size", type=int, default=None, help="tiles predicted at once")
+  args = parser.parse_args()
+
+  model = ModelManager().get(args.model)
+
+  print("image | prefilter | tiles | skipped (%) | time (s) | speedup | IoU | area error (%)")
+  for imagePath in args.images:
+    img = ImageBuffer.read(imagePath)
+    reference = None
+    referenceTime = None
+
+    for threshold in [None] + args.thresholds:
+      recorder = Recorder()
+      start = time.perf_counter()
+      mask = segment_image(img, model, batch_size=args.batch_size, recorder=recorder, prefilter=threshold)
+      elapsed = time.perf_counter() - start
+
+      if reference is None:
+        reference, referenceTime = mask, elapsed
+
+      skipped = recorder.counters.get("tiles_skipped", 0)
+      tiles = recorder.counters.get("tiles", 0) + skipped
+      referencePixels = honey_pixels(reference)
+      error = 100.0 * (honey_pixels(mask) - referencePixels) / referencePixels if referencePixels else 0.0
+
+      print("{} | {} | {} | {:.1f} | {:.2f} | {:.2f}x | {:.4f} | {:+.2f}".format(os.path.basename(imagePath), threshold, tiles,
+                                                                                100.0 * skipped / tiles if tiles else 0.0, elapsed,
+                                                                                referenceTime / elapsed, mask_iou(mask, reference), error))
+
+
+if __name__ == "__main__":
+  main()
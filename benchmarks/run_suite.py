@@ -0,0 +1,215 @@
+#------------------------------------------------------------
+# Benchmark suite of the segmentation stages. It runs offline with
+# a randomly initialised stand-in model with the same signature as
+# the HoneySeg model, on synthetic images of several sizes, and
+# writes the results as JSON so versions can be compared.
+#
+# Stages:
+#   tiling:    tile_points/start_points and copy of all the tiles
+#              into the model input batches
+#   inference: time spent inside model.predict
+#   merge:     rest of segment_tiles (merge of the predictions)
+#   preview:   display resolution overlay (applySegmentation)
+#   highlight: full resolution overlay (computed when saving)
+#   area:      honey_area (calculateAreaofHoney)
+#   save:      cv2.imwrite of the mask (PNG) and overlay (JPG)
+#
+# Usage:
+#        python benchmarks/run_suite.py [--sizes 2 12 24 45 100]
+#               [--standin keras|numpy] [--output results.json]
+#               [--compare previous.json] [--tolerance 0.2]
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import json # to write the results
+import os # to manage actions of the operating system
+import platform # to describe the machine
+import sys # to import honeyseg from the repository
+import tempfile # to save the results of the save stage
+import time # to measure the elapsed time
+import cv2 # opencv library to process images
+import numpy as np # to make calculations
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import honeyseg
+from honeyseg import (tile_height, tile_width, tile_channels, tile_points, fill_batch, auto_batch_size, segment_tiles,
+                      preview_overlay, highlight_honey, honey_area, default_overlap)
+from honeyseg.standin import StandInModel, build_standin_keras_model
+
+stages = ["tiling", "inference", "merge", "preview", "highlight", "area", "save"]
+
+
+#------------------------------------------------------------
+# Class that measures the time spent inside predict of a model
+#------------------------------------------------------------
+class TimedModel:
+  def __init__(self, model):
+    self.model = model
+    self.elapsed = 0.0
+
+  def predict(self, inputs, batch_size=None, verbose=0):
+    start = time.perf_counter()
+    predictions = self.model.predict(inputs, batch_size=batch_size, verbose=verbose)
+    self.elapsed += time.perf_counter() - start
+    return predictions
+
+
+#------------------------------------------------------------
+# Function to build a synthetic 4:3 BGR image with smooth blobs,
+# so the masks of the stand-in model have regions and borders
+#
+# Params:
+#        megapixels: size of the image
+#        seed: seed of the random image
+# Return:
+#        uint8 image
+#------------------------------------------------------------
+def synthetic_image(megapixels, seed=0):
+  width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+  height = int(megapixels * 1e6 / width)
+
+  rng = np.random.default_rng(seed)
+  coarse = rng.integers(0, 256, size=(max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8)
+  return cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+#------------------------------------------------------------
+# Function to measure all the stages on an image
+#
+# Params:
+#        img: BGR image
+#        model: segmentation model
+#        batch_size: tiles predicted at once
+#        overlap: overlap between tiles
+#        folder: folder where the save stage writes
+# Return:
+#        dictionary with the seconds of each stage
+#------------------------------------------------------------
+def measure_stages(img, model, batch_size, overlap, folder):
+  timings = {}
+
+  start = time.perf_counter()
+  points = tile_points(img.shape[0], img.shape[1], tile_height, tile_width, overlap)
+  batch = np.empty((batch_size, tile_height, tile_width, tile_channels), dtype=np.float32)
+  for first in range(0, len(points), batch_size):
+    fill_batch(img, points[first:first+batch_size], tile_height, tile_width, batch, "BGR")
+  timings["tiling"] = time.perf_counter() - start
+
+  timedModel = TimedModel(model)
+  start = time.perf_counter()
+  mask = segment_tiles(img, timedModel, tile_height, tile_width, overlap=overlap, batch_size=batch_size, channel_order="BGR")
+  segmentTime = time.perf_counter() - start
+  timings["inference"] = timedModel.elapsed
+  timings["merge"] = max(0.0, segmentTime - timedModel.elapsed - timings["tiling"])
+
+  start = time.perf_counter()
+  preview_overlay(img, mask, 830, 680, "BGR")
+  timings["preview"] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  highlighted = highlight_honey(img, mask, "BGR")
+  timings["highlight"] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  honey_area(mask, 0.0004)
+  timings["area"] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  cv2.imwrite(os.path.join(folder, "mask.png"), mask)
+  cv2.imwrite(os.path.join(folder, "highlighted.jpg"), highlighted)
+  timings["save"] = time.perf_counter() - start
+
+  return timings, len(points)
+
+
+#------------------------------------------------------------
+# Function to compare the results with a previous run
+#
+# Params:
+#        results: results of this run
+#        previous: results of the previous run
+#        tolerance: allowed slowdown, e.g. 0.2 for 20%
+#        min_seconds: stages faster than this are not compared,
+#                     their times are mostly noise
+# Return:
+#        list of regressions as text
+#------------------------------------------------------------
+def compare_results(results, previous, tolerance, min_seconds=0.01):
+  regressions = []
+  previousBySize = {entry["megapixels"]: entry for entry in previous["results"]}
+
+  for entry in results["results"]:
+    before = previousBySize.get(entry["megapixels"])
+    if before is None:
+      continue
+
+    for stage in stages:
+      old, new = before["stages"].get(stage), entry["stages"][stage]
+      if old and max(old, new) >= min_seconds and new > old * (1 + tolerance):
+        regressions.append("{} MP {}: {:.4f} s -> {:.4f} s (+{:.0f}%)".format(entry["megapixels"], stage, old, new, 100 * (new / old - 1)))
+
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Per-stage benchmark of the segmentation with a stand-in model")
+  parser.add_argument("--sizes", type=float, nargs="+", default=[2, 12, 24, 45, 100], help="sizes of the synthetic images in megapixels")
+  parser.add_argument("--standin", choices=["keras", "numpy"], default="keras", help="stand-in model (default: keras)")
+  parser.add_argument("--batch-size", type=int, default=None, help="tiles predicted at once (default: from the available memory)")
+  parser.add_argument("--overlap", type=float, default=default_overlap, help="overlap between tiles")
+  parser.add_argument("--repeat", type=int, default=1, help="runs of each size, the fastest is kept")
+  parser.add_argument("--output", default="bench_results.json", help="JSON file with the results")
+  parser.add_argument("--compare", default=None, help="JSON file of a previous run to detect regressions")
+  parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown when comparing (default: 0.2)")
+  args = parser.parse_args()
+
+  model = build_standin_keras_model() if args.standin == "keras" else StandInModel()
+  batchSize = args.batch_size or auto_batch_size(tile_height, tile_width, tile_channels)
+
+  # first inference outside the measures, it builds the predict function of keras
+  model.predict(np.zeros((batchSize, tile_height, tile_width, tile_channels), dtype=np.float32), batch_size=batchSize, verbose=0)
+
+  results = {
+    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "platform": platform.platform(),
+    "processor": platform.processor(),
+    "cpu_count": os.cpu_count(),
+    "python": platform.python_version(),
+    "numpy": np.__version__,
+    "opencv": cv2.__version__,
+    "honeyseg": os.path.dirname(honeyseg.__file__),
+    "settings": {"standin": args.standin, "batch_size": batchSize, "overlap": args.overlap, "repeat": args.repeat},
+    "results": [],
+  }
+
+  with tempfile.TemporaryDirectory() as folder:
+    for megapixels in args.sizes:
+      img = synthetic_image(megapixels)
+      best = None
+
+      for _ in range(args.repeat):
+        timings, tiles = measure_stages(img, model, batchSize, args.overlap, folder)
+        best = timings if best is None else {stage: min(best[stage], timings[stage]) for stage in stages}
+
+      results["results"].append({"megapixels": megapixels, "width": img.shape[1], "height": img.shape[0], "tiles": tiles, "stages": best})
+      print("{:>6} MP ({} tiles): ".format(megapixels, tiles) + ", ".join("{} {:.3f}s".format(stage, best[stage]) for stage in stages))
+      del img
+
+  with open(args.output, "w") as outputFile:
+    json.dump(results, outputFile, indent=2)
+  print("Results written to " + args.output)
+
+  if args.compare:
+    with open(args.compare) as previousFile:
+      regressions = compare_results(results, json.load(previousFile), args.tolerance)
+
+    for regression in regressions:
+      print("REGRESSION " + regression)
+    if regressions:
+      return 1
+
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,53 @@
+#------------------------------------------------------------
+# HoneySeg: honey segmentation on photographs of honeycombs.
+# Importable API of the segmentation core used by the graphical
+# interface (app_gui.py) and the command line (python -m honeyseg).
+#------------------------------------------------------------
+from .core import (
+  SegmentationCancelled,
+  default_batch_size,
+  default_threshold,
+  default_overlap,
+  default_merge,
+  default_window,
+  default_prefilter,
+  default_coarse_scale,
+  default_refine_margin,
+  tile_height,
+  tile_width,
+  tile_channels,
+  check_overlap,
+  start_points,
+  tile_points,
+  tile_honey_score,
+  prefilter_tiles,
+  blend_window,
+  available_memory,
+  auto_batch_size,
+  fill_batch,
+  segment_tiles,
+  segment_coarse_to_fine,
+  segment_image,
+  predict_tiles,
+  ownership_bounds,
+  count_honey_pixels,
+  segment_area,
+  honey_pixels,
+  honey_area,
+  mask_iou,
+  pack_mask,
+  unpack_mask,
+  packed_honey_pixels,
+  highlight_honey,
+  preview_overlay,
+)
+from .backends import backends, default_backend, artifact_path, is_remote, load_model, KerasFunctionModel, TFLiteModel, OnnxModel, RemoteModel
+from .cache import MaskCache, file_hash
+from .convert import parity_check
+from .image import ImageBuffer, convert_channel_order
+from .instrumentation import Instrumentation, Recorder, JsonLinesSink, MemorySink
+from .models import ModelManager
+from .pipeline import ImageResult, process_images
+from .registry import ModelEntry, ModelRegistry
+from .streaming import open_band_source, open_band_writer, segment_streaming, stream_images
+from .workers import WorkerPool, autotune_workers, configure_threads, available_cores
@@ -0,0 +1,8 @@
+#------------------------------------------------------------
+# Entry point to run the command line as: python -m honeyseg
+#------------------------------------------------------------
+import sys
+
+from .cli import main
+
+sys.exit(main())
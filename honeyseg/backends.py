@@ -0,0 +1,303 @@
+#------------------------------------------------------------
+# Inference backends of the segmentation model. Besides the keras
+# model, the model can be exported (see honeyseg.convert) to TFLite
+# (float32, float16 or int8) or ONNX, which are faster on CPU-only
+# machines. Every backend offers the predict(inputs, batch_size,
+# verbose) method of a keras model, so the tiling engine works the
+# same with all of them.
+#
+# Keras models are run through a tf.function traced once with a
+# fixed tile signature instead of Model.predict, which rebuilds its
+# data pipeline on every call. Optionally the function is compiled
+# with XLA and the model run with mixed precision (float16).
+#
+# TensorFlow, tflite_runtime and onnxruntime are only imported when
+# a model of that type is loaded.
+#
+# A model can also be the URL of a HoneySeg server (see
+# honeyseg.server), which runs the model for several clients.
+#------------------------------------------------------------
+import io # to send the tiles to a server
+import json # to read the information of a server
+import os # to manage actions of the operating system
+import urllib.request # to send the tiles to a server
+from pathlib import Path # to manage system paths (windows, linux, etc)
+import numpy as np # to make calculations
+
+from .core import tile_height, tile_width, tile_channels
+
+# available backends. The name of the exported artifacts is built
+# from the keras model name, e.g. efficientnetb2-FPN.float16.tflite
+backends = ("keras", "tflite-float32", "tflite-float16", "tflite-int8", "onnx")
+default_backend = "keras"
+
+
+# maximum seconds waiting for the predictions of a server
+default_remote_timeout = 600
+
+
+#------------------------------------------------------------
+# Function to know if a model is the URL of a HoneySeg server
+#
+# Params:
+#        path: path of the model or URL
+# Return:
+#        True if it is an http(s) URL
+#------------------------------------------------------------
+def is_remote(path):
+  return str(path).startswith(("http://", "https://"))
+
+
+#------------------------------------------------------------
+# Function to obtain the path of the artifact of a backend
+#
+# Params:
+#        model_path: path of the keras model
+#        backend: name of the backend
+# Return:
+#        path of the model for the backend
+#------------------------------------------------------------
+def artifact_path(model_path, backend):
+  if is_remote(model_path):
+    return model_path # the server has its own model
+
+  model_path = Path(model_path)
+
+  if backend not in backends:
+    raise ValueError("Unknown backend: " + str(backend))
+
+  # models given directly in an exported format are used as they are
+  if backend == "keras" or model_path.suffix.lower() in (".tflite", ".onnx"):
+    return model_path
+
+  if backend == "onnx":
+    return model_path.with_suffix(".onnx")
+
+  variant = backend.split("-")[1]
+  return model_path.with_suffix("." + variant + ".tflite")
+
+
+#------------------------------------------------------------
+# Class to run a TFLite model. The interpreter is resized when the
+# batch size changes. Quantized inputs and outputs are converted
+# from/to float32 with their quantization parameters.
+#------------------------------------------------------------
+class TFLiteModel:
+  def __init__(self, path, num_threads=None):
+    try:
+      from tflite_runtime.interpreter import Interpreter # lightweight runtime, if installed
+    except ImportError:
+      import tensorflow as tf # to use the TFLite interpreter of tensorflow
+      Interpreter = tf.lite.Interpreter
+
+    self.path = Path(path)
+    self.interpreter = Interpreter(model_path=str(path), num_threads=num_threads)
+    self.interpreter.allocate_tensors()
+    self.input = self.interpreter.get_input_details()[0]
+    self.output = self.interpreter.get_output_details()[0]
+
+  #------------------------------------------------------------
+  # Function to predict a batch of tiles
+  #
+  # Params:
+  #        inputs: float32 batch of tiles in range 0-1
+  #        batch_size: not used, the whole batch is predicted at once
+  #        verbose: not used
+  # Return:
+  #        float32 predictions
+  #------------------------------------------------------------
+  def predict(self, inputs, batch_size=None, verbose=0):
+    if tuple(self.input["shape"]) != inputs.shape:
+      self.interpreter.resize_tensor_input(self.input["index"], inputs.shape)
+      self.interpreter.allocate_tensors()
+      self.input = self.interpreter.get_input_details()[0]
+      self.output = self.interpreter.get_output_details()[0]
+
+    scale, zero_point = self.input["quantization"]
+    if scale:
+      inputs = np.round(inputs / scale + zero_point)
+    self.interpreter.set_tensor(self.input["index"], inputs.astype(self.input["dtype"]))
+
+    self.interpreter.invoke()
+
+    predictions = self.interpreter.get_tensor(self.output["index"])
+    scale, zero_point = self.output["quantization"]
+    if scale:
+      predictions = (predictions.astype(np.float32) - zero_point) * scale
+
+    return predictions.astype(np.float32, copy=False)
+
+
+#------------------------------------------------------------
+# Class to run an ONNX model with onnxruntime
+#------------------------------------------------------------
+class OnnxModel:
+  def __init__(self, path, num_threads=None):
+    import onnxruntime # optional dependency, only needed for ONNX models
+
+    options = onnxruntime.SessionOptions()
+    if num_threads:
+      options.intra_op_num_threads = num_threads
+
+    self.path = Path(path)
+    self.session = onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+    self.input_name = self.session.get_inputs()[0].name
+
+  #------------------------------------------------------------
+  # Function to predict a batch of tiles
+  #
+  # Params:
+  #        inputs: float32 batch of tiles in range 0-1
+  #        batch_size: not used, the whole batch is predicted at once
+  #        verbose: not used
+  # Return:
+  #        float32 predictions
+  #------------------------------------------------------------
+  def predict(self, inputs, batch_size=None, verbose=0):
+    return self.session.run(None, {self.input_name: inputs})[0]
+
+
+#------------------------------------------------------------
+# Class to run the model of a HoneySeg server (python -m
+# honeyseg.server). The tiles are sent as uint8, as they come from
+# uint8 images, and the server merges them with the tiles of other
+# clients into shared batches.
+#------------------------------------------------------------
+class RemoteModel:
+  def __init__(self, url, timeout=default_remote_timeout):
+    self.url = str(url).rstrip("/") # URL of the server
+    self.timeout = timeout # seconds waiting for a response
+
+  #------------------------------------------------------------
+  # Function to obtain the information of the server: model,
+  # batching settings and statistics
+  #
+  # Params:
+  #        None
+  # Return:
+  #        dictionary with the information of the server
+  #------------------------------------------------------------
+  def info(self):
+    with urllib.request.urlopen(self.url + "/health", timeout=self.timeout) as response:
+      return json.loads(response.read())
+
+  #------------------------------------------------------------
+  # Function to predict a batch of tiles in the server
+  #
+  # Params:
+  #        inputs: float32 batch of tiles in range 0-1
+  #        batch_size: not used, the server chooses the batches
+  #        verbose: not used
+  # Return:
+  #        float32 predictions
+  #------------------------------------------------------------
+  def predict(self, inputs, batch_size=None, verbose=0):
+    body = io.BytesIO()
+    np.save(body, np.round(inputs * 255).astype(np.uint8))
+
+    request = urllib.request.Request(self.url + "/predict", data=body.getvalue(), headers={"Content-Type": "application/x-npy"})
+    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+      return np.load(io.BytesIO(response.read()))
+
+
+#------------------------------------------------------------
+# Function to obtain a copy of a keras model that computes in
+# float16 and keeps its variables in float32. The output layers
+# stay in float32 so the probabilities are not rounded. It is
+# faster on GPUs with tensor cores, usually slower on CPU.
+#
+# Params:
+#        model: keras model
+# Return:
+#        keras model with the mixed_float16 policy
+#------------------------------------------------------------
+def mixed_precision_model(model):
+  import keras # to use keras api
+
+  outputLayers = set(model.output_names) # names of the output layers
+
+  def clone_layer(layer):
+    config = layer.get_config()
+    if layer.name not in outputLayers and not isinstance(layer, keras.layers.InputLayer):
+      config["dtype"] = "mixed_float16"
+    return layer.__class__.from_config(config)
+
+  mixedModel = keras.models.clone_model(model, clone_function=clone_layer)
+  mixedModel.set_weights(model.get_weights())
+  return mixedModel
+
+
+#------------------------------------------------------------
+# Class to run a keras model with a tf.function traced once for
+# batches of tiles of any size. Unlike Model.predict no data
+# pipeline is built on each call, which is most of the time of the
+# small batches predicted by the tiling engine.
+#------------------------------------------------------------
+class KerasFunctionModel:
+  def __init__(self, model, jit_compile=False, mixed_precision=False, tile=(tile_height, tile_width, tile_channels)):
+    import tensorflow as tf # to trace the inference function
+
+    self.model = mixed_precision_model(model) if mixed_precision else model # keras model
+    self.jit_compile = jit_compile # the function is compiled with XLA
+    self.mixed_precision = mixed_precision # the model computes in float16
+    self.tile = tuple(tile) # (height, width, channels) of the input tiles
+
+    # the batch size is left free so the function is traced only once
+    signature = tf.TensorSpec((None,) + self.tile, tf.float32)
+    self.function = tf.function(lambda x: tf.cast(self.model(x, training=False), tf.float32), input_signature=[signature],
+                                jit_compile=jit_compile)
+    self.function.get_concrete_function()
+
+  #------------------------------------------------------------
+  # Function to predict a batch of tiles
+  #
+  # Params:
+  #        inputs: float32 batch of tiles in range 0-1
+  #        batch_size: not used, the whole batch is predicted at once
+  #        verbose: not used
+  # Return:
+  #        float32 predictions
+  #------------------------------------------------------------
+  def predict(self, inputs, batch_size=None, verbose=0):
+    return self.function(inputs).numpy()
+
+
+#------------------------------------------------------------
+# Function to load a segmentation model with the backend given by
+# the extension of the file (.keras/.h5, .tflite or .onnx), or the
+# model of a HoneySeg server given by its URL
+#
+# Params:
+#        path: path of the model or URL of the server
+#        num_threads: threads used by TFLite/ONNX. None for the
+#                     default of the runtime
+#        compiled: run keras models with a traced tf.function
+#                  instead of Model.predict
+#        jit_compile: compile the function of keras models with XLA
+#        mixed_precision: run keras models in float16
+#        tile: (height, width, channels) of the input tiles of the
+#              traced function of keras models
+# Return:
+#        model with a keras-like predict method
+#------------------------------------------------------------
+def load_model(path, num_threads=None, compiled=True, jit_compile=False, mixed_precision=False,
+               tile=(tile_height, tile_width, tile_channels)):
+  if is_remote(path):
+    return RemoteModel(path)
+
+  extension = os.path.splitext(str(path))[1].lower()
+
+  if extension == ".tflite":
+    return TFLiteModel(path, num_threads)
+
+  if extension == ".onnx":
+    return OnnxModel(path, num_threads)
+
+  import keras # to use keras api
+  import segmentation_models as sm # Segmentation Models: using `keras` framework.
+  model = keras.models.load_model(path)
+
+  if not compiled:
+    return model
+
+  return KerasFunctionModel(model, jit_compile, mixed_precision, tile)
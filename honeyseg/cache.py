@@ -0,0 +1,201 @@
+#------------------------------------------------------------
+# Persistent cache of segmentation masks. A mask is identified by
+# the hash of the content of the image file, the hash of the model
+# file and the segmentation settings, so the same photo segmented
+# with the same model and settings is read from the cache instead
+# of running the model again (e.g. to measure it again with a new
+# cm² per pixel reference).
+#
+# The masks are stored packed to 1 bit per pixel. The cache is
+# bounded in size: when it is full the least recently used masks
+# are removed.
+#------------------------------------------------------------
+import hashlib # to identify the images and models by their content
+import json # to build the key of the settings
+import os # to manage actions of the operating system
+import tempfile # to write the cached masks atomically
+import threading # the cache is shared by the stages of the pipeline
+import zipfile # to detect corrupt cached masks
+from pathlib import Path # to manage system paths (windows, linux, etc)
+import numpy as np # to make calculations
+
+from .core import (default_overlap, default_threshold, default_merge, default_window, tile_height, tile_width, pack_mask,
+                   unpack_mask)
+
+# folder of the cache, in the cache folder of the user
+default_cache_folder = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "honeyseg" / "masks"
+
+# maximum size of the cache in bytes
+default_cache_size = 1024 ** 3
+
+
+#------------------------------------------------------------
+# Function to obtain the hash of the content of a file
+#
+# Params:
+#        path: path of the file
+#        chunk_size: bytes read at once
+# Return:
+#        hexadecimal SHA-256 of the file
+#------------------------------------------------------------
+def file_hash(path, chunk_size=1024 * 1024):
+  digest = hashlib.sha256()
+
+  with open(path, "rb") as hashedFile:
+    chunk = hashedFile.read(chunk_size)
+    while chunk:
+      digest.update(chunk)
+      chunk = hashedFile.read(chunk_size)
+
+  return digest.hexdigest()
+
+
+#------------------------------------------------------------
+# Class with the cache of masks stored in a folder
+#------------------------------------------------------------
+class MaskCache:
+  def __init__(self, folder=default_cache_folder, max_size=default_cache_size):
+    self.folder = Path(folder) # folder where the masks are stored
+    self.max_size = max_size # maximum size of the cache in bytes
+    self.hits = 0 # masks read from the cache
+    self.misses = 0 # masks not found in the cache
+    self._hashes = {} # hashes of the files already hashed, by (path, modification time, size)
+    self._lock = threading.Lock()
+
+    os.makedirs(self.folder, exist_ok=True)
+
+  #------------------------------------------------------------
+  # Internal class function to obtain the hash of a file. Hashes
+  # are remembered while the file is not modified, so large model
+  # files are only read once.
+  #------------------------------------------------------------
+  def _file_hash(self, path):
+    path = Path(path).resolve()
+    stat = os.stat(path)
+    fileKey = (str(path), stat.st_mtime, stat.st_size)
+
+    with self._lock:
+      digest = self._hashes.get(fileKey)
+    if digest is None:
+      digest = file_hash(path)
+      with self._lock:
+        self._hashes[fileKey] = digest
+
+    return digest
+
+  #------------------------------------------------------------
+  # Function to obtain the key of the mask of an image
+  #
+  # Params:
+  #        image_path: path of the image
+  #        model_path: path of the model (.keras, .tflite or .onnx)
+  #        overlap, threshold, merge, window, prefilter: settings of
+  #                 the tiling, see segment_tiles
+  #        coarse_scale: scale of the coarse-to-fine mode, see
+  #                      segment_image
+  #        tile: (height, width) of the tiles of the model
+  # Return:
+  #        key of the mask
+  #------------------------------------------------------------
+  def key(self, image_path, model_path, overlap=default_overlap, threshold=default_threshold, merge=default_merge,
+          window=default_window, prefilter=None, coarse_scale=None, tile=(tile_height, tile_width)):
+    settings = {"tile": list(tile[:2]), "overlap": overlap, "threshold": threshold, "merge": merge, "window": window,
+                "prefilter": prefilter, "coarse_scale": coarse_scale}
+    description = {"image": self._file_hash(image_path), "model": self._file_hash(model_path), "settings": settings}
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+  def _path(self, key):
+    return self.folder / (key + ".npz")
+
+  #------------------------------------------------------------
+  # Function to read a mask from the cache. A corrupt mask (e.g. a
+  # file truncated when the disk was full) is removed.
+  #
+  # Params:
+  #        key: key of the mask, see key
+  # Return:
+  #        single channel mask (uint8), None if it is not cached
+  #------------------------------------------------------------
+  def get(self, key):
+    path = self._path(key)
+
+    try:
+      with np.load(path) as cached:
+        mask = unpack_mask(cached["mask"], int(cached["width"]))
+      os.utime(path) # the modification time is the last use, for the LRU eviction
+    except OSError:
+      self.misses += 1
+      return None
+    except (zipfile.BadZipFile, EOFError, KeyError, ValueError):
+      try:
+        path.unlink()
+      except OSError:
+        pass
+      self.misses += 1
+      return None
+
+    self.hits += 1
+    return mask
+
+  #------------------------------------------------------------
+  # Function to store a mask in the cache. The least recently
+  # used masks are removed if the cache exceeds its size.
+  #
+  # Params:
+  #        key: key of the mask, see key
+  #        mask: single channel mask
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def put(self, key, mask):
+    # the mask is written to a temporary file first, so a mask is never read half written
+    descriptor, temporaryPath = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+    with os.fdopen(descriptor, "wb") as cachedFile:
+      np.savez(cachedFile, mask=pack_mask(mask), width=mask.shape[1])
+    os.replace(temporaryPath, self._path(key))
+
+    self.evict()
+
+  #------------------------------------------------------------
+  # Function to remove the least recently used masks until the
+  # cache fits in its maximum size
+  #
+  # Params:
+  #        None
+  # Return:
+  #        number of removed masks
+  #------------------------------------------------------------
+  def evict(self):
+    entries = []
+    for path in self.folder.glob("*.npz"):
+      try:
+        stat = path.stat()
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, path))
+
+    size = sum(entry[1] for entry in entries)
+    removed = 0
+    for _, entrySize, path in sorted(entries):
+      if size <= self.max_size:
+        break
+      try:
+        path.unlink()
+      except OSError:
+        continue
+      size -= entrySize
+      removed += 1
+
+    return removed
+
+  #------------------------------------------------------------
+  # Function to remove all the masks of the cache
+  #
+  # Params:
+  #        None
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def clear(self):
+    for path in self.folder.glob("*.npz"):
+      path.unlink(missing_ok=True)
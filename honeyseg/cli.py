@@ -0,0 +1,308 @@
+#------------------------------------------------------------
+# Command line interface to segment honey in batches of images
+# without the graphical interface.
+#
+# Usage:
+#        python -m honeyseg INPUT [INPUT ...] --output DIR
+#               --cm2-per-pixel VALUE [--model PATH]
+#
+# Each INPUT may be an image, a directory or a glob pattern. The
+# mask of every image is written to the output directory and the
+# area of honey of all the images to a CSV file.
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import csv # to write the areas of honey
+import glob # to expand the glob patterns of the inputs
+import os # to manage actions of the operating system
+import sys # to write the errors
+from pathlib import Path # to manage system paths (windows, linux, etc)
+
+from .backends import backends, default_backend, artifact_path, is_remote
+from .cache import MaskCache, default_cache_folder, default_cache_size
+from .core import check_overlap, default_overlap, default_merge, default_prefilter, default_coarse_scale
+from .instrumentation import Instrumentation, profile_modes, profile_env, metrics_env, default_profile_output
+from .models import ModelManager
+from .pipeline import process_images
+from .streaming import stream_images
+from .workers import WorkerPool, autotune_workers, configure_threads
+
+# supported image formats
+valid_images_format = [".jpg", ".jpeg", ".png", ".tif", ".tiff", ".npy"]
+
+# default path of the segmentation model
+default_model_path = Path("defaults/honeyModels/efficientnetb2-FPN.keras")
+
+
+#------------------------------------------------------------
+# Function to obtain the list of images to process
+#
+# Params:
+#        inputs: list of images, directories or glob patterns
+# Return:
+#        sorted list of paths of images without duplicates
+#------------------------------------------------------------
+def find_images(inputs):
+  images = set()
+
+  for entry in inputs:
+    if os.path.isdir(entry):
+      candidates = [os.path.join(entry, f) for f in os.listdir(entry)]
+    elif os.path.isfile(entry):
+      candidates = [entry]
+    else:
+      candidates = glob.glob(entry, recursive=True)
+
+    for candidate in candidates:
+      if os.path.isfile(candidate) and os.path.splitext(candidate)[1].lower() in valid_images_format:
+        images.add(Path(candidate))
+
+  return sorted(images)
+
+
+#------------------------------------------------------------
+# Function to parse the shard of the images processed by this
+# process, given as "K/N" (shard K of N, starting at 1)
+#
+# Params:
+#        value: text of the shard
+# Return:
+#        (K, N)
+#------------------------------------------------------------
+def parse_shard(value):
+  try:
+    index, count = (int(v) for v in value.split("/"))
+  except ValueError:
+    raise argparse.ArgumentTypeError("shard must be given as K/N")
+
+  if count < 1 or not 1 <= index <= count:
+    raise argparse.ArgumentTypeError("shard must satisfy 1 <= K <= N")
+
+  return index, count
+
+
+#------------------------------------------------------------
+# Function to parse the overlap between tiles
+#
+# Params:
+#        value: text of the overlap
+# Return:
+#        overlap in range [0, 1)
+#------------------------------------------------------------
+def parse_overlap(value):
+  try:
+    overlap = float(value)
+    check_overlap(overlap)
+  except ValueError:
+    raise argparse.ArgumentTypeError("overlap must be a number in range [0, 1)")
+
+  return overlap
+
+
+#------------------------------------------------------------
+# Function to parse the number of worker processes, a number or
+# "auto" to choose it with autotune_workers
+#
+# Params:
+#        value: text of the number of processes
+# Return:
+#        number of processes or "auto"
+#------------------------------------------------------------
+def parse_processes(value):
+  if value == "auto":
+    return value
+
+  try:
+    processes = int(value)
+  except ValueError:
+    raise argparse.ArgumentTypeError("processes must be a number or auto")
+
+  if processes < 1:
+    raise argparse.ArgumentTypeError("processes must be at least 1")
+
+  return processes
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(prog="honeyseg", description="Segment honey in photographs of honeycombs")
+  parser.add_argument("inputs", nargs="+", help="images, directories or glob patterns to process")
+  parser.add_argument("-o", "--output", required=True, help="directory where the masks and the CSV are written")
+  parser.add_argument("--cm2-per-pixel", type=float, required=True, help="surface of a pixel in cm2")
+  parser.add_argument("--model", default=str(default_model_path), help="path to the keras segmentation model, or URL of a HoneySeg server (python -m honeyseg.server)")
+  parser.add_argument("--backend", choices=backends, default=default_backend, help="inference backend, the exported model must exist next to --model (default: {})".format(default_backend))
+  parser.add_argument("--no-compile", dest="compiled", action="store_false", help="run keras models with Model.predict instead of a traced tf.function")
+  parser.add_argument("--jit", action="store_true", help="compile the inference function of keras models with XLA")
+  parser.add_argument("--mixed-precision", action="store_true", help="run keras models in float16 (faster on GPUs with tensor cores, usually slower on CPU)")
+  parser.add_argument("--processes", type=parse_processes, default=1, help="processes running the model, each one with its own model; the tiles of every batch are split between them. auto measures several processes x threads splits and uses the fastest (default: 1, in this process)")
+  parser.add_argument("--threads", type=int, default=None, help="threads of the model runtime in each process (default: cores / processes)")
+  parser.add_argument("--batch-size", type=int, default=None, help="tiles predicted at once (default: from the available memory)")
+  parser.add_argument("--overlap", type=parse_overlap, default=default_overlap, help="overlap between tiles in range [0, 1) (default: {})".format(default_overlap))
+  parser.add_argument("--merge", choices=["blend", "or"], default=default_merge, help="merge of overlapping tiles (default: {})".format(default_merge))
+  parser.add_argument("--prefilter", type=float, nargs="?", const=default_prefilter, default=None, metavar="SCORE",
+                      help="skip the tiles with less than SCORE of honey coloured pixels (default when given: {})".format(default_prefilter))
+  parser.add_argument("--coarse-to-fine", dest="coarse_scale", type=float, nargs="?", const=default_coarse_scale, default=None,
+                      metavar="SCALE",
+                      help="segment the image downscaled by SCALE first and only refine at full resolution the tiles with boundaries (default when given: {})".format(default_coarse_scale))
+  parser.add_argument("--area-only", action="store_true", help="only measure the area of honey, counting the pixels of every tile without building the masks (no masks are written)")
+  parser.add_argument("--mask-format", default=None, help="image format of the masks (default: png, npy with --streaming)")
+  parser.add_argument("--csv", default=None, help="path of the CSV file (default: OUTPUT/honey-areas.csv)")
+  parser.add_argument("--save-highlighted", action="store_true", help="also save the images with the honey highlighted")
+  parser.add_argument("--streaming", action="store_true", help="read the images in bands and write the results band by band, for images too large for the memory (.npy/TIFF inputs are read without decoding them in full; masks are written as npy or tif)")
+  parser.add_argument("--cache", nargs="?", const=str(default_cache_folder), default=None, metavar="DIR",
+                      help="reuse the masks of images already segmented with the same model and settings (default folder when given: {})".format(default_cache_folder))
+  parser.add_argument("--cache-size", type=float, default=default_cache_size / 1024 ** 2, help="maximum size of the cache in MB (default: {:.0f})".format(default_cache_size / 1024 ** 2))
+  parser.add_argument("--decode-workers", type=int, default=2, help="threads decoding images (default: 2)")
+  parser.add_argument("--encode-workers", type=int, default=2, help="threads writing the results (default: 2)")
+  parser.add_argument("--queue-size", type=int, default=2, help="images waiting between two stages of the pipeline (default: 2)")
+  parser.add_argument("--shard", type=parse_shard, default=(1, 1), help="process only the shard K of N of the images, to run N processes in parallel")
+  parser.add_argument("--metrics", default=None, help="JSON lines file where the time of each stage of every image is written (default: ${})".format(metrics_env))
+  parser.add_argument("--profile", nargs="+", choices=profile_modes, default=None, help="profile the process with cProfile and/or tracemalloc (default: ${})".format(profile_env))
+  parser.add_argument("--profile-output", default=default_profile_output, help="file of the cProfile statistics (default: {})".format(default_profile_output))
+  return parser
+
+
+def main(argv=None):
+  args = build_parser().parse_args(argv)
+
+  images = find_images(args.inputs)
+  index, count = args.shard
+  images = images[index-1::count]
+
+  if not images:
+    print("No images found", file=sys.stderr)
+    return 1
+
+  if args.streaming and args.mask_format not in (None, "npy", "tif", "tiff"):
+    print("--streaming writes the masks as npy, tif or tiff", file=sys.stderr)
+    return 1
+
+  if args.streaming and (args.coarse_scale is not None or args.cache):
+    print("--streaming can not be used with --coarse-to-fine or --cache", file=sys.stderr)
+    return 1
+
+  if args.area_only and (args.streaming or args.coarse_scale is not None or args.save_highlighted):
+    print("--area-only can not be used with --streaming, --coarse-to-fine or --save-highlighted", file=sys.stderr)
+    return 1
+
+  outputFolder = Path(args.output)
+  os.makedirs(outputFolder, exist_ok=True)
+
+  # every shard writes its own CSV so that parallel processes do not share a file
+  csvPath = args.csv
+  if csvPath is None:
+    csvName = "honey-areas.csv" if count == 1 else "honey-areas_{}-of-{}.csv".format(index, count)
+    csvPath = outputFolder / csvName
+
+  instrumentation = Instrumentation.from_environment(args.metrics, args.profile, args.profile_output)
+  try:
+    return instrumentation.profiled(process)(args, images, csvPath, outputFolder, instrumentation)
+  finally:
+    instrumentation.close()
+
+
+#------------------------------------------------------------
+# Function to process the images and write the CSV
+#
+# Params:
+#        args: parsed command line arguments
+#        images: paths of the images of this shard
+#        csvPath: path of the CSV file
+#        outputFolder: folder of the masks
+#        instrumentation: Instrumentation of the process
+# Return:
+#        exit code, 1 if an image failed
+#------------------------------------------------------------
+def process(args, images, csvPath, outputFolder, instrumentation):
+  modelPath = artifact_path(args.model, args.backend)
+  loadOptions = dict(compiled=args.compiled, jit_compile=args.jit, mixed_precision=args.mixed_precision)
+
+  if args.processes == 1:
+    if args.threads:
+      configure_threads(args.threads)
+    manager = ModelManager(num_threads=args.threads, **loadOptions)
+    model = manager.get(modelPath)
+    instrumentation.model_loaded(manager)
+    batchSize = args.batch_size
+  else:
+    model = open_worker_pool(args, modelPath, loadOptions, instrumentation)
+    batchSize = args.batch_size or model.batch_size
+
+  try:
+    return write_results(args, images, csvPath, outputFolder, instrumentation, model, modelPath, batchSize)
+  finally:
+    if isinstance(model, WorkerPool):
+      model.close()
+
+
+#------------------------------------------------------------
+# Function to start the pool of worker processes. With --processes
+# auto the split of the cores is chosen with autotune_workers.
+#
+# Params:
+#        args: parsed command line arguments
+#        modelPath: path of the model
+#        loadOptions: options of load_model
+#        instrumentation: Instrumentation of the process
+# Return:
+#        WorkerPool
+#------------------------------------------------------------
+def open_worker_pool(args, modelPath, loadOptions, instrumentation):
+  processes, threads = args.processes, args.threads
+
+  if processes == "auto":
+    def report(result):
+      print("autotune: {processes} processes x {threads} threads: {tiles_per_second:.2f} tiles/s".format(**result), file=sys.stderr)
+
+    best, results = autotune_workers(modelPath, callback=report, keep_pool=True, **loadOptions)
+    instrumentation.emit({"autotune": results}, event="autotune")
+    return best["pool"]
+
+  return WorkerPool(modelPath, processes, threads, **loadOptions)
+
+
+#------------------------------------------------------------
+# Function to segment the images with a loaded model and write
+# the CSV
+#
+# Params:
+#        args: parsed command line arguments
+#        images: paths of the images of this shard
+#        csvPath: path of the CSV file
+#        outputFolder: folder of the masks
+#        instrumentation: Instrumentation of the process
+#        model: segmentation model or WorkerPool
+#        modelPath: path of the model, to identify it in the cache
+#        batchSize: tiles predicted at once
+# Return:
+#        exit code, 1 if an image failed
+#------------------------------------------------------------
+def write_results(args, images, csvPath, outputFolder, instrumentation, model, modelPath, batchSize):
+  # the masks of a server model can not be identified by the model file
+  cache = MaskCache(args.cache, int(args.cache_size * 1024 ** 2)) if args.cache and not is_remote(modelPath) else None
+  failures = 0
+
+  with open(csvPath, "w", newline="") as csvFile:
+    writer = csv.writer(csvFile)
+    writer.writerow(["image", "width", "height", "honey_pixels", "area_cm2"])
+
+    if args.streaming:
+      results = stream_images(images, model, args.cm2_per_pixel, output_folder=outputFolder, mask_format=args.mask_format or "npy",
+                              save_highlighted=args.save_highlighted, batch_size=batchSize, overlap=args.overlap,
+                              merge=args.merge, prefilter=args.prefilter, instrumentation=instrumentation)
+    else:
+      results = process_images(images, model, args.cm2_per_pixel, output_folder=outputFolder, mask_format=args.mask_format or "png",
+                               save_highlighted=args.save_highlighted, batch_size=batchSize, overlap=args.overlap,
+                               merge=args.merge, prefilter=args.prefilter, coarse_scale=args.coarse_scale,
+                               decode_workers=args.decode_workers, encode_workers=args.encode_workers, queue_size=args.queue_size,
+                               instrumentation=instrumentation, cache=cache, model_path=modelPath, area_only=args.area_only)
+
+    for result in results:
+      if result.error is not None:
+        print("{}: {}".format(result.path, result.error), file=sys.stderr)
+        failures += 1
+        continue
+
+      writer.writerow([str(result.path), result.width, result.height, result.honey_pixels, result.area])
+      csvFile.flush()
+      print("{}: {} cm²".format(result.path, result.area))
+
+  return 1 if failures else 0
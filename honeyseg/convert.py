@@ -0,0 +1,210 @@
+#------------------------------------------------------------
+# Export of the keras segmentation model to faster inference
+# formats, and parity check of the exported models against the
+# keras model.
+#
+# Usage:
+#        python -m honeyseg.convert MODEL [--variants float32 float16 int8 onnx]
+#               [--calibration-images DIR] [--check-images IMAGE ...]
+#
+# The exported models are written next to the keras model with the
+# names expected by honeyseg.backends.artifact_path, e.g.
+# efficientnetb2-FPN.int8.tflite. The int8 variant is calibrated
+# with tiles of the calibration images. ONNX export needs tf2onnx.
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import sys # to write the errors
+import time # to measure the inference time
+from pathlib import Path # to manage system paths (windows, linux, etc)
+import numpy as np # to make calculations
+
+from .backends import artifact_path, load_model
+from .cli import find_images
+from .core import tile_height, tile_width, tile_channels, tile_points, fill_batch, segment_image, honey_pixels, mask_iou
+from .image import ImageBuffer
+
+# variants that can be exported
+variants = ("float32", "float16", "int8", "onnx")
+
+
+#------------------------------------------------------------
+# Function to obtain tiles to calibrate the int8 quantization.
+# Tiles are taken uniformly from all the tiles of the images.
+#
+# Params:
+#        image_paths: paths of the calibration images
+#        count: number of tiles
+#        seed: seed of the random choice of the tiles
+# Return:
+#        generator of float32 batches of one tile
+#------------------------------------------------------------
+def calibration_tiles(image_paths, count, seed=0):
+  tiles = []
+  for path in image_paths:
+    img = ImageBuffer.read(path)
+    for point in tile_points(img.height, img.width, tile_height, tile_width):
+      tiles.append((path, point))
+
+  rng = np.random.default_rng(seed)
+  chosen = sorted(rng.choice(len(tiles), size=min(count, len(tiles)), replace=False))
+
+  batch = np.empty((1, tile_height, tile_width, tile_channels), dtype=np.float32)
+  img = None
+  for index in chosen:
+    path, point = tiles[index]
+    if img is None or img.path != Path(path):
+      img = ImageBuffer.read(path)
+    yield fill_batch(img.array, [point], tile_height, tile_width, batch, img.channel_order).copy()
+
+
+#------------------------------------------------------------
+# Function to export a keras model to TFLite
+#
+# Params:
+#        model: keras segmentation model
+#        output_path: path of the .tflite file
+#        variant: "float32", "float16" or "int8"
+#        calibration_images: paths of the images used to calibrate
+#                            the int8 quantization
+#        calibration_count: number of calibration tiles
+# Return:
+#        None
+#------------------------------------------------------------
+def export_tflite(model, output_path, variant, calibration_images=None, calibration_count=100):
+  import tensorflow as tf # to use the TFLite converter
+
+  # the batch size is left free so the interpreter can be resized to any batch
+  signature = tf.TensorSpec((None, tile_height, tile_width, tile_channels), tf.float32)
+  function = tf.function(lambda x: model(x, training=False)).get_concrete_function(signature)
+  converter = tf.lite.TFLiteConverter.from_concrete_functions([function], model)
+
+  if variant == "float16":
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+  elif variant == "int8":
+    if not calibration_images:
+      raise ValueError("int8 quantization needs calibration images")
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: ([tile] for tile in calibration_tiles(calibration_images, calibration_count))
+    # int8 kernels with float32 inputs and outputs, so the tiling engine does not change
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+  elif variant != "float32":
+    raise ValueError("Unknown TFLite variant: " + str(variant))
+
+  with open(output_path, "wb") as tfliteFile:
+    tfliteFile.write(converter.convert())
+
+
+#------------------------------------------------------------
+# Function to export a keras model to ONNX (needs tf2onnx)
+#
+# Params:
+#        model: keras segmentation model
+#        output_path: path of the .onnx file
+# Return:
+#        None
+#------------------------------------------------------------
+def export_onnx(model, output_path):
+  import tensorflow as tf # to define the input signature
+  import tf2onnx # optional dependency, only needed to export to ONNX
+
+  signature = [tf.TensorSpec((None, tile_height, tile_width, tile_channels), tf.float32, name="input")]
+  tf2onnx.convert.from_keras(model, input_signature=signature, opset=13, output_path=str(output_path))
+
+
+#------------------------------------------------------------
+# Function to compare the masks of a model with the masks of a
+# reference model (usually the keras model)
+#
+# Params:
+#        reference: reference segmentation model
+#        candidate: segmentation model to check
+#        image_paths: images to segment with both models
+#        **segment_options: options of segment_image
+# Return:
+#        list with a dictionary per image with the IoU of the
+#        masks, the honey pixels of both models, the difference
+#        of area in % and the time of both models
+#------------------------------------------------------------
+def parity_check(reference, candidate, image_paths, **segment_options):
+  report = []
+
+  for path in image_paths:
+    img = ImageBuffer.read(path)
+
+    start = time.perf_counter()
+    referenceMask = segment_image(img, reference, **segment_options)
+    referenceTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidateMask = segment_image(img, candidate, **segment_options)
+    candidateTime = time.perf_counter() - start
+
+    referencePixels = honey_pixels(referenceMask)
+    candidatePixels = honey_pixels(candidateMask)
+    difference = 100.0 * (candidatePixels - referencePixels) / referencePixels if referencePixels else 0.0
+
+    report.append({
+      "image": str(path),
+      "iou": mask_iou(candidateMask, referenceMask),
+      "reference_pixels": referencePixels,
+      "candidate_pixels": candidatePixels,
+      "area_difference_percent": difference,
+      "reference_time": referenceTime,
+      "candidate_time": candidateTime,
+    })
+
+  return report
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="python -m honeyseg.convert", description="Export the keras segmentation model to TFLite/ONNX")
+  parser.add_argument("model", help="path to the keras model")
+  parser.add_argument("--variants", nargs="+", choices=variants, default=None, help="formats to export (default: float32 float16, and int8 with --calibration-images)")
+  parser.add_argument("--calibration-images", nargs="+", default=[], help="images, directories or glob patterns used to calibrate the int8 quantization")
+  parser.add_argument("--calibration-tiles", type=int, default=100, help="number of calibration tiles (default: 100)")
+  parser.add_argument("--check-images", nargs="+", default=[], help="images, directories or glob patterns used to compare the exported models with the keras model")
+  args = parser.parse_args(argv)
+
+  calibrationImages = find_images(args.calibration_images)
+  checkImages = find_images(args.check_images)
+
+  # int8 is only exported by default when there are images to calibrate it
+  if args.variants is None:
+    args.variants = ["float32", "float16"]
+    if calibrationImages:
+      args.variants.append("int8")
+    else:
+      print("int8: skipped, it needs --calibration-images", file=sys.stderr)
+
+  reference = load_model(args.model, compiled=False) # the converters need the keras model
+  exported = []
+
+  for variant in args.variants:
+    backend = "onnx" if variant == "onnx" else "tflite-" + variant
+    outputPath = artifact_path(args.model, backend)
+
+    try:
+      if variant == "onnx":
+        export_onnx(reference, outputPath)
+      else:
+        export_tflite(reference, outputPath, variant, calibrationImages, args.calibration_tiles)
+    except Exception as e:
+      print("{}: {}".format(variant, e), file=sys.stderr)
+      continue
+
+    print("{}: {}".format(variant, outputPath))
+    exported.append((variant, outputPath))
+
+  if checkImages:
+    print("variant | image | IoU | area difference (%) | keras time (s) | time (s)")
+    for variant, outputPath in exported:
+      for row in parity_check(reference, load_model(outputPath), checkImages):
+        print("{} | {} | {:.4f} | {:+.3f} | {:.2f} | {:.2f}".format(variant, row["image"], row["iou"], row["area_difference_percent"],
+                                                                   row["reference_time"], row["candidate_time"]))
+
+  return 0 if len(exported) == len(args.variants) else 1
+
+
+if __name__ == "__main__":
+  sys.exit(main())
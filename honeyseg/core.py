@@ -0,0 +1,819 @@
+#------------------------------------------------------------
+# HoneySeg segmentation core. Tiling, inference, merge and area
+# computation, independent of the graphical interface.
+#------------------------------------------------------------
+import os # to manage actions of the operating system
+import cv2 # opencv library to process images
+import numpy as np # to make calculations
+
+from .image import ImageBuffer, channel_orders, convert_channel_order
+from .instrumentation import null_recorder
+
+#------------------------------------------------------------
+# Segmentation settings
+#------------------------------------------------------------
+
+# batch size used when the available memory can not be found
+default_batch_size = 4
+
+# estimated memory used by a tile during the inference, as a multiple of its float32 input
+tile_memory_factor = 64
+
+# height, width and channels of the tiles processed by the segmentation model
+tile_height = 640
+tile_width = 640
+tile_channels = 3
+
+# probability from which a pixel contains honey
+default_threshold = 0.5
+
+# pertentage of overlaping between tiles, specified in range 0-1
+default_overlap = 0.25
+
+# how the predictions of overlapping tiles are merged: "blend" weights the
+# probabilities with default_window before thresholding, "or" joins the
+# thresholded tiles
+default_merge = "blend"
+
+# weighting window used to blend the probabilities of overlapping tiles
+default_window = "cosine"
+
+# minimum fraction of honey coloured pixels for a tile to be predicted when
+# the prefilter is enabled. Tiles below it are taken as without honey
+default_prefilter = 0.05
+
+# HSV range (opencv scale) of the colours of honey and comb, from amber to pale
+# yellow, and downscale factor of the tiles used to compute the prefilter score
+prefilter_hsv_low = (8, 50, 70)
+prefilter_hsv_high = (38, 255, 255)
+prefilter_scale = 8
+
+# scale of the first pass of the coarse-to-fine mode, and margin in pixels
+# (full resolution) around a tile where the coarse mask must be uniform for
+# the tile to be taken from the coarse pass
+default_coarse_scale = 0.25
+default_refine_margin = 32
+
+#------------------------------------------------------------
+# Exception raised when the segmentation of an image is cancelled
+#------------------------------------------------------------
+class SegmentationCancelled(Exception):
+  pass
+
+#------------------------------------------------------------
+# Function to check the overlap between tiles. With an overlap of
+# 1 or more the tiles never advance, and with a negative overlap
+# some pixels are left between the tiles.
+#
+# Params:
+#        overlap: pertentage of overlaping between tiles points.
+# Return:
+#        None, ValueError is raised if it is not in range [0, 1)
+#------------------------------------------------------------
+def check_overlap(overlap):
+  if not 0 <= overlap < 1:
+    raise ValueError("The overlap must be in range [0, 1): " + str(overlap))
+
+#------------------------------------------------------------
+# Auxiliary function to split/merge the images. This function 
+# find the pints where is necesary to split or merge the img
+#
+# Params:
+#        size: original size
+#        split_size: desired size
+#        overlap: pertentage of overlaping between tiles points. 
+#                 Specified in range 0-1.
+# Return:
+#        List of points where each tile begins
+#------------------------------------------------------------
+def start_points(size, split_size, overlap=0):
+  check_overlap(overlap)
+  points = [0]
+  stride = max(1, int(split_size * (1-overlap))) # overlaps close to 1 advance at least a pixel
+  counter = 1
+
+  while True:
+    pt = stride * counter
+
+    if pt + split_size >= size:
+      if split_size == size:
+        break
+      points.append(size - split_size)
+      break
+
+    else:
+      points.append(pt)
+    counter += 1
+  return points
+
+#------------------------------------------------------------
+# Auxiliary function to obtain the top-left corner of every tile
+# of an image. The tiles are listed row by row, which is the order
+# used to process and merge them.
+#
+# Params:
+#        img_h: height of the image
+#        img_w: width of the image
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        overlap: pertentage of overlaping between tiles points.
+#                 Specified in range 0-1.
+# Return:
+#        List of (y, x) points where each tile begins
+#------------------------------------------------------------
+def tile_points(img_h, img_w, split_height, split_width, overlap=default_overlap):
+  X_points = start_points(img_w, split_width, overlap)
+  Y_points = start_points(img_h, split_height, overlap)
+
+  return [(i, j) for i in Y_points for j in X_points]
+
+#------------------------------------------------------------
+# Auxiliary function to obtain the memory available in the system.
+# It uses /proc/meminfo when possible (it takes into account the
+# memory that can be reclaimed from caches) and the free physical
+# pages otherwise.
+#
+# Params:
+#        None
+# Return:
+#        available memory in bytes or None if it is not known
+#------------------------------------------------------------
+def available_memory():
+  try:
+    with open("/proc/meminfo") as meminfo:
+      for line in meminfo:
+        if line.startswith("MemAvailable:"):
+          return int(line.split()[1]) * 1024
+  except OSError:
+    pass
+
+  try:
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+  except (ValueError, OSError, AttributeError):
+    return None
+
+#------------------------------------------------------------
+# Auxiliary function to choose the number of tiles processed in a
+# single inference. The memory needed by a tile is estimated as
+# a multiple of its float32 input to account for the activations
+# of the network.
+#
+# Params:
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        channels: channels of a tile
+#        max_batch_size: upper bound of the batch size
+#        memory_fraction: fraction of the available memory that
+#                         can be used by a batch
+# Return:
+#        batch size between 1 and max_batch_size
+#------------------------------------------------------------
+def auto_batch_size(split_height, split_width, channels=3, max_batch_size=16, memory_fraction=0.5):
+  freeMemory = available_memory()
+  if freeMemory is None:
+    return default_batch_size
+
+  tileMemory = split_height * split_width * channels * 4 * tile_memory_factor
+  batch_size = int(freeMemory * memory_fraction // tileMemory)
+
+  return max(1, min(max_batch_size, batch_size))
+
+#------------------------------------------------------------
+# Auxiliary function to copy a set of tiles into a batch in the
+# input format of the segmentation model: float32 RGB values in
+# range 0-1. BGR images are reversed while they are copied, so
+# the image itself never needs to be converted.
+#
+# Params:
+#        img: image (uint8)
+#        points: list of (y, x) points where each tile begins
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        batch: float32 buffer with room for at least len(points)
+#               tiles
+#        channel_order: "RGB" or "BGR", channel order of img
+# Return:
+#        view of the batch with the tiles of points
+#------------------------------------------------------------
+def fill_batch(img, points, split_height, split_width, batch, channel_order="RGB"):
+  if channel_order not in channel_orders:
+    raise ValueError("Unknown channel order: " + str(channel_order))
+
+  for k, (i, j) in enumerate(points):
+    tile = img[i:i+split_height, j:j+split_width]
+    batch[k] = tile if channel_order == "RGB" else tile[:, :, ::-1]
+
+  inputs = batch[:len(points)]
+  np.divide(inputs, 255.0, out=inputs)
+
+  return inputs
+
+#------------------------------------------------------------
+# Function to obtain the prefilter score of a tile: the fraction
+# of its pixels with the colour of honey or comb. It is computed
+# on a downscaled copy of the tile, so it is much cheaper than the
+# segmentation model. Background, sky, vegetation or dark tiles
+# score close to 0. Brown and tan wood (the frames of the combs)
+# and brown soil have the hue and saturation of amber honey, so
+# their tiles score high and are predicted: a narrower range would
+# skip the tiles of dark honey too.
+#
+# Params:
+#        tile: tile of the image (uint8)
+#        channel_order: "RGB" or "BGR", channel order of tile
+# Return:
+#        score in range 0-1
+#------------------------------------------------------------
+def tile_honey_score(tile, channel_order="RGB"):
+  height = max(1, tile.shape[0] // prefilter_scale)
+  width = max(1, tile.shape[1] // prefilter_scale)
+  small = cv2.resize(tile, (width, height), interpolation=cv2.INTER_AREA)
+
+  hsv = cv2.cvtColor(small, cv2.COLOR_RGB2HSV if channel_order == "RGB" else cv2.COLOR_BGR2HSV)
+  honeyColour = cv2.inRange(hsv, prefilter_hsv_low, prefilter_hsv_high)
+
+  return cv2.countNonZero(honeyColour) / honeyColour.size
+
+#------------------------------------------------------------
+# Function to split the tiles of an image in the tiles that must
+# be predicted and the tiles that can not contain honey
+#
+# Params:
+#        img: image (uint8)
+#        points: list of (y, x) points where each tile begins
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        threshold: minimum score of a tile to be predicted, see
+#                   tile_honey_score
+#        channel_order: "RGB" or "BGR", channel order of img
+# Return:
+#        (points to predict, skipped points)
+#------------------------------------------------------------
+def prefilter_tiles(img, points, split_height, split_width, threshold=default_prefilter, channel_order="RGB"):
+  kept = []
+  skipped = []
+
+  for i, j in points:
+    score = tile_honey_score(img[i:i+split_height, j:j+split_width], channel_order)
+    (kept if score >= threshold else skipped).append((i, j))
+
+  return kept, skipped
+
+#------------------------------------------------------------
+# Auxiliary function to obtain the weights used to blend the
+# probabilities of overlapping tiles. The weights decrease towards
+# the borders of the tile, where the predictions are less reliable,
+# but never reach zero so that pixels covered by a single tile
+# keep their prediction.
+#
+# Params:
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        window: "cosine" (squared sine), "gaussian" or "uniform"
+# Return:
+#        float32 array of shape (split_height, split_width)
+#------------------------------------------------------------
+def blend_window(split_height, split_width, window=default_window):
+  def profile(n):
+    x = (np.arange(n) + 0.5) / n
+
+    if window == "cosine":
+      weights = np.sin(np.pi * x) ** 2
+    elif window == "gaussian":
+      weights = np.exp(-0.5 * ((x - 0.5) / 0.25) ** 2)
+    elif window == "uniform":
+      weights = np.ones(n)
+    else:
+      raise ValueError("Unknown blend window: " + str(window))
+
+    return np.maximum(weights, 1e-3)
+
+  return np.outer(profile(split_height), profile(split_width)).astype(np.float32)
+
+#------------------------------------------------------------
+# Tiling engine. Split an image into tiles, predict the tiles in
+# batches and write the predictions straight into the output mask.
+# The tiles are views of the decoded image, so no temporary files
+# are needed.
+#
+# Params:
+#        img: image (uint8)
+#        model: keras segmentation model
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        overlap: pertentage of overlaping between tiles points.
+#        threshold: probability from which a pixel contains honey
+#        batch_size: tiles predicted at once. None to choose it
+#                    from the available memory
+#        callback: optional function called as callback(done, total)
+#                  after each batch is processed
+#        channel_order: "RGB" or "BGR", channel order of img
+#        merge: "blend" to accumulate the probabilities of the tiles
+#               weighted by window and threshold them once, "or" to
+#               join the thresholded tiles
+#        window: weighting window of the blend, see blend_window
+#        cancel: optional threading.Event. When it is set the
+#                process stops after the current batch raising
+#                SegmentationCancelled
+#        out: optional mask (zeros, height x width uint8) to write
+#             the predictions into. It can be read while the image
+#             is processed to show partial results
+#        recorder: optional Recorder (see honeyseg.instrumentation)
+#                  that measures the split, predict and merge stages
+#                  and counts the processed and skipped tiles
+#        prefilter: minimum score (see tile_honey_score) of a tile
+#                   to be predicted. The other tiles are merged as
+#                   tiles without honey. None to predict all tiles
+#        points: optional list of (y, x) points of the tiles to
+#                process. None for all the tiles of the grid
+#        evidence: optional float32 array (height x width) where the
+#                  blend evidence is accumulated, to continue the
+#                  evidence of previous calls (see honeyseg.streaming)
+# Return:
+#        single channel mask (uint8) with the height and width of
+#        the image. Pixels with honey are 255, the rest 0.
+#------------------------------------------------------------
+def segment_tiles(img, model, split_height, split_width, overlap=default_overlap, threshold=default_threshold, batch_size=None,
+                  callback=None, channel_order="RGB", merge=default_merge, window=default_window, cancel=None, out=None,
+                  recorder=None, prefilter=None, points=None, evidence=None):
+  if recorder is None:
+    recorder = null_recorder
+
+  check_overlap(overlap)
+  mask = np.zeros(img.shape[:2], dtype=np.uint8) if out is None else out # create a single channel mask filled with zeros
+  if points is None:
+    points = tile_points(img.shape[0], img.shape[1], split_height, split_width, overlap)
+
+  if merge == "blend":
+    # sum of (probability - threshold) * weight of every tile covering a pixel. The
+    # pixel contains honey when the weighted mean probability is over the threshold,
+    # that is, when this sum is positive
+    weights = blend_window(split_height, split_width, window)
+    if evidence is None:
+      evidence = np.zeros(img.shape[:2], dtype=np.float32)
+  elif merge != "or":
+    raise ValueError("Unknown merge mode: " + str(merge))
+
+  # merge the prediction of a tile into the mask
+  def merge_tile(prediction, i, j):
+    maskTile = mask[i:i+split_height, j:j+split_width]
+
+    if merge == "blend":
+      evidenceTile = evidence[i:i+split_height, j:j+split_width]
+      evidenceTile += (prediction - threshold) * weights
+
+      # the tile region is thresholded again with the evidence of all the tiles seen so
+      # far, so the mask is final once the last tile covering a pixel is processed
+      np.multiply(evidenceTile > 0, 255, out=maskTile, casting="unsafe")
+    else:
+      prediction = ((prediction > threshold) * 255).astype(np.uint8) # scale to 0-255 range and convert to int
+      np.bitwise_or(maskTile, prediction, out=maskTile)
+
+  # tiles that can not contain honey are merged as tiles with probability 0
+  if prefilter is not None:
+    with recorder.span("prefilter"):
+      points, skipped = prefilter_tiles(img, points, split_height, split_width, prefilter, channel_order)
+    recorder.count("tiles_skipped", len(skipped))
+
+    if merge == "blend":
+      emptyPrediction = np.zeros((split_height, split_width), dtype=np.float32)
+      with recorder.span("merge"):
+        for i, j in skipped:
+          merge_tile(emptyPrediction, i, j)
+
+  for predictions, batchPoints in predict_tiles(img, model, points, split_height, split_width, batch_size, callback, channel_order,
+                                                cancel, recorder):
+    # merge the predictions into the mask
+    with recorder.span("merge"):
+      for prediction, (i, j) in zip(predictions, batchPoints):
+        merge_tile(prediction, i, j)
+
+  return mask
+
+#------------------------------------------------------------
+# Auxiliary function to predict tiles of an image in batches. The
+# predictions of each batch are yielded to be merged by the caller;
+# the processed tiles are counted and the callback is called once
+# the caller has merged them.
+#
+# Params:
+#        img: image (uint8)
+#        model: keras segmentation model
+#        points: list of (y, x) points of the tiles to predict
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        batch_size, callback, channel_order, cancel, recorder:
+#                 see segment_tiles
+# Return:
+#        generator of (predictions, points) of each batch, with the
+#        single channel float32 predictions of the tiles
+#------------------------------------------------------------
+def predict_tiles(img, model, points, split_height, split_width, batch_size=None, callback=None, channel_order="RGB", cancel=None,
+                  recorder=null_recorder):
+  if not points:
+    return
+
+  if batch_size is None:
+    batch_size = auto_batch_size(split_height, split_width, img.shape[2])
+  batch_size = min(batch_size, len(points))
+
+  # buffer reused by all the batches
+  batch = np.empty((batch_size, split_height, split_width, img.shape[2]), dtype=np.float32)
+
+  for start in range(0, len(points), batch_size):
+    if cancel is not None and cancel.is_set():
+      raise SegmentationCancelled()
+
+    batchPoints = points[start:start+batch_size]
+    with recorder.span("split"):
+      inputs = fill_batch(img, batchPoints, split_height, split_width, batch, channel_order)
+
+    #predict the result
+    with recorder.span("predict"):
+      predictions = model.predict(inputs, batch_size=len(batchPoints), verbose=0)[:, :, :, 0]
+
+    yield predictions, batchPoints
+
+    recorder.count("tiles", len(batchPoints))
+
+    if callback is not None:
+      callback(start + len(batchPoints), len(points))
+
+#------------------------------------------------------------
+# Coarse-to-fine segmentation. The whole image is first segmented
+# downscaled by scale. Then only the full resolution tiles where
+# the coarse mask is not uniform (a boundary between honey and
+# background, or an uncertain region with scattered pixels, lies
+# in the tile or within margin pixels of it) are segmented again
+# at full resolution. The rest of the mask is the upscaled coarse
+# mask, so large uniform areas of honey or background need a
+# fraction of the inferences.
+#
+# Params:
+#        img: image (uint8)
+#        model: keras segmentation model
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        scale: scale of the coarse pass, in range 0-1
+#        margin: pixels around a tile that are also checked
+#        overlap, threshold, batch_size, channel_order, merge,
+#        window, cancel, recorder, prefilter: see segment_tiles
+#        callback: optional function called as callback(done, total)
+#                  after each batch of any of the passes
+#        out: optional mask (zeros, height x width uint8) to write
+#             the coarse and then the refined predictions into
+# Return:
+#        single channel mask (uint8) with the height and width of
+#        the image. Pixels with honey are 255, the rest 0.
+#------------------------------------------------------------
+def segment_coarse_to_fine(img, model, split_height, split_width, scale=default_coarse_scale, margin=default_refine_margin,
+                           overlap=default_overlap, threshold=default_threshold, batch_size=None, callback=None, channel_order="RGB",
+                           merge=default_merge, window=default_window, cancel=None, out=None, recorder=None, prefilter=None):
+  if recorder is None:
+    recorder = null_recorder
+
+  height, width = img.shape[:2]
+  options = dict(overlap=overlap, threshold=threshold, batch_size=batch_size, channel_order=channel_order, merge=merge,
+                 window=window, cancel=cancel, recorder=recorder, prefilter=prefilter)
+
+  # the coarse image can not be smaller than a tile
+  coarseWidth = max(split_width, round(width * scale))
+  coarseHeight = max(split_height, round(height * scale))
+  if coarseWidth >= width or coarseHeight >= height:
+    return segment_tiles(img, model, split_height, split_width, callback=callback, out=out, **options)
+
+  points = tile_points(height, width, split_height, split_width, overlap)
+  coarsePoints = tile_points(coarseHeight, coarseWidth, split_height, split_width, overlap)
+  coarseTotal = len(coarsePoints)
+  recorder.count("coarse_tiles", coarseTotal)
+
+  def coarseProgress(done, total):
+    if callback is not None:
+      callback(done, coarseTotal + len(points)) # the refined tiles are not known yet, all of them are assumed
+
+  with recorder.span("split"):
+    coarseImg = cv2.resize(img, (coarseWidth, coarseHeight), interpolation=cv2.INTER_AREA)
+  coarseMask = segment_tiles(coarseImg, model, split_height, split_width, callback=coarseProgress, points=coarsePoints, **options)
+  del coarseImg
+
+  # the coarse mask is upscaled into the output, the refined tiles overwrite it later
+  mask = np.empty((height, width), dtype=np.uint8) if out is None else out
+  with recorder.span("merge"):
+    cv2.resize(coarseMask, (width, height), dst=mask, interpolation=cv2.INTER_LINEAR)
+    cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY, dst=mask)
+
+  # a tile is refined when its coarse region (with the margin) has honey and background
+  scaleY, scaleX = coarseHeight / height, coarseWidth / width
+  refinePoints = []
+  for i, j in points:
+    top, left = max(0, int((i - margin) * scaleY)), max(0, int((j - margin) * scaleX))
+    bottom, right = int(np.ceil((i + split_height + margin) * scaleY)), int(np.ceil((j + split_width + margin) * scaleX))
+    region = coarseMask[top:bottom, left:right]
+    honey = cv2.countNonZero(region)
+    if 0 < honey < region.size:
+      refinePoints.append((i, j))
+  recorder.count("refined_tiles", len(refinePoints))
+
+  if not refinePoints:
+    return mask
+
+  # the refined regions are predicted again from scratch
+  for i, j in refinePoints:
+    mask[i:i+split_height, j:j+split_width] = 0
+
+  def fineProgress(done, total):
+    if callback is not None:
+      callback(coarseTotal + done, coarseTotal + total)
+
+  return segment_tiles(img, model, split_height, split_width, callback=fineProgress, out=mask, points=refinePoints, **options)
+
+#------------------------------------------------------------
+# Auxiliary function to obtain the region of a line of tiles that
+# each tile owns. The overlap of two neighbouring tiles is split in
+# its middle, so every pixel of the image is owned by one tile.
+#
+# Params:
+#        points: start of each tile, see start_points
+#        split_size: size of a tile
+#        size: size of the image
+# Return:
+#        list of (start, end) of the region owned by each tile,
+#        relative to the start of the tile
+#------------------------------------------------------------
+def ownership_bounds(points, split_size, size):
+  bounds = []
+
+  for k, point in enumerate(points):
+    start = 0 if k == 0 else (points[k-1] + split_size + point) // 2
+    end = size if k == len(points) - 1 else (point + split_size + points[k+1]) // 2
+    bounds.append((start - point, end - point))
+
+  return bounds
+
+#------------------------------------------------------------
+# Function to count the pixels with honey of an image without
+# building its mask. Every tile only counts the thresholded pixels
+# of the region it owns (see ownership_bounds), so the memory used
+# is that of a batch of tiles whatever the size of the image. The
+# count is exact with overlap 0; with overlap the pixels of each
+# overlap are taken from the nearest tile instead of merging the
+# tiles, so it differs slightly from the area of the merged mask.
+#
+# Params:
+#        img: image (uint8)
+#        model: keras segmentation model
+#        split_height: height of a tile
+#        split_width: width of a tile
+#        overlap, threshold, batch_size, callback, channel_order,
+#        cancel, recorder, prefilter: see segment_tiles
+#        per_tile: also return the pixels with honey of each tile
+# Return:
+#        number of pixels with honey or, with per_tile, (number
+#        of pixels with honey, {(y, x): pixels with honey of the
+#        tile starting at (y, x)})
+#------------------------------------------------------------
+def count_honey_pixels(img, model, split_height, split_width, overlap=default_overlap, threshold=default_threshold, batch_size=None,
+                       callback=None, channel_order="RGB", cancel=None, recorder=None, prefilter=None, per_tile=False):
+  if recorder is None:
+    recorder = null_recorder
+
+  yPoints = start_points(img.shape[0], split_height, overlap)
+  xPoints = start_points(img.shape[1], split_width, overlap)
+  yBounds = dict(zip(yPoints, ownership_bounds(yPoints, split_height, img.shape[0])))
+  xBounds = dict(zip(xPoints, ownership_bounds(xPoints, split_width, img.shape[1])))
+  points = [(i, j) for i in yPoints for j in xPoints]
+  tilePixels = {}
+
+  # tiles that can not contain honey have no pixels with honey
+  if prefilter is not None:
+    with recorder.span("prefilter"):
+      points, skipped = prefilter_tiles(img, points, split_height, split_width, prefilter, channel_order)
+    recorder.count("tiles_skipped", len(skipped))
+    tilePixels.update((point, 0) for point in skipped)
+
+  for predictions, batchPoints in predict_tiles(img, model, points, split_height, split_width, batch_size, callback, channel_order,
+                                                cancel, recorder):
+    with recorder.span("merge"):
+      for prediction, (i, j) in zip(predictions, batchPoints):
+        top, bottom = yBounds[i]
+        left, right = xBounds[j]
+        tilePixels[(i, j)] = int(np.count_nonzero(prediction[top:bottom, left:right] > threshold))
+
+  pixels = sum(tilePixels.values())
+  return (pixels, tilePixels) if per_tile else pixels
+
+#------------------------------------------------------------
+# Function to count the pixels with honey of a mask
+#
+# Params:
+#        mask: merged mask where positive values are pixels
+#              with honey. Single channel masks are counted
+#              directly, 3 channels masks use the first channel
+# Return:
+#        number of pixels with honey
+#------------------------------------------------------------
+def honey_pixels(mask):
+  if mask.ndim == 3:
+    mask = mask[:, :, 0]
+
+  return int(np.count_nonzero(mask))
+
+#------------------------------------------------------------
+# Function to obtain the intersection over union of two masks
+#
+# Params:
+#        mask: mask to compare
+#        reference: reference mask
+# Return:
+#        IoU in range 0-1 (1 if both masks are empty)
+#------------------------------------------------------------
+def mask_iou(mask, reference):
+  mask = mask > 0
+  reference = reference > 0
+  union = np.count_nonzero(mask | reference)
+
+  if union == 0:
+    return 1.0
+
+  return np.count_nonzero(mask & reference) / union
+
+#------------------------------------------------------------
+# Function to pack a mask in 1 bit per pixel, to store it or keep
+# it in memory 8 times smaller than a uint8 mask
+#
+# Params:
+#        mask: single channel mask
+# Return:
+#        uint8 array of shape (height, ceil(width / 8))
+#------------------------------------------------------------
+def pack_mask(mask):
+  return np.packbits(mask, axis=1) # non zero values are packed as 1
+
+#------------------------------------------------------------
+# Function to unpack a mask packed with pack_mask
+#
+# Params:
+#        packed: packed mask
+#        width: width of the original mask
+# Return:
+#        single channel mask (uint8). Pixels with honey are 255
+#------------------------------------------------------------
+def unpack_mask(packed, width):
+  return np.unpackbits(packed, axis=1, count=width) * np.uint8(255)
+
+#------------------------------------------------------------
+# Function to count the pixels with honey of a packed mask
+# without unpacking it
+#
+# Params:
+#        packed: packed mask
+# Return:
+#        number of pixels with honey
+#------------------------------------------------------------
+def packed_honey_pixels(packed):
+  return int(np.bitwise_count(packed).sum(dtype=np.int64))
+
+#------------------------------------------------------------
+# Function to calculate the surface of honey of a mask
+#
+# Params:
+#        mask: merged mask where positive values are pixels
+#              with honey, or number of pixels with honey (see
+#              count_honey_pixels)
+#        cm2_per_pixel: surface of a pixel in cm2
+# Return:
+#        surface of honey in cm2 with 4 decimals
+#------------------------------------------------------------
+def honey_area(mask, cm2_per_pixel):
+  pixels = mask if isinstance(mask, (int, np.integer)) else honey_pixels(mask)
+  return round(float(cm2_per_pixel) * pixels, 4)
+
+#------------------------------------------------------------
+# Function to calculate the surface of honey of an image without
+# building its mask (area-only mode), see count_honey_pixels
+#
+# Params:
+#        img: ImageBuffer or RGB image (uint8)
+#        model: keras segmentation model
+#        cm2_per_pixel: surface of a pixel in cm2
+#        overlap, threshold, batch_size, callback, cancel, recorder,
+#        prefilter, per_tile: see count_honey_pixels
+#        tile: (height, width) of the input tiles of the model
+# Return:
+#        surface of honey in cm2 with 4 decimals or, with per_tile,
+#        (surface of honey, pixels with honey of each tile)
+#------------------------------------------------------------
+def segment_area(img, model, cm2_per_pixel, overlap=default_overlap, threshold=default_threshold, batch_size=None, callback=None,
+                 cancel=None, recorder=None, prefilter=None, per_tile=False, tile=(tile_height, tile_width)):
+  channel_order = "RGB"
+  if isinstance(img, ImageBuffer):
+    img, channel_order = img.array, img.channel_order
+
+  pixels, tilePixels = count_honey_pixels(img, model, tile[0], tile[1], overlap=overlap, threshold=threshold,
+                                          batch_size=batch_size, callback=callback, channel_order=channel_order, cancel=cancel,
+                                          recorder=recorder, prefilter=prefilter, per_tile=True)
+  area = honey_area(pixels, cm2_per_pixel)
+  return (area, tilePixels) if per_tile else area
+
+#------------------------------------------------------------
+# Function to blend the mask and an image. Pixels with honey are
+# highlighted in red. The image is processed in horizontal bands,
+# so the temporary images have the size of a band instead of the
+# size of the image.
+#
+# Params:
+#        img: image (uint8)
+#        mask: mask of pixels representing the honey
+#        channel_order: "RGB" or "BGR", channel order of img
+#        band_height: rows of the image blended at once
+#        out: optional image (same shape of img) to write into
+# Return:
+#        image with the honey highlighted, in the channel order
+#        of img
+#------------------------------------------------------------
+def highlight_honey(img, mask, channel_order="RGB", band_height=1024, out=None):
+  # make an array with a value of red pixel
+  color = np.array([255,0,0] if channel_order == "RGB" else [0,0,255], dtype='uint8')
+
+  if mask.ndim == 2:
+    mask = mask[:, :, np.newaxis]
+  if out is None:
+    out = np.empty_like(img)
+
+  for top in range(0, img.shape[0], band_height):
+    imgBand = img[top:top+band_height]
+
+    # replace all white pixel in mask with a red pixel
+    masked_img = np.where(mask[top:top+band_height], color, imgBand)
+
+    # blend image and mask woth red pixels with 60% of the original image and 40% of the mask
+    cv2.addWeighted(imgBand, 0.6, masked_img, 0.4, 0, dst=out[top:top+band_height])
+
+  return out
+
+#------------------------------------------------------------
+# Function to blend the mask and an image at display resolution.
+# The image and the mask are downscaled first, so only the pixels
+# that are shown are blended.
+#
+# Params:
+#        img: ImageBuffer or RGB image (uint8)
+#        mask: mask of pixels representing the honey
+#        width: width of the preview
+#        height: height of the preview
+#        channel_order: channel order of the preview
+# Return:
+#        image with the honey highlighted of size width x height
+#------------------------------------------------------------
+def preview_overlay(img, mask, width, height, channel_order="RGB"):
+  if isinstance(img, ImageBuffer):
+    small = img.preview(width, height, channel_order)
+  else:
+    small = convert_channel_order(cv2.resize(img, (width, height)), "RGB", channel_order)
+
+  # a preview pixel is honey when most of the pixels it covers are honey
+  smallMask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_AREA) > 127
+
+  return highlight_honey(small, smallMask, channel_order)
+
+#------------------------------------------------------------
+# Function to segment an image with the default tiling
+#
+# Params:
+#        img: ImageBuffer or RGB image (uint8)
+#        model: keras segmentation model
+#        overlap: pertentage of overlaping between tiles points.
+#        threshold: probability from which a pixel contains honey
+#        batch_size: tiles predicted at once. None to choose it
+#                    from the available memory
+#        callback: optional function called as callback(done, total)
+#                  after each batch is processed
+#        merge: "blend" or "or", see segment_tiles
+#        window: weighting window of the blend, see blend_window
+#        cancel: optional threading.Event to stop the process
+#        out: optional mask to write the predictions into
+#        recorder: optional Recorder of the stages, see segment_tiles
+#        prefilter: minimum score of a tile to be predicted, None to
+#                   predict all tiles. See segment_tiles
+#        coarse_scale: scale of the coarse pass of the coarse-to-fine
+#                      mode (see segment_coarse_to_fine). None to
+#                      segment all the tiles at full resolution
+#        tile: (height, width) of the input tiles of the model
+# Return:
+#        single channel mask with the height and width of the image
+#------------------------------------------------------------
+def segment_image(img, model, overlap=default_overlap, threshold=default_threshold, batch_size=None, callback=None,
+                  merge=default_merge, window=default_window, cancel=None, out=None, recorder=None, prefilter=None,
+                  coarse_scale=None, tile=(tile_height, tile_width)):
+  channel_order = "RGB"
+  if isinstance(img, ImageBuffer):
+    img, channel_order = img.array, img.channel_order
+
+  if coarse_scale is not None:
+    return segment_coarse_to_fine(img, model, tile[0], tile[1], scale=coarse_scale, overlap=overlap, threshold=threshold,
+                                  batch_size=batch_size, callback=callback, channel_order=channel_order, merge=merge,
+                                  window=window, cancel=cancel, out=out, recorder=recorder, prefilter=prefilter)
+
+  return segment_tiles(img, model, tile[0], tile[1], overlap=overlap, threshold=threshold, batch_size=batch_size,
+                       callback=callback, channel_order=channel_order, merge=merge, window=window, cancel=cancel, out=out,
+                       recorder=recorder, prefilter=prefilter)
@@ -0,0 +1,259 @@
+#------------------------------------------------------------
+# Decoded image shared by all the stages of the segmentation.
+# The image is decoded once and kept in the channel order of the
+# decoder (BGR for opencv). Tiling, blending and saving use views
+# of the same array; the channel order is only converted where a
+# consumer needs it (the model input and the tkinter previews).
+#
+# An image can also be opened without decoding it: its size is
+# read from the header, previews are decoded at reduced resolution
+# (DCT scaling of JPEG) and the full resolution image is only
+# decoded when it is first needed.
+#------------------------------------------------------------
+import math # to compute the reduced sizes
+import os # to manage actions of the operating system
+import threading # the image may be decoded by any thread
+from pathlib import Path # to manage system paths (windows, linux, etc)
+import cv2 # opencv library to process images
+import numpy as np # to read images stored as numpy arrays
+
+# channel orders supported by ImageBuffer
+channel_orders = ("RGB", "BGR")
+
+# flags of opencv to decode an image reduced by each factor
+reduced_read_flags = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+
+# EXIF orientations that rotate the image 90 degrees (width and height are swapped)
+exif_rotated_orientations = (5, 6, 7, 8)
+
+
+#------------------------------------------------------------
+# Auxiliary function to convert an image between channel orders
+#
+# Params:
+#        img: 3 channels image
+#        source_order: channel order of img
+#        target_order: desired channel order
+# Return:
+#        img if both orders are the same, a converted copy otherwise
+#------------------------------------------------------------
+def convert_channel_order(img, source_order, target_order):
+  if source_order not in channel_orders or target_order not in channel_orders:
+    raise ValueError("Unknown channel order: " + str(source_order) + " -> " + str(target_order))
+
+  if source_order == target_order:
+    return img
+
+  return cv2.cvtColor(img, cv2.COLOR_BGR2RGB) # swapping R and B is the same in both directions
+
+
+#------------------------------------------------------------
+# Function to obtain the size of an image without decoding it. The
+# EXIF orientation is taken into account, as opencv rotates the
+# images when it decodes them.
+#
+# Params:
+#        path: path of the image
+# Return:
+#        (height, width) of the image, None if it is not known
+#------------------------------------------------------------
+def image_size(path):
+  if os.path.splitext(str(path))[1].lower() == ".npy":
+    return np.load(path, mmap_mode="r").shape[:2]
+
+  try:
+    import PIL.Image # to read the header of the image
+  except ImportError:
+    return None
+
+  try:
+    with PIL.Image.open(path) as img:
+      width, height = img.size
+      orientation = img.getexif().get(0x0112, 1)
+  except (OSError, ValueError):
+    return None
+
+  if orientation in exif_rotated_orientations:
+    width, height = height, width
+
+  return height, width
+
+
+#------------------------------------------------------------
+# Auxiliary function to decode an image from disk, optionally
+# reduced by a factor (1, 2, 4 or 8). JPEG images are reduced
+# while they are decoded, without decoding the full image.
+#
+# Params:
+#        path: path of the image
+#        factor: reduction factor
+# Return:
+#        (image, channel order). Images stored as .npy arrays
+#        (uint8, height x width x 3) are RGB, the rest BGR
+#------------------------------------------------------------
+def decode_image(path, factor=1):
+  if os.path.splitext(str(path))[1].lower() == ".npy":
+    if factor == 1:
+      return np.load(path), "RGB"
+    return np.ascontiguousarray(np.load(path, mmap_mode="r")[::factor, ::factor]), "RGB"
+
+  img = cv2.imread(str(path), reduced_read_flags.get(factor, cv2.IMREAD_COLOR))
+  if img is None:
+    raise ValueError("Unable to read image: " + str(path))
+
+  return img, "BGR"
+
+
+#------------------------------------------------------------
+# Class with a decoded image, its channel order and metadata
+#------------------------------------------------------------
+class ImageBuffer:
+  def __init__(self, array, channel_order="BGR", path=None):
+    if channel_order not in channel_orders:
+      raise ValueError("Unknown channel order: " + str(channel_order))
+
+    self._array = array # decoded image (uint8), shared by all the consumers. None until it is decoded
+    self.channel_order = channel_order # order of the channels of array
+    self.path = Path(path) if path is not None else None # path of the source file
+    self.file_size = os.path.getsize(path) if path is not None else None # size in bytes of the source file
+    self._size = None # (height, width) of the image while it is not decoded
+    self._reduced = None # (factor, image) decoded at reduced resolution for the previews
+    self._lock = threading.Lock()
+
+  #------------------------------------------------------------
+  # Function to decode an image from disk. The image is kept in
+  # the BGR order returned by opencv. Images stored as .npy arrays
+  # (uint8, height x width x 3) are RGB.
+  #
+  # Params:
+  #        path: path of the image
+  # Return:
+  #        ImageBuffer
+  #------------------------------------------------------------
+  @classmethod
+  def read(cls, path):
+    img, channel_order = decode_image(path)
+    return cls(img, channel_order, path)
+
+  #------------------------------------------------------------
+  # Function to open an image without decoding it. The size is
+  # read from the header of the file and the image is decoded the
+  # first time its array is used. It is decoded at once if the
+  # size can not be read.
+  #
+  # Params:
+  #        path: path of the image
+  # Return:
+  #        ImageBuffer
+  #------------------------------------------------------------
+  @classmethod
+  def open(cls, path):
+    size = image_size(path)
+    if size is None:
+      return cls.read(path)
+
+    buffer = cls(None, "RGB" if os.path.splitext(str(path))[1].lower() == ".npy" else "BGR", path)
+    buffer._size = tuple(size)
+    return buffer
+
+  @property
+  def array(self):
+    if self._array is None:
+      with self._lock:
+        if self._array is None:
+          self._array, _ = decode_image(self.path)
+          self._reduced = None
+    return self._array
+
+  @property
+  def decoded(self):
+    return self._array is not None
+
+  @property
+  def height(self):
+    return self._size[0] if self._array is None else self._array.shape[0]
+
+  @property
+  def width(self):
+    return self._size[1] if self._array is None else self._array.shape[1]
+
+  @property
+  def shape(self):
+    return self._size + (3,) if self._array is None else self._array.shape
+
+  #------------------------------------------------------------
+  # Function to obtain a region of the image without copying it
+  #
+  # Params:
+  #        y: first row of the region
+  #        x: first column of the region
+  #        height: height of the region
+  #        width: width of the region
+  # Return:
+  #        view of the image
+  #------------------------------------------------------------
+  def view(self, y, x, height, width):
+    return self.array[y:y+height, x:x+width]
+
+  #------------------------------------------------------------
+  # Function to obtain the image in a channel order
+  #
+  # Params:
+  #        channel_order: "RGB" or "BGR"
+  # Return:
+  #        the shared array if the order matches, a converted
+  #        copy otherwise
+  #------------------------------------------------------------
+  def to_order(self, channel_order):
+    return convert_channel_order(self.array, self.channel_order, channel_order)
+
+  #------------------------------------------------------------
+  # Function to obtain a resized copy of the image. The channel
+  # order is converted after resizing, on the small image.
+  #
+  # Params:
+  #        width: width of the copy
+  #        height: height of the copy
+  #        channel_order: channel order of the copy
+  # Return:
+  #        resized image
+  #------------------------------------------------------------
+  def resized(self, width, height, channel_order="RGB"):
+    small = cv2.resize(self.array, (width, height))
+    return convert_channel_order(small, self.channel_order, channel_order)
+
+  #------------------------------------------------------------
+  # Function to obtain a small copy of the image to show it. If the
+  # image is not decoded yet, it is decoded at the largest
+  # reduction (2, 4 or 8) that is not smaller than the copy, and
+  # the reduced image is kept for the next previews. The full
+  # resolution image is not decoded.
+  #
+  # Params:
+  #        width: width of the copy
+  #        height: height of the copy
+  #        channel_order: channel order of the copy
+  # Return:
+  #        resized image
+  #------------------------------------------------------------
+  def preview(self, width, height, channel_order="RGB"):
+    if self._array is not None:
+      return self.resized(width, height, channel_order)
+
+    factor = 1
+    for candidate in sorted(reduced_read_flags, reverse=True):
+      if math.ceil(self.width / candidate) >= width and math.ceil(self.height / candidate) >= height:
+        factor = candidate
+        break
+
+    if factor == 1:
+      return self.resized(width, height, channel_order)
+
+    with self._lock:
+      # a reduced image at least as large is reused
+      if self._reduced is None or self._reduced[0] > factor:
+        self._reduced = (factor, decode_image(self.path, factor)[0])
+      reduced = self._reduced[1]
+
+    small = cv2.resize(reduced, (width, height))
+    return convert_channel_order(small, self.channel_order, channel_order)
@@ -0,0 +1,330 @@
+#------------------------------------------------------------
+# Instrumentation of the segmentation. The time of each stage
+# (split, predict, merge, blend, area, save...) and the counters of
+# processed and skipped tiles of every image are collected in a
+# Recorder and written as a record to one or more sinks, together
+# with the peak memory of the process.
+#
+# Optionally the process can be profiled with cProfile and/or
+# tracemalloc. The profiling is enabled with the --profile option
+# of the command line or with the environment variable
+# HONEYSEG_PROFILE, e.g. HONEYSEG_PROFILE=cprofile,tracemalloc.
+# The records can be written to a JSON lines file with --metrics or
+# the environment variable HONEYSEG_METRICS.
+#------------------------------------------------------------
+import contextlib # to build the timing spans
+import cProfile # to profile the functions of the segmentation
+import json # to write the records
+import os # to read the environment variables
+import pstats # to merge the profiles of several threads
+import sys # to know the platform
+import threading # each thread keeps its own profiler
+import time # to measure the elapsed time
+import tracemalloc # to trace the memory allocated by python and numpy
+
+# environment variables that enable the profiling and the metrics file
+profile_env = "HONEYSEG_PROFILE"
+metrics_env = "HONEYSEG_METRICS"
+
+# available profiling modes
+profile_modes = ("cprofile", "tracemalloc")
+
+# file where the cProfile statistics are written (pstats format)
+default_profile_output = "honeyseg.prof"
+
+# stages whose time is used to compute the tiles per second
+segmentation_stages = ("split", "predict", "merge")
+
+
+#------------------------------------------------------------
+# Function to obtain the peak resident set size of the process
+#
+# Params:
+#        None
+# Return:
+#        peak RSS in MB, None if it can not be obtained (Windows)
+#------------------------------------------------------------
+def peak_rss_mb():
+  try:
+    import resource # only available on Unix
+  except ImportError:
+    return None
+
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is given in bytes on macOS and in KB on Linux
+  return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+#------------------------------------------------------------
+# Class with the timings and counters of a unit of work (usually
+# an image). The time of a stage is measured with
+#
+#   with recorder.span("predict"):
+#     ...
+#
+# Spans with the same name are accumulated.
+#------------------------------------------------------------
+class Recorder:
+  def __init__(self, **fields):
+    self.fields = fields # information of the unit of work, e.g. image, width, height
+    self.timings = {} # seconds spent in each stage
+    self.counters = {} # counters, e.g. tiles processed or skipped
+
+  @contextlib.contextmanager
+  def span(self, name):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add_time(name, time.perf_counter() - start)
+
+  def add_time(self, name, seconds):
+    self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+  def count(self, name, value=1):
+    self.counters[name] = self.counters.get(name, 0) + value
+
+  #------------------------------------------------------------
+  # Function to obtain the record of the recorder
+  #
+  # Params:
+  #        None
+  # Return:
+  #        dictionary with the fields, timings, counters and the
+  #        tiles per second of the segmentation
+  #------------------------------------------------------------
+  def as_record(self):
+    record = dict(self.fields)
+    record["timings"] = dict(self.timings)
+    record["counters"] = dict(self.counters)
+
+    segmentationTime = sum(self.timings.get(stage, 0.0) for stage in segmentation_stages)
+    if segmentationTime > 0 and "tiles" in self.counters:
+      record["tiles_per_second"] = self.counters["tiles"] / segmentationTime
+
+    return record
+
+
+#------------------------------------------------------------
+# Internal class of a recorder that measures nothing. It is used
+# when the instrumentation is disabled, so the hot paths do not
+# need to check it.
+#------------------------------------------------------------
+class _NullRecorder:
+  _span = contextlib.nullcontext()
+
+  # empty on every access, so updates are discarded
+  fields = property(lambda self: {})
+  timings = property(lambda self: {})
+  counters = property(lambda self: {})
+
+  def span(self, name):
+    return self._span
+
+  def add_time(self, name, seconds):
+    pass
+
+  def count(self, name, value=1):
+    pass
+
+null_recorder = _NullRecorder()
+
+
+#------------------------------------------------------------
+# Class of a sink that writes every record as a line of JSON
+#------------------------------------------------------------
+class JsonLinesSink:
+  def __init__(self, path):
+    self.path = path
+    self._file = open(path, "a")
+    self._lock = threading.Lock()
+
+  def write(self, record):
+    line = json.dumps(record, default=str)
+    with self._lock:
+      self._file.write(line + "\n")
+      self._file.flush()
+
+  def close(self):
+    self._file.close()
+
+
+#------------------------------------------------------------
+# Class of a sink that keeps the records in memory, e.g. to check
+# them in tests or to show them in the interface
+#------------------------------------------------------------
+class MemorySink:
+  def __init__(self):
+    self.records = []
+    self._lock = threading.Lock()
+
+  def write(self, record):
+    with self._lock:
+      self.records.append(record)
+
+  def close(self):
+    pass
+
+
+#------------------------------------------------------------
+# Class that creates the recorders, writes their records to the
+# sinks and runs the optional profilers.
+#------------------------------------------------------------
+class Instrumentation:
+  def __init__(self, sinks=(), profile=(), profile_output=default_profile_output):
+    for mode in profile:
+      if mode not in profile_modes:
+        raise ValueError("Unknown profiling mode: " + str(mode))
+
+    self.sinks = list(sinks) # where the records are written
+    self.profile = tuple(profile) # enabled profiling modes
+    self.profile_output = profile_output # file of the cProfile statistics
+    self._profilers = [] # cProfile profilers of all the threads
+    self._local = threading.local() # cProfile profiler of the current thread
+    self._lock = threading.Lock()
+
+    if "tracemalloc" in self.profile and not tracemalloc.is_tracing():
+      tracemalloc.start()
+
+  #------------------------------------------------------------
+  # Function to build the instrumentation from the environment
+  # variables. The given values have priority.
+  #
+  # Params:
+  #        metrics: path of the JSON lines file of the records
+  #        profile: list of profiling modes
+  #        profile_output: file of the cProfile statistics
+  # Return:
+  #        Instrumentation
+  #------------------------------------------------------------
+  @classmethod
+  def from_environment(cls, metrics=None, profile=None, profile_output=None):
+    metrics = metrics or os.environ.get(metrics_env)
+    if profile is None:
+      profile = [mode.strip().lower() for mode in os.environ.get(profile_env, "").split(",") if mode.strip()]
+
+    sinks = [JsonLinesSink(metrics)] if metrics else []
+    return cls(sinks, profile, profile_output or default_profile_output)
+
+  @property
+  def enabled(self):
+    return bool(self.sinks or self.profile)
+
+  #------------------------------------------------------------
+  # Function to obtain a recorder for a unit of work. A recorder
+  # that measures nothing is returned if the instrumentation is
+  # disabled.
+  #
+  # Params:
+  #        **fields: information of the unit of work
+  # Return:
+  #        Recorder
+  #------------------------------------------------------------
+  def recorder(self, **fields):
+    return Recorder(**fields) if self.enabled else null_recorder
+
+  #------------------------------------------------------------
+  # Function to write a record to all the sinks. The peak memory
+  # of the process is added to the record and, with tracemalloc,
+  # the peak of traced memory since the previous record.
+  #
+  # Params:
+  #        record: Recorder or dictionary
+  #        event: type of record, e.g. "image" or "model_load"
+  # Return:
+  #        written dictionary, None if nothing was written
+  #------------------------------------------------------------
+  def emit(self, record, event="image"):
+    if not self.sinks or record is null_recorder:
+      return None
+
+    if isinstance(record, Recorder):
+      record = record.as_record()
+    record = dict(record, event=event, timestamp=time.time())
+    record["peak_rss_mb"] = peak_rss_mb()
+
+    if "tracemalloc" in self.profile:
+      # images processed at the same time share this peak
+      record["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+      tracemalloc.reset_peak()
+
+    for sink in self.sinks:
+      sink.write(record)
+
+    return record
+
+  #------------------------------------------------------------
+  # Function to write the load and warm-up times of a model
+  #
+  # Params:
+  #        manager: ModelManager with the model loaded
+  # Return:
+  #        written dictionary, None if nothing was written
+  #------------------------------------------------------------
+  def model_loaded(self, manager):
+    return self.emit({"model": manager.key[0] if manager.key else None,
+                      "timings": {"load": manager.load_time, "warmup": manager.warmup_time}}, event="model_load")
+
+  #------------------------------------------------------------
+  # Function to profile a function with cProfile in the thread
+  # that runs it. Each thread has its own profiler, all of them are
+  # merged when the instrumentation is closed.
+  #
+  # Params:
+  #        function: function to profile
+  # Return:
+  #        the function itself if cProfile is disabled, otherwise
+  #        a wrapper of the function
+  #------------------------------------------------------------
+  def profiled(self, function):
+    if "cprofile" not in self.profile:
+      return function
+
+    def wrapper(*args, **kwargs):
+      profiler = getattr(self._local, "profiler", None)
+      if profiler is None:
+        profiler = self._local.profiler = cProfile.Profile()
+        with self._lock:
+          self._profilers.append(profiler)
+
+      try:
+        profiler.enable()
+      except ValueError:
+        # another profiler is active (python >= 3.12 allows one at a time)
+        return function(*args, **kwargs)
+
+      try:
+        return function(*args, **kwargs)
+      finally:
+        profiler.disable()
+
+    return wrapper
+
+  #------------------------------------------------------------
+  # Function to write the cProfile statistics, stop tracemalloc
+  # and close the sinks
+  #
+  # Params:
+  #        None
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def close(self):
+    with self._lock:
+      profilers, self._profilers = self._profilers, []
+
+    stats = None
+    for profiler in profilers:
+      try:
+        stats = pstats.Stats(profiler) if stats is None else stats.add(profiler)
+      except TypeError:
+        pass # the profiler never ran
+
+    if stats is not None:
+      stats.dump_stats(self.profile_output)
+
+    if "tracemalloc" in self.profile and tracemalloc.is_tracing():
+      tracemalloc.stop()
+
+    for sink in self.sinks:
+      sink.close()
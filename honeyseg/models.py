@@ -0,0 +1,178 @@
+#------------------------------------------------------------
+# Management of the segmentation models
+#------------------------------------------------------------
+import os # to manage actions of the operating system
+import threading # to load the segmentation model in background
+import time # to measure the load time of the model
+from pathlib import Path # to manage system paths (windows, linux, etc)
+import numpy as np # to make calculations
+
+from .backends import is_remote, load_model
+from .core import tile_height, tile_width, tile_channels
+
+#------------------------------------------------------------
+# Class to keep the segmentation model loaded between images. The
+# model is identified by its path and modification time, so it is
+# only loaded again when a different (or modified) file is used.
+# Loading and a warm-up inference run in a background thread.
+#------------------------------------------------------------
+class ModelManager:
+  def __init__(self, warmup_shape=(tile_height, tile_width, tile_channels), **load_options):
+    self.warmup_shape = warmup_shape # shape of the input tiles, used to trace the model and in the warm-up inference
+    self.load_options = load_options # options of load_model, e.g. jit_compile or mixed_precision
+    self.model = None # loaded segmentation model
+    self.key = None # (path, modification time) of the loaded model
+    self.load_time = None # seconds spent loading the model
+    self.warmup_time = None # seconds spent in the warm-up inference
+    self.error = None # exception raised while loading the model
+    self._thread = None # background thread loading the model
+    self._lock = threading.Lock()
+
+  #------------------------------------------------------------
+  # Internal class function to obtain the key of a model file
+  #
+  # Params:
+  #        path: path of the model (.keras, .tflite or .onnx) or
+  #              URL of a server
+  # Return:
+  #        (absolute path, modification time) of the model,
+  #        (URL, None) for a server
+  #------------------------------------------------------------
+  def model_key(self, path):
+    if is_remote(path):
+      return (str(path), None)
+
+    path = Path(path).resolve()
+    return (str(path), os.path.getmtime(path))
+
+  #------------------------------------------------------------
+  # Function to load a model. Nothing is done if the model is
+  # already loaded (or being loaded). A model that failed to load
+  # is loaded again, e.g. once its server is up or its file has
+  # been copied completely.
+  #
+  # Params:
+  #        path: path of the model (.keras, .tflite or .onnx)
+  #        background: if True return without waiting for the
+  #                    model to be loaded
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def load(self, path, background=False):
+    key = self.model_key(path)
+
+    with self._lock:
+      failed = self.error is not None and not self._thread.is_alive()
+      if key != self.key or failed:
+        self.key = key
+        self.model = None
+        self.load_time = None
+        self.warmup_time = None
+        self.error = None
+        self._thread = threading.Thread(target=self._load, args=(path, key), daemon=True)
+        self._thread.start()
+      thread = self._thread
+
+    if not background:
+      thread.join()
+
+  #------------------------------------------------------------
+  # Internal class function run in the background thread to load
+  # the model and perform the warm-up inference
+  #
+  # Params:
+  #        path: path of the model (.keras, .tflite or .onnx)
+  #        key: key of the model when the load was requested
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def _load(self, path, key):
+    model = None
+    load_time = None
+    warmup_time = None
+    error = None
+
+    try:
+      start = time.perf_counter()
+      model = load_model(path, tile=tuple(self.warmup_shape), **self.load_options)
+      load_time = time.perf_counter() - start
+
+      # the first inference builds the predict function of the model (or its XLA program)
+      start = time.perf_counter()
+      model.predict(np.zeros((1,) + tuple(self.warmup_shape), dtype=np.float32), verbose=0)
+      warmup_time = time.perf_counter() - start
+    except Exception as e:
+      error = e
+
+    # store the result only if no other model was requested meanwhile
+    with self._lock:
+      if self.key == key:
+        self.model = model
+        self.load_time = load_time
+        self.warmup_time = warmup_time
+        self.error = error
+
+  #------------------------------------------------------------
+  # Function to obtain a loaded model. The model is loaded if
+  # needed, waiting for the warm-up inference to finish. It is
+  # loaded again if it was released (e.g. by the registry) or
+  # replaced by another model while it was loading.
+  #
+  # Params:
+  #        path: path of the model (.keras, .tflite or .onnx)
+  # Return:
+  #        segmentation model
+  #------------------------------------------------------------
+  def get(self, path):
+    key = self.model_key(path)
+
+    while True:
+      self.load(path)
+
+      with self._lock:
+        model, error, loadedKey = self.model, self.error, self.key
+
+      if loadedKey == key and error is not None:
+        raise error
+      if loadedKey == key and model is not None:
+        return model
+
+  #------------------------------------------------------------
+  # Function to release the loaded model. It is loaded again by the
+  # next load or get.
+  #
+  # Params:
+  #        None
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def release(self):
+    with self._lock:
+      self.key = None
+      self.model = None
+
+  #------------------------------------------------------------
+  # Function to know if the last requested model is ready to use
+  #
+  # Params:
+  #        None
+  # Return:
+  #        True if the model is loaded and warmed up, False while
+  #        it is loading, after a failed load or once released
+  #------------------------------------------------------------
+  def is_ready(self):
+    with self._lock:
+      return self.model is not None
+
+  #------------------------------------------------------------
+  # Function to know if the last load of a model failed
+  #
+  # Params:
+  #        None
+  # Return:
+  #        True if the load finished with an error, see error
+  #------------------------------------------------------------
+  def has_failed(self):
+    with self._lock:
+      return self.error is not None
+
@@ -0,0 +1,256 @@
+#------------------------------------------------------------
+# Pipelined processing of many images. Decoding, inference and
+# post-processing/encoding run in separate stages connected by
+# bounded queues, so the model keeps predicting while other images
+# are read from and written to disk.
+#
+# The stages run in threads: opencv releases the GIL while
+# decoding and encoding images and tensorflow while predicting,
+# so the stages overlap without copying images between processes.
+# The bounded queues give backpressure: a stage waits when the
+# next one is behind, so at most a few images are kept in memory.
+#------------------------------------------------------------
+import queue # bounded queues between the stages
+import threading # workers of each stage
+from pathlib import Path # to manage system paths (windows, linux, etc)
+import cv2 # opencv library to process images
+
+from .image import ImageBuffer
+from .core import tile_height, tile_width, default_overlap, default_merge, segment_image, count_honey_pixels, highlight_honey, honey_pixels, honey_area
+from .instrumentation import Instrumentation
+
+# mark sent through the queues when a stage has finished
+_finished = object()
+
+
+#------------------------------------------------------------
+# Class with the result of an image processed by the pipeline
+#------------------------------------------------------------
+class ImageResult:
+  def __init__(self, path):
+    self.path = Path(path) # path of the image
+    self.width = None # width of the image
+    self.height = None # height of the image
+    self.honey_pixels = None # number of pixels with honey
+    self.area = None # surface of honey in cm2
+    self.error = None # exception raised while processing the image
+    self.img = None # decoded ImageBuffer, released after encoding
+    self.mask = None # mask of honey, released after encoding
+    self.recorder = None # Recorder with the time of each stage
+    self.cache_key = None # key of the mask in the MaskCache
+    self.tile_pixels = None # pixels with honey of each tile, in area-only mode
+
+
+#------------------------------------------------------------
+# Internal class with a stage of the pipeline. Each worker takes
+# an item of the input queue, applies the stage function and
+# puts the result in the output queue. Items with an error skip
+# the function. The last worker to finish forwards the end mark.
+#------------------------------------------------------------
+class _Stage:
+  def __init__(self, function, input_queue, output_queue, workers, stop):
+    self.function = function # function applied to each ImageResult
+    self.input_queue = input_queue
+    self.output_queue = output_queue
+    self.stop = stop # event set when the pipeline is cancelled
+    self._running = workers # workers not finished yet
+    self._lock = threading.Lock()
+    self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+
+  def start(self):
+    for thread in self.threads:
+      thread.start()
+
+  def _work(self):
+    while not self.stop.is_set():
+      try:
+        item = self.input_queue.get(timeout=0.1)
+      except queue.Empty:
+        continue
+
+      # let the other workers of the stage see the end mark
+      if item is _finished:
+        self.input_queue.put(_finished)
+        break
+
+      if item.error is None:
+        try:
+          self.function(item)
+        except Exception as e:
+          item.error = e
+          item.img = None
+          item.mask = None
+
+      _put(self.output_queue, item, self.stop)
+
+    with self._lock:
+      self._running -= 1
+      last = self._running == 0
+
+    if last:
+      _put(self.output_queue, _finished, self.stop)
+
+
+#------------------------------------------------------------
+# Internal function to put an item in a bounded queue without
+# blocking forever if the pipeline is cancelled
+#------------------------------------------------------------
+def _put(output_queue, item, stop):
+  while not stop.is_set():
+    try:
+      output_queue.put(item, timeout=0.1)
+      return
+    except queue.Full:
+      pass
+
+
+#------------------------------------------------------------
+# Function to process many images with overlapped decoding,
+# inference and post-processing/encoding.
+#
+# Params:
+#        paths: paths of the images to process
+#        model: keras segmentation model
+#        cm2_per_pixel: surface of a pixel in cm2
+#        output_folder: folder where the masks are written. None
+#                       to keep the masks in the results instead
+#        mask_format: image format of the masks
+#        save_highlighted: also write the image with the honey
+#                          highlighted
+#        batch_size: tiles predicted at once. None to choose it
+#                    from the available memory
+#        overlap: pertentage of overlaping between tiles
+#        merge: "blend" or "or", see segment_tiles
+#        prefilter: minimum score of a tile to be predicted, None to
+#                   predict all tiles. See segment_tiles
+#        coarse_scale: scale of the coarse pass of the coarse-to-fine
+#                      mode, None to segment all the tiles at full
+#                      resolution. See segment_coarse_to_fine
+#        decode_workers: threads decoding images
+#        inference_workers: threads running the model
+#        encode_workers: threads computing the area and writing
+#                        the results
+#        queue_size: images waiting between two stages
+#        instrumentation: optional Instrumentation. A record with
+#                         the time of each stage is written for
+#                         every image
+#        cache: optional MaskCache. Cached masks are used instead of
+#               running the model, new masks are added to it
+#        model_path: path of the model file, needed by the cache
+#        area_only: only count the pixels with honey of every tile
+#                   (see count_honey_pixels). No mask is built nor
+#                   written, and the cache and coarse_scale are not
+#                   used
+# Return:
+#        generator of ImageResult, in order of completion
+#------------------------------------------------------------
+def process_images(paths, model, cm2_per_pixel, output_folder=None, mask_format="png", save_highlighted=False,
+                   batch_size=None, overlap=default_overlap, merge=default_merge, prefilter=None, coarse_scale=None,
+                   decode_workers=2, inference_workers=1, encode_workers=2, queue_size=2, instrumentation=None, cache=None,
+                   model_path=None, area_only=False):
+  if instrumentation is None:
+    instrumentation = Instrumentation()
+  if area_only:
+    cache = None
+  if cache is not None and model_path is None:
+    raise ValueError("The mask cache needs the path of the model")
+
+  def decode(item):
+    item.recorder = instrumentation.recorder(image=str(item.path))
+
+    if cache is not None:
+      with item.recorder.span("cache"):
+        item.cache_key = cache.key(item.path, model_path, overlap=overlap, merge=merge, prefilter=prefilter,
+                                   coarse_scale=coarse_scale)
+        item.mask = cache.get(item.cache_key)
+      if item.mask is not None:
+        item.recorder.count("cache_hits")
+        item.height, item.width = item.mask.shape
+        # the image is only needed to save the highlighted image
+        if not save_highlighted:
+          return
+
+    with item.recorder.span("decode"):
+      item.img = ImageBuffer.read(item.path)
+    item.height, item.width = item.img.height, item.img.width
+
+  def infer(item):
+    if item.mask is not None:
+      return
+
+    if area_only:
+      item.honey_pixels, item.tile_pixels = count_honey_pixels(item.img.array, model, tile_height, tile_width, overlap=overlap,
+                                                               batch_size=batch_size, channel_order=item.img.channel_order,
+                                                               recorder=item.recorder, prefilter=prefilter, per_tile=True)
+      item.img = None
+      return
+
+    item.mask = segment_image(item.img, model, overlap=overlap, merge=merge, batch_size=batch_size, recorder=item.recorder,
+                              prefilter=prefilter, coarse_scale=coarse_scale)
+
+    if cache is not None:
+      with item.recorder.span("cache"):
+        cache.put(item.cache_key, item.mask)
+
+  def encode(item):
+    if area_only:
+      item.area = honey_area(item.honey_pixels, cm2_per_pixel)
+      return
+
+    with item.recorder.span("area"):
+      item.honey_pixels = honey_pixels(item.mask)
+      item.area = honey_area(item.mask, cm2_per_pixel)
+
+    if output_folder is not None:
+      outputName = str(Path(output_folder) / item.path.stem)
+      with item.recorder.span("save"):
+        cv2.imwrite("{}_{}.{}".format(outputName, "honey-Mask", mask_format), item.mask)
+
+      if save_highlighted:
+        with item.recorder.span("blend"):
+          highlighted = highlight_honey(item.img.array, item.mask, item.img.channel_order)
+        with item.recorder.span("save"):
+          cv2.imwrite("{}_{}.{}".format(outputName, "honey-Highlighted", item.path.suffix[1:]), highlighted)
+
+      # release the images as soon as they are written
+      item.mask = None
+    item.img = None
+
+  stop = threading.Event()
+  pathsQueue = queue.Queue(maxsize=queue_size)
+  decodedQueue = queue.Queue(maxsize=queue_size)
+  predictedQueue = queue.Queue(maxsize=queue_size)
+  resultsQueue = queue.Queue(maxsize=queue_size)
+
+  stages = [
+    _Stage(instrumentation.profiled(decode), pathsQueue, decodedQueue, decode_workers, stop),
+    _Stage(instrumentation.profiled(infer), decodedQueue, predictedQueue, inference_workers, stop),
+    _Stage(instrumentation.profiled(encode), predictedQueue, resultsQueue, encode_workers, stop),
+  ]
+
+  # producer of the paths to process
+  def produce():
+    for path in paths:
+      if stop.is_set():
+        break
+      _put(pathsQueue, ImageResult(path), stop)
+    _put(pathsQueue, _finished, stop)
+
+  producer = threading.Thread(target=produce, daemon=True)
+  producer.start()
+  for stage in stages:
+    stage.start()
+
+  try:
+    while True:
+      item = resultsQueue.get()
+      if item is _finished:
+        break
+
+      if item.recorder is not None:
+        item.recorder.fields.update(width=item.width, height=item.height, error=None if item.error is None else str(item.error))
+        instrumentation.emit(item.recorder)
+      yield item
+  finally:
+    # stop the workers if the results are no longer consumed
+    stop.set()
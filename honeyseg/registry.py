@@ -0,0 +1,209 @@
+#------------------------------------------------------------
+# Registry of named segmentation models, e.g. the default
+# EfficientNetB2-FPN and models fine-tuned for other hive types.
+# Every model has its metadata (tile size and threshold) and
+# several models are kept loaded at once: when the loaded models
+# exceed the memory budget the least recently used ones are
+# released, so switching between recent models needs no reload.
+#
+# The registry is stored as JSON:
+#
+#   {"models": [{"name": "EfficientNetB2-FPN",
+#                "path": "efficientnetb2-FPN.keras",
+#                "tile": [640, 640, 3], "threshold": 0.5,
+#                "description": "..."}]}
+#
+# Relative paths are relative to the folder of the JSON file.
+#------------------------------------------------------------
+import json # to read and write the registry
+import os # to manage actions of the operating system
+import threading # the models are loaded in background
+from collections import OrderedDict # loaded models in order of use
+from pathlib import Path # to manage system paths (windows, linux, etc)
+
+from .backends import default_backend, artifact_path, is_remote
+from .core import tile_height, tile_width, tile_channels, default_threshold
+from .models import ModelManager
+
+# file of the registry, in the configuration folder of the user
+default_registry_file = Path(os.environ.get("XDG_CONFIG_HOME", Path.home() / ".config")) / "honeyseg" / "models.json"
+
+# memory of the loaded models in bytes
+default_memory_budget = 2 * 1024 ** 3
+
+# environment variable with the memory budget in MB
+memory_env = "HONEYSEG_MODEL_MEMORY"
+
+# the runtimes do not report the memory of a model, so it is estimated from its file: the
+# weights are loaded once (1x the file) and the traced graph, the warm-up activations of a
+# tile and the buffers of the runtime take about as much again for the models of HoneySeg
+model_memory_factor = 2
+
+
+#------------------------------------------------------------
+# Class with a model of the registry and its metadata
+#------------------------------------------------------------
+class ModelEntry:
+  def __init__(self, name, path, tile=(tile_height, tile_width, tile_channels), threshold=default_threshold, description=""):
+    self.name = name # name of the model shown to the user
+    self.path = str(path) # path of the keras model (or URL of a server)
+    self.tile = tuple(tile) # (height, width, channels) of the input tiles
+    self.threshold = threshold # probability over which a pixel is honey
+    self.description = description # e.g. hive type the model was trained for
+
+  def as_dict(self):
+    return {"name": self.name, "path": self.path, "tile": list(self.tile), "threshold": self.threshold,
+            "description": self.description}
+
+
+#------------------------------------------------------------
+# Class with the registered models and the models loaded
+#------------------------------------------------------------
+class ModelRegistry:
+  def __init__(self, memory_budget=default_memory_budget, **load_options):
+    self.memory_budget = memory_budget # maximum memory of the loaded models in bytes
+    self.load_options = load_options # options of load_model, see ModelManager
+    self.entries = OrderedDict() # ModelEntry by name, in order of registration
+    self._loaded = OrderedDict() # (ModelManager, estimated bytes) by (model path, tile), least recently used first
+    self._lock = threading.Lock()
+
+  #------------------------------------------------------------
+  # Function to read a registry from a JSON file. An empty registry
+  # is returned if the file does not exist.
+  #
+  # Params:
+  #        path: path of the JSON file
+  #        memory_budget: maximum memory of the loaded models in
+  #                       bytes. None to take it from
+  #                       HONEYSEG_MODEL_MEMORY (MB) or the default
+  #        **load_options: options of load_model
+  # Return:
+  #        ModelRegistry
+  #------------------------------------------------------------
+  @classmethod
+  def from_file(cls, path=default_registry_file, memory_budget=None, **load_options):
+    if memory_budget is None:
+      memory = os.environ.get(memory_env)
+      memory_budget = int(float(memory) * 1024 ** 2) if memory else default_memory_budget
+
+    registry = cls(memory_budget, **load_options)
+    path = Path(path)
+    if not path.is_file():
+      return registry
+
+    with open(path) as registryFile:
+      description = json.load(registryFile)
+
+    for model in description.get("models", []):
+      modelPath = model["path"]
+      if not is_remote(modelPath) and not Path(modelPath).is_absolute():
+        modelPath = path.parent / modelPath
+      registry.register(model["name"], modelPath, model.get("tile", (tile_height, tile_width, tile_channels)),
+                        model.get("threshold", default_threshold), model.get("description", ""))
+
+    return registry
+
+  #------------------------------------------------------------
+  # Function to write the registry to a JSON file
+  #
+  # Params:
+  #        path: path of the JSON file
+  # Return:
+  #        None
+  #------------------------------------------------------------
+  def save(self, path=default_registry_file):
+    os.makedirs(Path(path).parent, exist_ok=True)
+    with open(path, "w") as registryFile:
+      json.dump({"models": [entry.as_dict() for entry in self.entries.values()]}, registryFile, indent=2)
+
+  #------------------------------------------------------------
+  # Function to add a model to the registry. A model with the same
+  # name is replaced.
+  #
+  # Params:
+  #        name: name of the model
+  #        path: path of the keras model (or URL of a server)
+  #        tile: (height, width, channels) of the input tiles
+  #        threshold: probability over which a pixel is honey
+  #        description: free text
+  # Return:
+  #        ModelEntry
+  #------------------------------------------------------------
+  def register(self, name, path, tile=(tile_height, tile_width, tile_channels), threshold=default_threshold, description=""):
+    entry = ModelEntry(name, path, tile, threshold, description)
+    self.entries[name] = entry
+    return entry
+
+  #------------------------------------------------------------
+  # Function to obtain the manager of a model, loading it if it is
+  # not loaded. The least recently used models are released if the
+  # loaded models exceed the memory budget. The model being
+  # obtained is never released, even if it alone exceeds it. The
+  # models are identified by their path and tile size, as the same
+  # file traced for other tiles is another model.
+  #
+  # Params:
+  #        name: name of the model
+  #        backend: inference backend, see honeyseg.backends
+  #        background: if True return without waiting for the
+  #                    model to be loaded
+  # Return:
+  #        ModelManager of the model
+  #------------------------------------------------------------
+  def manager(self, name, backend=default_backend, background=False):
+    entry = self.entries[name]
+    path = artifact_path(entry.path, backend)
+    key = (str(path), entry.tile)
+
+    with self._lock:
+      if key in self._loaded:
+        self._loaded.move_to_end(key)
+        manager = self._loaded[key][0]
+      else:
+        manager = ModelManager(entry.tile, **self.load_options)
+        size = 0 if is_remote(path) else os.path.getsize(path) * model_memory_factor
+        self._loaded[key] = (manager, size)
+        self._evict(keep=key)
+
+    manager.load(path, background=background)
+    return manager
+
+  #------------------------------------------------------------
+  # Function to obtain a loaded model, waiting for it to be loaded
+  #
+  # Params:
+  #        name: name of the model
+  #        backend: inference backend, see honeyseg.backends
+  # Return:
+  #        segmentation model
+  #------------------------------------------------------------
+  def get(self, name, backend=default_backend):
+    return self.manager(name, backend).get(artifact_path(self.entries[name].path, backend))
+
+  #------------------------------------------------------------
+  # Internal class function to release the least recently used
+  # models until the loaded models fit in the memory budget
+  #------------------------------------------------------------
+  def _evict(self, keep):
+    used = sum(size for _, size in self._loaded.values())
+    for key in list(self._loaded):
+      if used <= self.memory_budget:
+        break
+      if key == keep:
+        continue
+      manager, size = self._loaded.pop(key)
+      manager.release() # the model is freed once the segmentations using it finish
+      used -= size
+
+  #------------------------------------------------------------
+  # Function to obtain the models kept loaded
+  #
+  # Params:
+  #        None
+  # Return:
+  #        list of ((model path, tile), estimated bytes), least
+  #        recently used first
+  #------------------------------------------------------------
+  def loaded(self):
+    with self._lock:
+      return [(key, size) for key, (_, size) in self._loaded.items()]
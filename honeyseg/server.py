@@ -0,0 +1,351 @@
+#------------------------------------------------------------
+# Local HTTP server that keeps the segmentation model loaded and
+# warm for several clients (workstations, the application with the
+# "remote" backend, the command line with --model http://...).
+#
+# The tiles of concurrent requests are merged into shared batches:
+# a batch is predicted when it reaches the maximum batch size or
+# when its first tile has waited the maximum latency.
+#
+# Usage:
+#        python -m honeyseg.server [--model PATH] [--backend NAME]
+#               [--host 127.0.0.1] [--port 8765] [--max-batch-size 8]
+#               [--max-latency-ms 20] [--standin]
+#
+# Endpoints:
+#        GET  /health   information of the model, batching and
+#                       statistics (JSON)
+#        POST /predict  batch of tiles as .npy (uint8 or float32 in
+#                       range 0-1, n x 640 x 640 x 3). Returns the
+#                       float32 predictions as .npy
+#        POST /segment  encoded image (jpg, png...). Returns the mask
+#                       as PNG, or with ?area_only=1 the pixels with
+#                       honey as JSON. Query options: overlap,
+#                       threshold, merge, prefilter, cm2_per_pixel
+#------------------------------------------------------------
+import argparse # to parse the command line arguments
+import io # to read and write the .npy bodies
+import json # to write the information of the server
+import queue # tiles waiting to be predicted
+import sys # to write the errors
+import threading # to batch the tiles in background
+import time # to wait for the tiles of other requests
+import urllib.parse # to parse the options of the requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # to serve the requests
+import cv2 # opencv library to decode and encode images
+import numpy as np # to make calculations
+
+from .backends import backends, default_backend, artifact_path
+from .core import (check_overlap, tile_height, tile_width, tile_channels, default_overlap, default_threshold, default_merge, segment_image,
+                   count_honey_pixels, honey_pixels, honey_area)
+from .image import ImageBuffer
+from .models import ModelManager
+
+# address of the server
+default_host = "127.0.0.1"
+default_port = 8765
+
+# default URL of the server used by the clients, can be changed with HONEYSEG_SERVER
+server_env = "HONEYSEG_SERVER"
+default_server_url = "http://{}:{}".format(default_host, default_port)
+
+# batching of the tiles of concurrent requests
+default_max_batch_size = 8
+default_max_latency = 0.02
+
+# largest request body accepted, in bytes
+max_request_size = 1024 ** 3
+
+
+#------------------------------------------------------------
+# Internal class with the tiles of a request waiting to be
+# predicted
+#------------------------------------------------------------
+class _PendingTiles:
+  def __init__(self, inputs):
+    self.inputs = inputs # float32 tiles
+    self.predictions = None # float32 predictions, once predicted
+    self.error = None # exception raised while predicting
+    self.done = threading.Event()
+
+
+#------------------------------------------------------------
+# Class that merges the tiles of concurrent requests into shared
+# batches. It offers the predict method of a keras model, so the
+# tiling engine uses it as the model of every request.
+#------------------------------------------------------------
+class DynamicBatcher:
+  def __init__(self, model, max_batch_size=default_max_batch_size, max_latency=default_max_latency):
+    self.model = model # segmentation model
+    self.max_batch_size = max_batch_size # tiles of a batch
+    self.max_latency = max_latency # seconds the first tile of a batch waits for more tiles
+    self.batches = 0 # predicted batches
+    self.tiles = 0 # predicted tiles
+    self._queue = queue.Queue()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+
+  #------------------------------------------------------------
+  # Function to predict a batch of tiles. The tiles are split in
+  # chunks of at most max_batch_size tiles, merged with the tiles of
+  # other requests, and it waits until all of them are predicted.
+  #
+  # Params:
+  #        inputs: float32 batch of tiles in range 0-1
+  #        batch_size: not used, the batches are chosen by the batcher
+  #        verbose: not used
+  # Return:
+  #        float32 predictions
+  #------------------------------------------------------------
+  def predict(self, inputs, batch_size=None, verbose=0):
+    chunks = [_PendingTiles(inputs[first:first+self.max_batch_size]) for first in range(0, len(inputs), self.max_batch_size)]
+    for pending in chunks:
+      self._queue.put(pending)
+
+    for pending in chunks:
+      pending.done.wait()
+      if pending.error is not None:
+        raise pending.error
+
+    if len(chunks) == 1:
+      return chunks[0].predictions
+    return np.concatenate([pending.predictions for pending in chunks])
+
+  #------------------------------------------------------------
+  # Internal class function run in the batching thread
+  #------------------------------------------------------------
+  def _run(self):
+    carried = None # tiles that did not fit in the previous batch
+    while True:
+      first = carried if carried is not None else self._queue.get()
+      carried = None
+      if first is None:
+        return
+
+      # wait for the tiles of other requests until the batch is full or the first tiles waited too long
+      pending = [first]
+      count = len(first.inputs)
+      deadline = time.perf_counter() + self.max_latency
+      stop = False
+      while count < self.max_batch_size:
+        timeout = deadline - time.perf_counter()
+        if timeout <= 0:
+          break
+        try:
+          item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+          break
+        if item is None:
+          stop = True
+          break
+        if count + len(item.inputs) > self.max_batch_size:
+          carried = item # it starts the next batch, so no batch exceeds max_batch_size
+          break
+        pending.append(item)
+        count += len(item.inputs)
+
+      inputs = first.inputs if len(pending) == 1 else np.concatenate([item.inputs for item in pending])
+      try:
+        predictions = self.model.predict(inputs, batch_size=len(inputs), verbose=0)
+      except Exception as e:
+        for item in pending:
+          item.error = e
+      else:
+        start = 0
+        for item in pending:
+          item.predictions = predictions[start:start+len(item.inputs)]
+          start += len(item.inputs)
+        self.batches += 1
+        self.tiles += len(inputs)
+
+      for item in pending:
+        item.done.set()
+
+      if stop:
+        return
+
+  def close(self):
+    self._queue.put(None)
+    self._thread.join()
+
+
+#------------------------------------------------------------
+# Class of the HTTP server with the batcher shared by the requests
+#------------------------------------------------------------
+class HoneySegServer(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def __init__(self, address, batcher, model_name, verbose=False, tile=(tile_height, tile_width, tile_channels)):
+    super().__init__(address, _RequestHandler)
+    self.batcher = batcher # DynamicBatcher with the model
+    self.model_name = model_name # name of the model, shown in /health
+    self.tile = tuple(tile) # (height, width, channels) of the input tiles of the model
+    self.verbose = verbose # log every request
+    self.requests = 0 # served requests
+    self.requests_lock = threading.Lock() # the requests are served by several threads
+
+
+#------------------------------------------------------------
+# Internal class that serves a request
+#------------------------------------------------------------
+class _RequestHandler(BaseHTTPRequestHandler):
+  def log_message(self, format, *args):
+    if self.server.verbose:
+      super().log_message(format, *args)
+
+  def _send(self, status, body, content_type, headers=None):
+    self.send_response(status)
+    self.send_header("Content-Type", content_type)
+    self.send_header("Content-Length", str(len(body)))
+    for name, value in (headers or {}).items():
+      self.send_header(name, str(value))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def _send_json(self, status, data):
+    self._send(status, json.dumps(data).encode(), "application/json")
+
+  def _read_body(self):
+    length = int(self.headers.get("Content-Length", 0))
+    if not 0 < length <= max_request_size:
+      raise ValueError("The request must have a body of at most {} bytes".format(max_request_size))
+    return self.rfile.read(length)
+
+  def do_GET(self):
+    if urllib.parse.urlparse(self.path).path != "/health":
+      return self._send_json(404, {"error": "not found"})
+
+    batcher = self.server.batcher
+    self._send_json(200, {"model": self.server.model_name, "tile": list(self.server.tile),
+                          "max_batch_size": batcher.max_batch_size, "max_latency": batcher.max_latency,
+                          "requests": self.server.requests, "batches": batcher.batches, "tiles": batcher.tiles,
+                          "mean_batch_size": batcher.tiles / batcher.batches if batcher.batches else None})
+
+  def do_POST(self):
+    url = urllib.parse.urlparse(self.path)
+    options = dict(urllib.parse.parse_qsl(url.query))
+    with self.server.requests_lock:
+      self.server.requests += 1
+
+    try:
+      if url.path == "/predict":
+        self._predict()
+      elif url.path == "/segment":
+        self._segment(options)
+      else:
+        self._send_json(404, {"error": "not found"})
+    except (ValueError, KeyError) as e:
+      self._send_json(400, {"error": str(e)})
+    except Exception as e:
+      self._send_json(500, {"error": str(e)})
+
+  def _predict(self):
+    inputs = np.load(io.BytesIO(self._read_body()))
+    if inputs.ndim != 4 or inputs.shape[1:] != self.server.tile:
+      raise ValueError("The tiles must have shape n x {} x {} x {}".format(*self.server.tile))
+
+    # tiles sent as uint8 are scaled as fill_batch does
+    if inputs.dtype == np.uint8:
+      inputs = inputs.astype(np.float32) / 255.0
+
+    predictions = self.server.batcher.predict(inputs.astype(np.float32, copy=False))
+    body = io.BytesIO()
+    np.save(body, np.asarray(predictions, dtype=np.float32))
+    self._send(200, body.getvalue(), "application/x-npy")
+
+  def _segment(self, options):
+    img = cv2.imdecode(np.frombuffer(self._read_body(), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+      raise ValueError("Unable to decode the image")
+    img = ImageBuffer(img, "BGR")
+
+    batcher = self.server.batcher
+    overlap = float(options.get("overlap", default_overlap))
+    check_overlap(overlap) # an overlap of 1 or more would never finish
+    threshold = float(options.get("threshold", default_threshold))
+    prefilter = float(options["prefilter"]) if "prefilter" in options else None
+    cm2_per_pixel = float(options["cm2_per_pixel"]) if "cm2_per_pixel" in options else None
+
+    if options.get("area_only") in ("1", "true"):
+      pixels = count_honey_pixels(img.array, batcher, self.server.tile[0], self.server.tile[1], overlap=overlap, threshold=threshold,
+                                  batch_size=batcher.max_batch_size, channel_order=img.channel_order, prefilter=prefilter)
+      result = {"width": img.width, "height": img.height, "honey_pixels": pixels}
+      if cm2_per_pixel is not None:
+        result["area"] = honey_area(pixels, cm2_per_pixel)
+      return self._send_json(200, result)
+
+    mask = segment_image(img, batcher, overlap=overlap, threshold=threshold, batch_size=batcher.max_batch_size,
+                         merge=options.get("merge", default_merge), prefilter=prefilter, tile=self.server.tile[:2])
+    headers = {"X-Honey-Pixels": honey_pixels(mask)}
+    if cm2_per_pixel is not None:
+      headers["X-Honey-Area"] = honey_area(mask, cm2_per_pixel)
+    self._send(200, cv2.imencode(".png", mask)[1].tobytes(), "image/png", headers)
+
+
+#------------------------------------------------------------
+# Function to create a server. The model is given loaded, so the
+# server can be started with any model (e.g. a stand-in model).
+#
+# Params:
+#        model: segmentation model
+#        host: address to listen on
+#        port: port to listen on, 0 for any free port
+#        max_batch_size: tiles of a shared batch
+#        max_latency: seconds the first tile of a batch waits for the
+#                     tiles of other requests
+#        model_name: name of the model shown in /health
+#        verbose: log every request
+#        tile: (height, width, channels) of the input tiles of the
+#              model
+# Return:
+#        HoneySegServer, call serve_forever to serve the requests
+#------------------------------------------------------------
+def create_server(model, host=default_host, port=default_port, max_batch_size=default_max_batch_size,
+                  max_latency=default_max_latency, model_name=None, verbose=False, tile=(tile_height, tile_width, tile_channels)):
+  batcher = DynamicBatcher(model, max_batch_size, max_latency)
+  return HoneySegServer((host, port), batcher, model_name, verbose, tile)
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(prog="python -m honeyseg.server", description="Serve the segmentation model to several clients")
+  parser.add_argument("--model", default="defaults/honeyModels/efficientnetb2-FPN.keras", help="path to the keras segmentation model")
+  parser.add_argument("--backend", choices=backends, default=default_backend, help="inference backend (default: {})".format(default_backend))
+  parser.add_argument("--host", default=default_host, help="address to listen on (default: {})".format(default_host))
+  parser.add_argument("--port", type=int, default=default_port, help="port to listen on (default: {})".format(default_port))
+  parser.add_argument("--max-batch-size", type=int, default=default_max_batch_size, help="tiles of a shared batch (default: {})".format(default_max_batch_size))
+  parser.add_argument("--max-latency-ms", type=float, default=default_max_latency * 1000, help="milliseconds a tile waits for the tiles of other requests (default: {:.0f})".format(default_max_latency * 1000))
+  parser.add_argument("--tile", type=int, nargs=2, default=[tile_height, tile_width], metavar=("HEIGHT", "WIDTH"), help="size of the input tiles of the model (default: {} {})".format(tile_height, tile_width))
+  parser.add_argument("--standin", action="store_true", help="serve the numpy stand-in model instead of --model, for testing")
+  parser.add_argument("--verbose", action="store_true", help="log every request")
+  return parser
+
+
+def main(argv=None):
+  args = build_parser().parse_args(argv)
+
+  tile = (args.tile[0], args.tile[1], tile_channels)
+
+  if args.standin:
+    from .standin import StandInModel
+    model, modelName = StandInModel(), "standin"
+  else:
+    modelPath = artifact_path(args.model, args.backend)
+    model, modelName = ModelManager(tile).get(modelPath), str(modelPath)
+
+  server = create_server(model, args.host, args.port, args.max_batch_size, args.max_latency_ms / 1000, modelName, args.verbose,
+                         tile)
+  print("Serving {} on http://{}:{}".format(modelName, *server.server_address[:2]), file=sys.stderr)
+
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    server.batcher.close()
+
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
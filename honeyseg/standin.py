@@ -0,0 +1,51 @@
+#------------------------------------------------------------
+# Stand-in segmentation models with the same signature as the
+# HoneySeg model (640x640x3 tiles -> 640x640x1 probabilities). They
+# are randomly initialised, so their masks mean nothing, but they
+# allow benchmarking and testing the segmentation pipeline without
+# downloading the .keras model.
+#------------------------------------------------------------
+import numpy as np # to make calculations
+
+from .core import tile_height, tile_width, tile_channels
+
+
+#------------------------------------------------------------
+# Function to build a tiny randomly initialised keras model: two
+# 3x3 convolutions and a 1x1 convolution with a sigmoid output.
+#
+# Params:
+#        height: height of the input tiles
+#        width: width of the input tiles
+#        channels: channels of the input tiles
+#        seed: seed of the random weights
+# Return:
+#        keras model
+#------------------------------------------------------------
+def build_standin_keras_model(height=tile_height, width=tile_width, channels=tile_channels, seed=0):
+  import keras # to use keras api
+
+  keras.utils.set_random_seed(seed)
+
+  inputs = keras.Input(shape=(height, width, channels))
+  x = keras.layers.Conv2D(8, 3, padding="same", activation="relu")(inputs)
+  x = keras.layers.Conv2D(8, 3, padding="same", activation="relu")(x)
+  outputs = keras.layers.Conv2D(1, 1, activation="sigmoid")(x)
+
+  return keras.Model(inputs, outputs, name="honeyseg_standin")
+
+
+#------------------------------------------------------------
+# Class with a stand-in model that only needs numpy: a random
+# per-pixel linear combination of the channels followed by a
+# sigmoid. It has the predict method of a keras model.
+#------------------------------------------------------------
+class StandInModel:
+  def __init__(self, channels=tile_channels, seed=0):
+    rng = np.random.default_rng(seed)
+    self.weights = rng.normal(0, 4, size=(channels, 1)).astype(np.float32) # weight of each channel
+    self.bias = np.float32(-self.weights.sum() / 2) # centres the output around 0.5
+
+  def predict(self, inputs, batch_size=None, verbose=0):
+    logits = inputs @ self.weights + self.bias
+    return 1.0 / (1.0 + np.exp(-logits))
@@ -0,0 +1,330 @@
+#------------------------------------------------------------
+# Out-of-core segmentation of very large images (e.g. stitched
+# panoramas of several frames). The image is read in horizontal
+# bands with the height of a tile, only the row of tiles of each
+# band is predicted, and the rows of the mask (and of the image
+# with the honey highlighted) that are final are written to disk
+# before the next band is read. The memory used is proportional
+# to the width of the image times the height of a tile, not to
+# the size of the image.
+#
+# The bands are read without decoding the whole image from:
+#   - .npy files (uint8, height x width x 3, RGB)
+#   - TIFF files (needs tifffile; compressed or tiled TIFFs also
+#     need zarr)
+# Other formats are decoded in full with opencv first, so only
+# the rest of the process is out-of-core.
+#
+# The results are written to .npy files (rows appended as they are
+# final) or TIFF files (needs tifffile).
+#------------------------------------------------------------
+import os # to manage actions of the operating system
+from pathlib import Path # to manage system paths (windows, linux, etc)
+import cv2 # opencv library to process images
+import numpy as np # to make calculations
+
+from .core import (default_overlap, default_threshold, default_merge, default_window, tile_height, tile_width, start_points,
+                   segment_tiles, highlight_honey)
+from .image import convert_channel_order
+from .instrumentation import null_recorder
+
+
+#------------------------------------------------------------
+# Class of a source of bands stored as raw rows in a file (.npy
+# or uncompressed TIFF). Bands are read with a seek and a read
+# into the given buffer, so nothing else is kept in memory.
+#------------------------------------------------------------
+class RawBandSource:
+  def __init__(self, path, offset, shape, channel_order="RGB"):
+    self.path = Path(path)
+    self.offset = offset # position of the first row in the file
+    self.height, self.width, self.channels = shape
+    self.channel_order = channel_order
+    self._file = open(path, "rb")
+
+  def read(self, top, bottom, out):
+    rowBytes = self.width * self.channels
+    self._file.seek(self.offset + top * rowBytes)
+    if self._file.readinto(memoryview(out).cast("B")) != (bottom - top) * rowBytes:
+      raise ValueError("Unexpected end of file: " + str(self.path))
+
+  def close(self):
+    self._file.close()
+
+
+#------------------------------------------------------------
+# Class of a source of bands that is an array, e.g. an image
+# decoded in memory or a zarr array of a compressed TIFF
+#------------------------------------------------------------
+class ArrayBandSource:
+  def __init__(self, array, channel_order="BGR", path=None):
+    self.array = array
+    self.height, self.width, self.channels = array.shape
+    self.channel_order = channel_order
+    self.path = Path(path) if path is not None else None
+
+  def read(self, top, bottom, out):
+    out[...] = self.array[top:bottom]
+
+  def close(self):
+    pass
+
+
+#------------------------------------------------------------
+# Function to open a .npy or TIFF image to be read in bands
+#
+# Params:
+#        path: path of the image
+# Return:
+#        band source with the attributes height, width, channels
+#        and channel_order and the methods read(top, bottom, out)
+#        and close()
+#------------------------------------------------------------
+def open_band_source(path):
+  extension = os.path.splitext(str(path))[1].lower()
+
+  if extension == ".npy":
+    with open(path, "rb") as npyFile:
+      version = np.lib.format.read_magic(npyFile)
+      readHeader = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+      shape, fortran_order, dtype = readHeader(npyFile)
+      offset = npyFile.tell()
+
+    if fortran_order or dtype != np.uint8 or len(shape) != 3 or shape[2] != 3:
+      raise ValueError("Expected a C ordered uint8 height x width x 3 array: " + str(path))
+    return RawBandSource(path, offset, shape, "RGB")
+
+  if extension in (".tif", ".tiff"):
+    import tifffile # optional dependency, only needed for TIFF images
+
+    with tifffile.TiffFile(path) as tif:
+      page = tif.pages[0]
+      shape, dtype, contiguous = page.shape, page.dtype, page.is_contiguous
+
+      if dtype != np.uint8 or len(shape) != 3 or shape[2] != 3:
+        raise ValueError("Expected an 8 bits RGB TIFF: " + str(path))
+      if contiguous:
+        return RawBandSource(path, contiguous[0], shape, "RGB")
+
+    import zarr # optional dependency, only needed for compressed or tiled TIFF images
+    return ArrayBandSource(zarr.open(tifffile.imread(path, aszarr=True), mode="r"), "RGB", path)
+
+  # formats that can not be read in bands are decoded in full
+  img = cv2.imread(str(path))
+  if img is None:
+    raise ValueError("Unable to read image: " + str(path))
+  return ArrayBandSource(img, "BGR", path)
+
+
+#------------------------------------------------------------
+# Class that writes an image to a .npy file row by row. The
+# header is written first and the rows are appended in order.
+#------------------------------------------------------------
+class NpyBandWriter:
+  def __init__(self, path, shape):
+    self.path = Path(path)
+    self.shape = tuple(shape)
+    self.rows = 0 # rows written so far
+    self._file = open(path, "wb")
+    np.lib.format.write_array_header_1_0(self._file, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.uint8)),
+                                                      "fortran_order": False, "shape": self.shape})
+
+  def write(self, rows):
+    self._file.write(np.ascontiguousarray(rows, dtype=np.uint8).data)
+    self.rows += rows.shape[0]
+
+  def close(self):
+    self._file.close()
+
+
+#------------------------------------------------------------
+# Class that writes an image to an uncompressed TIFF file row by
+# row through a memory map. Each band is flushed after writing.
+#------------------------------------------------------------
+class TiffBandWriter:
+  def __init__(self, path, shape):
+    import tifffile # optional dependency, only needed for TIFF outputs
+
+    self.path = Path(path)
+    self.shape = tuple(shape)
+    self.rows = 0 # rows written so far
+    self._map = tifffile.memmap(str(path), shape=self.shape, dtype=np.uint8, photometric="rgb" if len(shape) == 3 else "minisblack")
+
+  def write(self, rows):
+    self._map[self.rows:self.rows+rows.shape[0]] = rows
+    self._map.flush()
+    self.rows += rows.shape[0]
+
+  def close(self):
+    self._map.flush()
+    del self._map
+
+
+#------------------------------------------------------------
+# Function to create the file of a result written in bands
+#
+# Params:
+#        path: path of the file (.npy, .tif or .tiff)
+#        shape: (height, width) of a mask or (height, width, 3)
+#               of an RGB image
+# Return:
+#        writer with the methods write(rows) and close()
+#------------------------------------------------------------
+def open_band_writer(path, shape):
+  extension = os.path.splitext(str(path))[1].lower()
+
+  if extension == ".npy":
+    return NpyBandWriter(path, shape)
+  if extension in (".tif", ".tiff"):
+    return TiffBandWriter(path, shape)
+
+  raise ValueError("Results can only be written in bands to .npy or TIFF files: " + str(path))
+
+
+#------------------------------------------------------------
+# Function to segment an image read in bands. The tiles are the
+# same of segment_tiles, processed one row of tiles at a time. The
+# mask of the rows not covered by the next row of tiles is final,
+# so it is written and the band moves down: the rows shared with
+# the next row of tiles are kept and only the new rows are read.
+#
+# Params:
+#        source: band source, see open_band_source
+#        model: keras segmentation model
+#        mask_path: .npy/TIFF file of the mask. None to not save it
+#        overlay_path: .npy/TIFF file of the image with the honey
+#                      highlighted (RGB). None to not save it
+#        overlap, threshold, batch_size, merge, window, cancel,
+#        recorder, prefilter: see segment_tiles
+#        callback: optional function called as callback(done, total)
+#                  after each batch is processed
+# Return:
+#        number of pixels with honey
+#------------------------------------------------------------
+def segment_streaming(source, model, mask_path=None, overlay_path=None, overlap=default_overlap, threshold=default_threshold,
+                      batch_size=None, merge=default_merge, window=default_window, callback=None, cancel=None, recorder=None,
+                      prefilter=None):
+  if recorder is None:
+    recorder = null_recorder
+
+  height, width = source.height, source.width
+  if height < tile_height or width < tile_width:
+    raise ValueError("The image is smaller than a tile: {}x{}".format(width, height))
+
+  yPoints = start_points(height, tile_height, overlap)
+  rowPoints = [(0, x) for x in start_points(width, tile_width, overlap)]
+  total = len(yPoints) * len(rowPoints)
+
+  # buffers with the rows of the current band of tiles
+  band = np.empty((tile_height, width, source.channels), dtype=np.uint8)
+  maskBand = np.zeros((tile_height, width), dtype=np.uint8)
+  evidenceBand = np.zeros((tile_height, width), dtype=np.float32) if merge == "blend" else None
+
+  maskWriter = open_band_writer(mask_path, (height, width)) if mask_path is not None else None
+  overlayWriter = open_band_writer(overlay_path, (height, width, 3)) if overlay_path is not None else None
+
+  bandTop = 0 # first row of the image in the band
+  loaded = 0 # rows of the band already read
+  pixels = 0
+
+  try:
+    for k, y in enumerate(yPoints):
+      # keep the rows shared with the previous band and read the new ones
+      shift = y - bandTop
+      if shift:
+        keep = loaded - shift
+        band[:keep] = band[shift:loaded]
+        maskBand[:keep] = maskBand[shift:loaded]
+        maskBand[keep:] = 0
+        if evidenceBand is not None:
+          evidenceBand[:keep] = evidenceBand[shift:loaded]
+          evidenceBand[keep:] = 0
+        bandTop, loaded = y, keep
+
+      with recorder.span("read"):
+        source.read(bandTop + loaded, bandTop + tile_height, band[loaded:])
+      loaded = tile_height
+
+      def rowProgress(done, rowTotal):
+        if callback is not None:
+          callback(k * len(rowPoints) + done, total)
+
+      segment_tiles(band, model, tile_height, tile_width, threshold=threshold, batch_size=batch_size, callback=rowProgress,
+                    channel_order=source.channel_order, merge=merge, window=window, cancel=cancel, out=maskBand,
+                    recorder=recorder, prefilter=prefilter, points=rowPoints, evidence=evidenceBand)
+
+      # rows that are not covered by the next row of tiles are final
+      final = (yPoints[k+1] if k + 1 < len(yPoints) else height) - y
+      pixels += int(np.count_nonzero(maskBand[:final]))
+
+      if maskWriter is not None:
+        with recorder.span("save"):
+          maskWriter.write(maskBand[:final])
+
+      if overlayWriter is not None:
+        with recorder.span("blend"):
+          overlay = highlight_honey(band[:final], maskBand[:final], source.channel_order)
+          overlay = convert_channel_order(overlay, source.channel_order, "RGB")
+        with recorder.span("save"):
+          overlayWriter.write(overlay)
+  finally:
+    for writer in (maskWriter, overlayWriter):
+      if writer is not None:
+        writer.close()
+
+  return pixels
+
+
+#------------------------------------------------------------
+# Function to process many images with segment_streaming, one
+# after another. It gives the same results of
+# honeyseg.pipeline.process_images for images too large to be
+# kept in memory.
+#
+# Params:
+#        paths: paths of the images to process
+#        model: keras segmentation model
+#        cm2_per_pixel: surface of a pixel in cm2
+#        output_folder: folder where the masks are written. None
+#                       to only compute the area
+#        mask_format: "npy", "tif" or "tiff"
+#        save_highlighted: also write the image with the honey
+#                          highlighted, in mask_format
+#        batch_size, overlap, merge, prefilter: see segment_tiles
+#        instrumentation: optional Instrumentation. A record with
+#                         the time of each stage is written for
+#                         every image
+# Return:
+#        generator of ImageResult
+#------------------------------------------------------------
+def stream_images(paths, model, cm2_per_pixel, output_folder=None, mask_format="npy", save_highlighted=False, batch_size=None,
+                  overlap=default_overlap, merge=default_merge, prefilter=None, instrumentation=None):
+  from .pipeline import ImageResult
+
+  for path in paths:
+    result = ImageResult(path)
+    result.recorder = null_recorder if instrumentation is None else instrumentation.recorder(image=str(result.path))
+
+    maskPath = overlayPath = None
+    if output_folder is not None:
+      outputName = str(Path(output_folder) / result.path.stem)
+      maskPath = "{}_{}.{}".format(outputName, "honey-Mask", mask_format)
+      if save_highlighted:
+        overlayPath = "{}_{}.{}".format(outputName, "honey-Highlighted", mask_format)
+
+    try:
+      source = open_band_source(path)
+      try:
+        result.height, result.width = source.height, source.width
+        result.honey_pixels = segment_streaming(source, model, maskPath, overlayPath, overlap=overlap, batch_size=batch_size,
+                                                merge=merge, recorder=result.recorder, prefilter=prefilter)
+        result.area = round(float(cm2_per_pixel) * result.honey_pixels, 4)
+      finally:
+        source.close()
+    except Exception as e:
+      result.error = e
+
+    if instrumentation is not None:
+      result.recorder.fields.update(width=result.width, height=result.height, error=None if result.error is None else str(result.error))
+      instrumentation.emit(result.recorder)
+    yield result
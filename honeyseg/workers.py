@@ -0,0 +1,217 @@
+#------------------------------------------------------------
+# Pool of worker processes that run the segmentation model. Each
+# process loads its own instance of the model once and limits the
+# threads of its runtime, so several processes share the cores of
+# the machine without their thread pools fighting each other.
+#
+# The pool offers the predict method of a keras model: every batch
+# of tiles is split between the processes, so the tiling engine,
+# the pipeline and the application use it as any other model.
+# autotune_workers measures the tiles per second of a few
+# processes x threads splits and picks the fastest one. Each split
+# starts its own pool, closed before the next one starts, so every
+# try loads the model once per process and the pool kept for the
+# fastest split loads it again. The tiles are sent to the
+# processes as uint8, 4 times less data than the float32 tiles, and
+# scaled to 0-1 in the processes.
+#------------------------------------------------------------
+import multiprocessing # to run the models in several processes
+import os # to manage actions of the operating system
+import sys # to know if tensorflow is already imported
+import time # to measure the tiles per second
+import numpy as np # to make calculations
+
+from .core import tile_height, tile_width, tile_channels
+
+# tiles predicted at once by each process
+default_worker_batch_size = 2
+
+# model of the current worker process
+_workerModel = None
+
+# error raised while loading the model of the current worker process
+_workerError = None
+
+
+#------------------------------------------------------------
+# Function to obtain the number of cores available to the process
+#
+# Params:
+#        None
+# Return:
+#        number of cores
+#------------------------------------------------------------
+def available_cores():
+  try:
+    return len(os.sched_getaffinity(0)) # cores the process is allowed to use (Linux)
+  except AttributeError:
+    return os.cpu_count() or 1
+
+
+#------------------------------------------------------------
+# Function to limit the threads used by TensorFlow (and OpenMP).
+# It must be called before TensorFlow runs any operation. The
+# limits are given with environment variables, read by TensorFlow
+# when it is imported, and also applied to TensorFlow if it is
+# already imported.
+#
+# Params:
+#        intra_op_threads: threads used inside an operation
+#        inter_op_threads: operations run in parallel
+# Return:
+#        None
+#------------------------------------------------------------
+def configure_threads(intra_op_threads, inter_op_threads=1):
+  os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_op_threads)
+  os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_op_threads)
+  os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+
+  tf = sys.modules.get("tensorflow")
+  if tf is None:
+    return
+
+  tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+  tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+#------------------------------------------------------------
+# Internal function run once in every worker process to load its
+# model. An error is kept and raised by _predict: if it left the
+# initializer, the pool would start the process again and again and
+# the predictions would never end.
+#------------------------------------------------------------
+def _init_worker(model_path, threads, factory, tile, load_options):
+  global _workerModel, _workerError
+
+  try:
+    if factory is not None:
+      _workerModel = factory()
+      return
+
+    from .models import ModelManager
+
+    # TensorFlow takes the threads before the model is loaded, TFLite and ONNX when it is loaded
+    configure_threads(threads)
+    _workerModel = ModelManager(tile, num_threads=threads, **load_options).get(model_path)
+  except Exception as error:
+    _workerError = error
+
+
+#------------------------------------------------------------
+# Internal function run in the worker processes to predict a
+# chunk of a batch
+#------------------------------------------------------------
+def _predict(tiles):
+  if _workerError is not None:
+    raise _workerError
+
+  inputs = tiles.astype(np.float32) / 255.0 # scaled as fill_batch does
+  return np.asarray(_workerModel.predict(inputs, batch_size=len(inputs), verbose=0), dtype=np.float32)
+
+
+#------------------------------------------------------------
+# Class with a pool of processes, each one with its own model. The
+# processes are started with "spawn", as TensorFlow can not be
+# used after a fork.
+#------------------------------------------------------------
+class WorkerPool:
+  def __init__(self, model_path, processes, threads=None, worker_batch_size=default_worker_batch_size, factory=None,
+               tile=(tile_height, tile_width, tile_channels), **load_options):
+    if processes < 1:
+      raise ValueError("The pool needs at least one process")
+
+    self.model_path = model_path # path of the model loaded by every process
+    self.processes = processes # number of processes
+    self.tile = tuple(tile) # (height, width, channels) of the input tiles, used to trace and warm up the models
+    self.threads = threads or max(1, available_cores() // processes) # threads of the runtime of each process
+    self.batch_size = processes * worker_batch_size # tiles of a batch that keeps all the processes busy
+    self._pool = multiprocessing.get_context("spawn").Pool(processes, initializer=_init_worker,
+                                                           initargs=(model_path, self.threads, factory, self.tile, load_options))
+
+  #------------------------------------------------------------
+  # Function to predict a batch of tiles, split between the
+  # processes
+  #
+  # Params:
+  #        inputs: float32 batch of tiles in range 0-1
+  #        batch_size: not used, the whole batch is predicted at once
+  #        verbose: not used
+  # Return:
+  #        float32 predictions
+  #------------------------------------------------------------
+  def predict(self, inputs, batch_size=None, verbose=0):
+    tiles = np.round(inputs * 255).astype(np.uint8) # the tiles of fill_batch are uint8 values scaled to 0-1
+    chunks = np.array_split(tiles, min(self.processes, len(tiles)))
+    return np.concatenate(self._pool.map(_predict, chunks, chunksize=1))
+
+  def close(self):
+    self._pool.terminate()
+    self._pool.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+#------------------------------------------------------------
+# Function to measure the tiles per second of several splits of
+# the cores between processes and threads
+#
+# Params:
+#        model_path: path of the model (.keras, .tflite or .onnx)
+#        cores: cores to use. None for all the available cores
+#        process_counts: numbers of processes to try. None for 1,
+#                        half the cores and all the cores, as every
+#                        process of every try loads the model
+#        tiles: tiles predicted to measure each split
+#        worker_batch_size: tiles predicted at once by each process
+#        factory: optional function that builds the model of each
+#                 process instead of loading model_path
+#        callback: optional function called with the result of
+#                  each split
+#        tile: (height, width, channels) of the input tiles
+#        keep_pool: start again a pool with the fastest split and
+#                   return it in the "pool" item of the best result
+#        **load_options: options of load_model
+# Return:
+#        (best result, list of results). Each result is a
+#        dictionary with the processes, threads and tiles_per_second
+#------------------------------------------------------------
+def autotune_workers(model_path, cores=None, process_counts=None, tiles=32, worker_batch_size=default_worker_batch_size,
+                     factory=None, callback=None, tile=(tile_height, tile_width, tile_channels), keep_pool=False, **load_options):
+  cores = cores or available_cores()
+  if process_counts is None:
+    process_counts = sorted({1, max(1, cores // 2), cores})
+
+  inputs = np.random.default_rng(0).random((tiles,) + tuple(tile), dtype=np.float32)
+  results = []
+  best = None
+
+  for processes in process_counts:
+    threads = max(1, cores // processes)
+
+    # a single pool is open at a time, so at most cores processes run
+    with WorkerPool(model_path, processes, threads, worker_batch_size, factory, tile, **load_options) as pool:
+      # the first batch waits for the models to be loaded and warmed up
+      pool.predict(inputs[:pool.batch_size])
+
+      start = time.perf_counter()
+      for first in range(0, tiles, pool.batch_size):
+        pool.predict(inputs[first:first+pool.batch_size])
+      elapsed = time.perf_counter() - start
+
+    result = {"processes": processes, "threads": threads, "tiles_per_second": tiles / elapsed}
+    results.append(result)
+    if callback is not None:
+      callback(result)
+
+    if best is None or result["tiles_per_second"] > best["tiles_per_second"]:
+      best = result
+
+  if not keep_pool:
+    return best, results
+
+  pool = WorkerPool(model_path, best["processes"], best["threads"], worker_batch_size, factory, tile, **load_options)
+  return dict(best, pool=pool), results
@@ -0,0 +1,38 @@
+#------------------------------------------------------------
+# Fixtures shared by the tests. The segmentation is tested with a
+# small numpy model (a per-pixel logistic function of the colour)
+# and synthetic images, so neither keras nor the HoneySeg model
+# are needed.
+#------------------------------------------------------------
+import numpy as np
+import pytest
+
+
+#------------------------------------------------------------
+# Class with a model that predicts every pixel from its colour,
+# with the input and output of the HoneySeg model
+#------------------------------------------------------------
+class ColourModel:
+  def __init__(self):
+    self.weights = np.array([[0.5], [-0.5], [2.5]], dtype=np.float32) # weight of each channel (RGB)
+    self.bias = np.float32(-1.25) # about half of the pixels of a synthetic image are honey
+
+  def predict(self, inputs, batch_size=None, verbose=0):
+    return 1.0 / (1.0 + np.exp(-(inputs @ self.weights + self.bias)))
+
+
+@pytest.fixture
+def model():
+  return ColourModel()
+
+
+# builds RGB images with colour gradients and noise: function(height=1500, width=1700, seed=0)
+@pytest.fixture
+def synthetic_image():
+  def build(height=1500, width=1700, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    img = np.stack([(x * 255) // width, (y * 255) // height, ((x + y) * 255) // (width + height)], axis=-1)
+    return np.clip(img + rng.integers(-40, 40, img.shape), 0, 255).astype(np.uint8)
+
+  return build
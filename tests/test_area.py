@@ -0,0 +1,74 @@
+#------------------------------------------------------------
+# Tests of the area-only mode: the pixels with honey counted per
+# owned tile region must be those of the full mask.
+#------------------------------------------------------------
+import numpy as np
+import pytest
+
+from honeyseg import (count_honey_pixels, ownership_bounds, prefilter_tiles, segment_area, segment_tiles, start_points, tile_points,
+                      honey_area, honey_pixels, tile_height, tile_width)
+
+
+@pytest.mark.parametrize("size", [2000, 1920, 700, 640])
+@pytest.mark.parametrize("overlap", [0, 0.25, 0.5])
+def test_owned_regions_split_the_image(size, overlap):
+  points = start_points(size, tile_width, overlap)
+  owned = np.zeros(size, dtype=int)
+  for point, (start, end) in zip(points, ownership_bounds(points, tile_width, size)):
+    assert 0 <= start < end <= tile_width
+    owned[point+start:point+end] += 1
+
+  assert (owned == 1).all()
+
+
+@pytest.mark.parametrize("merge", ["blend", "or"])
+def test_count_matches_mask_without_overlap(model, synthetic_image, merge):
+  img = synthetic_image(1280, 1920) # the tiles do not overlap at all
+
+  mask = segment_tiles(img, model, tile_height, tile_width, overlap=0, merge=merge)
+  pixels, tilePixels = count_honey_pixels(img, model, tile_height, tile_width, overlap=0, batch_size=4, per_tile=True)
+
+  assert pixels == honey_pixels(mask)
+  assert sum(tilePixels.values()) == pixels
+  for (i, j), count in tilePixels.items():
+    assert count == honey_pixels(mask[i:i+tile_height, j:j+tile_width])
+
+
+@pytest.mark.parametrize("overlap", [0, 0.25, 0.5])
+def test_count_matches_mask_of_owned_regions(model, synthetic_image, overlap):
+  img = synthetic_image()
+
+  # mask where every pixel comes from the tile that owns it
+  yPoints = start_points(img.shape[0], tile_height, overlap)
+  xPoints = start_points(img.shape[1], tile_width, overlap)
+  yBounds = dict(zip(yPoints, ownership_bounds(yPoints, tile_height, img.shape[0])))
+  xBounds = dict(zip(xPoints, ownership_bounds(xPoints, tile_width, img.shape[1])))
+  mask = np.zeros(img.shape[:2], dtype=np.uint8)
+  for i, j in tile_points(img.shape[0], img.shape[1], tile_height, tile_width, overlap):
+    tile = img[i:i+tile_height, j:j+tile_width].astype(np.float32) / 255.0
+    prediction = model.predict(tile[np.newaxis], verbose=0)[0, :, :, 0] > 0.5
+    (top, bottom), (left, right) = yBounds[i], xBounds[j]
+    mask[i+top:i+bottom, j+left:j+right] = prediction[top:bottom, left:right]
+
+  assert count_honey_pixels(img, model, tile_height, tile_width, overlap=overlap) == honey_pixels(mask)
+
+
+def test_prefiltered_count_matches_prefiltered_mask(model, synthetic_image):
+  img = synthetic_image(1280, 1920)
+  img[:640] = (40, 120, 40) # vegetation, skipped by the prefilter
+  img[640:800] = (200, 130, 30) # honey coloured band, the tiles below it are predicted
+
+  points, skipped = prefilter_tiles(img, tile_points(1280, 1920, tile_height, tile_width, 0), tile_height, tile_width, 0.05)
+  assert len(points) == 3 and len(skipped) == 3
+
+  mask = segment_tiles(img, model, tile_height, tile_width, overlap=0, prefilter=0.05)
+  assert honey_pixels(mask[640:]) > 0
+  assert count_honey_pixels(img, model, tile_height, tile_width, overlap=0, prefilter=0.05) == honey_pixels(mask)
+
+
+def test_segment_area(model, synthetic_image):
+  img = synthetic_image(1280, 1920)
+
+  area, tilePixels = segment_area(img, model, 0.0004, overlap=0, per_tile=True)
+  assert area == honey_area(segment_tiles(img, model, tile_height, tile_width, overlap=0), 0.0004)
+  assert len(tilePixels) == 6
@@ -0,0 +1,85 @@
+#------------------------------------------------------------
+# Tests of the mask cache: the keys must identify the image, the
+# model and the settings, the masks must be read as they were
+# stored and the least recently used masks must be removed first.
+#------------------------------------------------------------
+import os
+
+import numpy as np
+import pytest
+
+from honeyseg import MaskCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+  return MaskCache(tmp_path / "masks")
+
+
+@pytest.fixture
+def files(tmp_path):
+  paths = {}
+  for name, content in [("image.jpg", b"image"), ("other.jpg", b"other image"), ("model.onnx", b"model"),
+                        ("other.onnx", b"other model")]:
+    paths[name] = tmp_path / name
+    paths[name].write_bytes(content)
+  return paths
+
+
+def build_mask(height=50, width=37, seed=0):
+  return (np.random.default_rng(seed).random((height, width)) > 0.5).astype(np.uint8) * 255
+
+
+def test_key_changes_with_the_image_the_model_and_the_settings(cache, files):
+  key = cache.key(files["image.jpg"], files["model.onnx"])
+
+  assert cache.key(files["image.jpg"], files["model.onnx"]) == key
+  assert cache.key(files["other.jpg"], files["model.onnx"]) != key
+  assert cache.key(files["image.jpg"], files["other.onnx"]) != key
+  assert cache.key(files["image.jpg"], files["model.onnx"], overlap=0.5) != key
+  assert cache.key(files["image.jpg"], files["model.onnx"], threshold=0.7) != key
+  assert cache.key(files["image.jpg"], files["model.onnx"], merge="or") != key
+  assert cache.key(files["image.jpg"], files["model.onnx"], prefilter=0.01) != key
+  assert cache.key(files["image.jpg"], files["model.onnx"], coarse_scale=0.25) != key
+  assert cache.key(files["image.jpg"], files["model.onnx"], tile=(512, 512)) != key
+
+  # the key depends on the content of the image, not on its modification time
+  files["image.jpg"].write_bytes(b"edited image")
+  assert cache.key(files["image.jpg"], files["model.onnx"]) != key
+
+
+@pytest.mark.parametrize("width", [37, 40, 1])
+def test_round_trip(cache, width):
+  mask = build_mask(width=width)
+
+  assert cache.get("missing") is None
+  cache.put("mask", mask)
+
+  np.testing.assert_array_equal(cache.get("mask"), mask)
+  with np.load(cache.folder / "mask.npz") as cached:
+    assert cached["mask"].shape == (mask.shape[0], -(-width // 8)) # stored packed to 1 bit per pixel
+  assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evict_removes_the_least_recently_used_masks(cache):
+  for time, key in enumerate(["a", "b", "c"]):
+    cache.put(key, build_mask(seed=time))
+    os.utime(cache.folder / (key + ".npz"), (time, time))
+
+  cache.get("a") # a is now the most recently used mask
+  cache.max_size = sum(path.stat().st_size for path in cache.folder.glob("*.npz")) - 1
+
+  assert cache.evict() == 1
+  assert cache.get("b") is None
+  assert cache.get("a") is not None and cache.get("c") is not None
+
+
+@pytest.mark.parametrize("size", [0, 30])
+def test_corrupt_mask_is_a_miss(cache, size):
+  cache.put("mask", build_mask())
+  path = cache.folder / "mask.npz"
+  path.write_bytes(path.read_bytes()[:size]) # truncated file
+
+  assert cache.get("mask") is None
+  assert not path.exists()
+  assert cache.misses == 1
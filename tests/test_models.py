@@ -0,0 +1,63 @@
+#------------------------------------------------------------
+# Tests of the model manager and the registry: a model released
+# while it is obtained must be loaded again and a failed load must
+# not look ready.
+#------------------------------------------------------------
+import pytest
+
+from honeyseg import ModelManager, ModelRegistry, models
+from honeyseg.standin import StandInModel
+
+
+@pytest.fixture
+def model_files(tmp_path):
+  paths = []
+  for name in ["a.keras", "b.keras"]:
+    path = tmp_path / name
+    path.write_bytes(b"model")
+    paths.append(path)
+  return paths
+
+
+def test_model_released_during_get_is_loaded_again(monkeypatch, model_files):
+  monkeypatch.setattr(models, "load_model", lambda path, tile, **load_options: StandInModel())
+  registry = ModelRegistry(memory_budget=0) # only the model being obtained is kept loaded
+  registry.register("a", model_files[0])
+  registry.register("b", model_files[1])
+  manager = registry.manager("a")
+  load = manager.load
+  loads = []
+
+  # the registry loads b, and so releases a, between the load of a and the read of its model
+  def load_then_evict(path, background=False):
+    load(path, background)
+    loads.append(path)
+    if len(loads) == 1:
+      registry.manager("b")
+
+  monkeypatch.setattr(manager, "load", load_then_evict)
+
+  assert isinstance(manager.get(model_files[0]), StandInModel)
+  assert len(loads) == 2
+  assert [key for key, _ in registry.loaded()] == [(str(model_files[1]), registry.entries["b"].tile)] # a was released
+
+
+def test_failed_load_is_not_ready(monkeypatch, model_files):
+  def load_model(path, tile, **load_options):
+    raise OSError("the model file is truncated")
+
+  monkeypatch.setattr(models, "load_model", load_model)
+  manager = ModelManager()
+
+  manager.load(model_files[0])
+  assert not manager.is_ready() and manager.has_failed()
+
+  with pytest.raises(OSError, match="truncated"):
+    manager.get(model_files[0])
+
+  monkeypatch.setattr(models, "load_model", lambda path, tile, **load_options: StandInModel())
+  assert isinstance(manager.get(model_files[0]), StandInModel)
+  assert manager.is_ready() and not manager.has_failed()
+
+  manager.release()
+  assert not manager.is_ready()
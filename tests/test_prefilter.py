@@ -0,0 +1,56 @@
+#------------------------------------------------------------
+# Tests of the colour prefilter: the tiles without honey colours
+# must be skipped and the mask of the other tiles must be the one
+# of the segmentation without prefilter.
+#------------------------------------------------------------
+import numpy as np
+import pytest
+
+from honeyseg import prefilter_tiles, segment_tiles, tile_honey_score, tile_points, tile_height, tile_width
+
+# RGB colours of the tiles of the test image
+vegetation = (40, 120, 40)
+sky = (120, 170, 230)
+dark = (15, 15, 15)
+honey = (200, 130, 30)
+wood = (150, 110, 70)
+
+
+# builds an image of 2 x 3 tiles, each one of a colour with noise
+def build_image(colours, seed=0):
+  rng = np.random.default_rng(seed)
+  img = np.zeros((2 * tile_height, 3 * tile_width, 3), dtype=np.int64)
+  for (i, j), colour in zip(tile_points(2 * tile_height, 3 * tile_width, tile_height, tile_width, 0), colours):
+    img[i:i+tile_height, j:j+tile_width] = colour
+  return np.clip(img + rng.integers(-15, 15, img.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("colour", [vegetation, sky, dark])
+def test_tiles_without_honey_colours_score_zero(colour):
+  assert tile_honey_score(build_image([colour] * 6)[:tile_height, :tile_width]) == 0
+
+
+# wooden frames have the colour of amber honey, see tile_honey_score
+def test_wood_tiles_are_predicted():
+  assert tile_honey_score(build_image([wood] * 6)[:tile_height, :tile_width]) > 0.5
+
+
+@pytest.mark.parametrize("channel_order", ["RGB", "BGR"])
+def test_prefiltered_mask_matches_on_tiles_with_honey(model, synthetic_image, channel_order):
+  img = build_image([vegetation, sky, dark, honey, wood, honey])
+  img[-tile_height//2:] = synthetic_image(tile_height // 2, img.shape[1]) # the model finds honey in the lower half of the honey tiles
+  points = tile_points(img.shape[0], img.shape[1], tile_height, tile_width, 0)
+  if channel_order == "BGR":
+    img = np.ascontiguousarray(img[:, :, ::-1])
+
+  kept, skipped = prefilter_tiles(img, points, tile_height, tile_width, channel_order=channel_order)
+  assert skipped == points[:3]
+
+  mask = segment_tiles(img, model, tile_height, tile_width, overlap=0, prefilter=0.05, channel_order=channel_order)
+  fullMask = segment_tiles(img, model, tile_height, tile_width, overlap=0, channel_order=channel_order)
+
+  for i, j in skipped:
+    assert not mask[i:i+tile_height, j:j+tile_width].any()
+  for i, j in kept:
+    np.testing.assert_array_equal(mask[i:i+tile_height, j:j+tile_width], fullMask[i:i+tile_height, j:j+tile_width])
+  assert fullMask[tile_height:, :tile_width].any() and fullMask[tile_height:, -tile_width:].any()
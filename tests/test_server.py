@@ -0,0 +1,106 @@
+#------------------------------------------------------------
+# Tests of the inference server: the masks of concurrent clients
+# must be those of the local inference, with the shared batches
+# never larger than max_batch_size.
+#------------------------------------------------------------
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+from honeyseg import RemoteModel, count_honey_pixels, segment_tiles, tile_height, tile_width
+from honeyseg.server import create_server
+
+max_batch_size = 3
+
+
+#------------------------------------------------------------
+# Class with a model that keeps the size of every batch it
+# predicts
+#------------------------------------------------------------
+class RecordingModel:
+  def __init__(self, model):
+    self.model = model
+    self.batch_sizes = []
+
+  def predict(self, inputs, batch_size=None, verbose=0):
+    self.batch_sizes.append(len(inputs))
+    return self.model.predict(inputs)
+
+
+#------------------------------------------------------------
+# Class with a client that counts the requests it sends
+#------------------------------------------------------------
+class CountingRemoteModel(RemoteModel):
+  requests = 0
+  lock = threading.Lock()
+
+  def predict(self, inputs, batch_size=None, verbose=0):
+    with self.lock:
+      CountingRemoteModel.requests += 1
+    return super().predict(inputs)
+
+
+@pytest.fixture
+def server(model):
+  server = create_server(RecordingModel(model), port=0, max_batch_size=max_batch_size, max_latency=0.05)
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  yield server
+
+  server.shutdown()
+  server.server_close()
+  server.batcher.close()
+
+
+def url(server):
+  return "http://{}:{}".format(*server.server_address[:2])
+
+
+def post(server, path, body):
+  request = urllib.request.Request(url(server) + path, data=body)
+  with urllib.request.urlopen(request, timeout=60) as response:
+    return response.read()
+
+
+def test_concurrent_clients_get_the_local_masks(server, model, synthetic_image):
+  images = [synthetic_image(1000, 1300, seed) for seed in range(4)]
+
+  def segment(img):
+    return segment_tiles(img, CountingRemoteModel(url(server)), tile_height, tile_width, batch_size=4)
+
+  with ThreadPoolExecutor(len(images)) as executor:
+    masks = list(executor.map(segment, images))
+
+  for img, mask in zip(images, masks):
+    np.testing.assert_array_equal(mask, segment_tiles(img, model, tile_height, tile_width))
+
+  batchSizes = server.batcher.model.batch_sizes
+  assert max(batchSizes) <= max_batch_size
+  assert sum(batchSizes) == server.batcher.tiles
+  assert RemoteModel(url(server)).info()["requests"] == CountingRemoteModel.requests
+
+
+def test_area_only_returns_the_local_count(server, model, synthetic_image):
+  img = synthetic_image()
+  body = cv2.imencode(".png", cv2.cvtColor(img, cv2.COLOR_RGB2BGR))[1].tobytes()
+
+  result = json.loads(post(server, "/segment?area_only=1", body))
+
+  assert result["honey_pixels"] == count_honey_pixels(img, model, tile_height, tile_width)
+  assert (result["width"], result["height"]) == (img.shape[1], img.shape[0])
+
+
+@pytest.mark.parametrize("overlap", ["1", "-0.5", "1.5"])
+def test_invalid_overlap_is_rejected(server, synthetic_image, overlap):
+  body = cv2.imencode(".png", synthetic_image(700, 700))[1].tobytes()
+
+  with pytest.raises(urllib.error.HTTPError) as error:
+    post(server, "/segment?overlap=" + overlap, body)
+
+  assert error.value.code == 400
@@ -0,0 +1,40 @@
+#------------------------------------------------------------
+# Tests of the streaming mode: the mask and the highlighted image
+# written band by band must be the ones of the in-memory
+# segmentation.
+#------------------------------------------------------------
+import numpy as np
+import pytest
+
+from honeyseg import segment_tiles, highlight_honey, honey_pixels, tile_height, tile_width
+from honeyseg.streaming import ArrayBandSource, open_band_source, segment_streaming
+
+
+@pytest.mark.parametrize("merge", ["blend", "or"])
+@pytest.mark.parametrize("overlap", [0, 0.25, 0.5])
+def test_streaming_matches_in_memory(tmp_path, model, synthetic_image, merge, overlap):
+  img = synthetic_image()
+
+  expected = segment_tiles(img, model, tile_height, tile_width, overlap=overlap, merge=merge, batch_size=2)
+
+  maskPath, overlayPath = tmp_path / "mask.npy", tmp_path / "overlay.npy"
+  pixels = segment_streaming(ArrayBandSource(img, "RGB"), model, maskPath, overlayPath, overlap=overlap, merge=merge, batch_size=2)
+
+  np.testing.assert_array_equal(np.load(maskPath), expected)
+  np.testing.assert_array_equal(np.load(overlayPath), highlight_honey(img, expected, "RGB"))
+  assert pixels == honey_pixels(expected)
+
+
+def test_streaming_from_npy_file(tmp_path, model, synthetic_image):
+  img = synthetic_image(1300, 900, seed=1)
+  np.save(tmp_path / "image.npy", img)
+
+  source = open_band_source(tmp_path / "image.npy")
+  try:
+    pixels = segment_streaming(source, model, tmp_path / "mask.npy")
+  finally:
+    source.close()
+
+  expected = segment_tiles(img, model, tile_height, tile_width)
+  np.testing.assert_array_equal(np.load(tmp_path / "mask.npy"), expected)
+  assert pixels == honey_pixels(expected)
@@ -0,0 +1,53 @@
+#------------------------------------------------------------
+# Tests of the tiling engine: the "or" merge against the original
+# per-tile segmentation of the application (tiles overlapping by
+# 50%, thresholded and merged with bitwise or), the points where
+# the tiles start and the checks of the overlap.
+#------------------------------------------------------------
+import numpy as np
+import pytest
+
+from honeyseg.core import segment_tiles, start_points, tile_points, tile_height, tile_width
+
+
+# original segmentation: every tile is predicted alone, thresholded at 0.5 and merged with or
+def baseline_segmentation(img, model, overlap=0.5):
+  mask = np.zeros(img.shape[:2], dtype=np.uint8)
+  for i, j in tile_points(img.shape[0], img.shape[1], tile_height, tile_width, overlap):
+    tile = img[i:i+tile_height, j:j+tile_width].astype(np.float32) / 255.0
+    prediction = (model.predict(tile[np.newaxis], verbose=0) > 0.5).astype(np.uint8)[0, :, :, 0] * 255
+    mask[i:i+tile_height, j:j+tile_width] = np.bitwise_or(mask[i:i+tile_height, j:j+tile_width], prediction)
+  return mask
+
+
+def test_or_merge_matches_baseline(model, synthetic_image):
+  img = synthetic_image()
+
+  mask = segment_tiles(img, model, tile_height, tile_width, overlap=0.5, merge="or", batch_size=3)
+
+  np.testing.assert_array_equal(np.atleast_3d(mask)[:, :, 0] > 0, baseline_segmentation(img, model) > 0)
+
+
+def test_blend_keeps_the_prediction_of_single_tiles(model, synthetic_image):
+  img = synthetic_image(1280, 1920) # the tiles do not overlap at all
+
+  blended = segment_tiles(img, model, tile_height, tile_width, overlap=0, merge="blend")
+  merged = segment_tiles(img, model, tile_height, tile_width, overlap=0, merge="or")
+
+  np.testing.assert_array_equal(blended, merged)
+
+
+def test_start_points_cover_the_image():
+  for overlap in (0, 0.25, 0.5, 0.9):
+    points = start_points(2000, 640, overlap)
+    assert points[0] == 0 and points[-1] == 2000 - 640
+    assert all(b - a <= 640 for a, b in zip(points, points[1:]))
+
+
+@pytest.mark.parametrize("overlap", [1.0, 1.5, -0.5])
+def test_invalid_overlap_is_rejected(model, synthetic_image, overlap):
+  with pytest.raises(ValueError):
+    start_points(2000, 640, overlap)
+
+  with pytest.raises(ValueError):
+    segment_tiles(synthetic_image(700, 700), model, tile_height, tile_width, overlap=overlap)
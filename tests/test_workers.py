@@ -0,0 +1,41 @@
+#------------------------------------------------------------
+# Tests of the worker pool: its predictions must be those of the
+# model and a model that can not be loaded must raise an error
+# instead of hanging the pool.
+#------------------------------------------------------------
+import numpy as np
+import pytest
+
+from honeyseg.standin import StandInModel
+from honeyseg.workers import WorkerPool, autotune_workers
+
+
+def failing_factory():
+  raise RuntimeError("the model could not be loaded")
+
+
+def test_pool_predicts_as_the_model():
+  inputs = np.random.default_rng(0).integers(0, 256, (4, 8, 8, 3)).astype(np.float32) / 255.0
+
+  with WorkerPool(None, 2, threads=1, factory=StandInModel) as pool:
+    predictions = pool.predict(inputs)
+
+  np.testing.assert_allclose(predictions, StandInModel().predict(inputs), rtol=1e-5)
+
+
+def test_load_error_is_raised_by_predict():
+  inputs = np.zeros((2, 8, 8, 3), dtype=np.float32)
+
+  with WorkerPool(None, 2, threads=1, factory=failing_factory) as pool:
+    with pytest.raises(RuntimeError, match="could not be loaded"):
+      pool.predict(inputs)
+
+
+def test_autotune_keeps_a_pool_of_the_fastest_split():
+  best, results = autotune_workers(None, cores=2, tiles=4, factory=StandInModel, tile=(32, 48, 3), keep_pool=True)
+
+  with best["pool"] as pool:
+    assert [result["processes"] for result in results] == [1, 2]
+    assert pool.processes == best["processes"]
+    assert pool.tile == (32, 48, 3)
+    assert pool.predict(np.zeros((2, 32, 48, 3), dtype=np.float32)).shape == (2, 32, 48, 1)